@@ -1,5 +1,14 @@
-import io
-import sys
+import os
+import heapq
+
+from argparse import ArgumentParser
+from collections import Counter
+from multiprocessing import Pool
+
+# Bytes read from a file at a time.
+CHUNK_SIZE = 1 << 20
+# Bytes of a file counted by one task of compute_files_frequencies.
+RANGE_SIZE = 64 << 20
 
 VALID_CHARS = set(
         'abcdefghijklmnopqrstuvwxyz'
@@ -7,27 +16,108 @@ VALID_CHARS = set(
         '0123456789'
     )
 
+# Byte translation table for ASCII text: letters are lowercased, digits kept and
+# every other byte becomes a space, so splitting on whitespace yields tokens.
+TOKEN_TABLE = bytes(
+    byte if chr(byte) in VALID_CHARS else ord(' ') for byte in range(256)).lower()
+
 # Time Complexity: O(n)
 # Where n is the number of characters in the document.
 #
-# In the while loop the whole document is read character by character, O(n).
-# All the operations in the while loop are time constant O(1) in average.
-# Therefore, the time complexity is linear O(n * 1) = O(n)
+# Encoding, translating, decoding and splitting each go over the document once,
+# O(n). Non-ASCII characters are encoded as '?', which is not a valid character
+# and therefore separates tokens exactly like any other invalid character.
+# All four steps run in C instead of one interpreter step per character.
 def tokenize(text):
-    tokens = []
-    new_token = ''
-    for character in text:
-        if character in VALID_CHARS:
-            new_token += character
-        else:
-            if new_token:
-                new_token = new_token.lower()
-                tokens.append(new_token)
-                new_token = ''
-    if new_token:
-        new_token = new_token.lower()
-        tokens.append(new_token)
-    return tokens
+    return text.encode('ascii', 'replace').translate(TOKEN_TABLE).decode('ascii').split()
+
+# Time Complexity: O(n)
+# Where n is the total number of characters in all the chunks.
+#
+# Same tokens as tokenize(''.join(chunks)), yielded chunk by chunk. A token
+# that runs up to the end of a chunk may continue in the next one, so it is
+# carried over instead of yielded.
+def iter_tokens(chunks):
+    carry = ''
+    for chunk in chunks:
+        chunk = carry + chunk
+        tokens = tokenize(chunk)
+        carry = tokens.pop() if tokens and chunk[-1] in VALID_CHARS else ''
+        yield from tokens
+    if carry:
+        yield carry
+
+# Time Complexity: O(n)
+# Where n is the number of bytes between start and end.
+#
+# Same tokens as tokenize() on the decoded file, as ASCII bytes, read chunkSize
+# bytes at a time so memory does not grow with the file. Tokens are ASCII and
+# every byte of a multi-byte UTF-8 character is above 127, so the bytes can be
+# translated directly, without decoding, and a chunk boundary never splits a
+# character into valid bytes. Only the tokens that start in [start, end) are
+# yielded: one running across start belongs to the previous range, and one
+# running across end is read to its end, so ranges of a file split anywhere
+# yield every token exactly once.
+def iter_file_tokens(path, start=0, end=None, chunkSize=CHUNK_SIZE):
+    for tokens in iter_token_lists(path, start, end, chunkSize):
+        yield from tokens
+
+# Time Complexity: O(n)
+# Where n is the number of bytes between start and end.
+#
+# The tokens of iter_file_tokens, one list per chunk, for callers that count
+# or collect them without a generator step per token.
+def iter_token_lists(path, start=0, end=None, chunkSize=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        skip = False
+        if start:
+            f.seek(start - 1)
+            skip = f.read(1).translate(TOKEN_TABLE) != b' '
+        remaining = -1 if end is None else end - start
+        carry = b''
+        while remaining:
+            chunk = f.read(chunkSize if remaining < 0 else min(chunkSize, remaining))
+            if not chunk:
+                break
+            if remaining > 0:
+                remaining -= len(chunk)
+            chunk = carry + chunk.translate(TOKEN_TABLE)
+            if skip:
+                space = chunk.find(b' ')
+                if space == -1:
+                    carry = b''
+                    continue
+                chunk = chunk[space:]
+                skip = False
+            tokens = chunk.split()
+            carry = tokens.pop() if tokens and chunk[-1] != 32 else b''
+            yield tokens
+        while carry:
+            chunk = f.read(4096).translate(TOKEN_TABLE)
+            space = chunk.find(b' ')
+            carry += chunk if space == -1 else chunk[:space]
+            if space != -1 or not chunk:
+                break
+        if carry:
+            yield [carry]
+
+# Time Complexity: O(n)
+# Where n is the total size of the files.
+#
+# Splits every file in ranges of rangeSize bytes, see iter_file_tokens.
+def split_files(paths, rangeSize=RANGE_SIZE):
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, rangeSize):
+            yield path, start, min(start + rangeSize, size)
+
+def _count_range(task):
+    # Map: the byte token frequencies of one range of a file.
+    path, start, end = task
+    counts = Counter()
+    for tokens in iter_token_lists(path, start, end):
+        counts.update(tokens)
+    return counts
 
 # Time Complexity: O(t)
 # Where t is the number of tokens in the document
@@ -43,34 +133,66 @@ def computeWordFrequencies(tokens):
 
     return wordFreq
 
-# Time Complexity: O(u log u)
+# Time Complexity: O(n / p)
+# Where n is the total size of the files and p the number of processes.
+#
+# Map-reduce: every range of split_files is counted by one of the processes
+# (all cores when processes is None) and the counts are added up here as they
+# arrive, so only one range per process is read at a time. With processes=1
+# the ranges are counted in this process.
+def compute_files_frequencies(paths, processes=None, rangeSize=RANGE_SIZE):
+    wordFreq = Counter()
+    tasks = split_files(paths, rangeSize)
+    if processes == 1:
+        for task in tasks:
+            wordFreq.update(_count_range(task))
+    else:
+        with Pool(processes) as pool:
+            for counts in pool.imap_unordered(_count_range, tasks):
+                wordFreq.update(counts)
+    return {token.decode('ascii'): count for token, count in wordFreq.items()}
+
+# Time Complexity: O(u log u), or O(u log k) with top=k
 # Where u is the number of unique tokens.
 #
-# For loop iterates through the dict of unique tokens once, O(u).
-# The sorted() function's time complexity is O(u logu).
-# Therefore, the time complexity of the function is O(u + u log u) = O(u log u).
-def printFrequencies(wordFreq):
-    for token, count in sorted(wordFreq.items(), key=lambda item: (-item[1], item[0])):
+# All tokens are sorted by decreasing frequency, then alphabetically. With top
+# only the k first are kept, in a heap of size k, instead of sorting all of
+# them.
+def top_frequencies(wordFreq, top=None):
+    key = lambda item: (-item[1], item[0])
+    if top is None:
+        return sorted(wordFreq.items(), key=key)
+    return heapq.nsmallest(top, wordFreq.items(), key=key)
+
+# Time Complexity: O(u log u), or O(u log k) with top=k
+# Where u is the number of unique tokens.
+#
+# See top_frequencies; printing is O(u), or O(k).
+def printFrequencies(wordFreq, top=None):
+    for token, count in top_frequencies(wordFreq, top):
         print(token + " -> " + str(count))
 
 
 # Time complexity:
 # Average and best case: O(n)
-# Worst case: O(n log n), when the document consists entirely of
+# Worst case: O(n log n), when the documents consist entirely of
 # different one-character unique tokens (e.g., "a b c d e f g h...")
 #
-# The time complexity is O(n + t + u log u), where n is the number of characters
-# in the document, t the number of tokens, and u the number of unique tokens.
-# In average n >> t > u, therefore, O(n + t + u log u) ≈ O(n)
+# The time complexity is O(n + u log u), where n is the number of characters
+# in the documents and u the number of unique tokens (O(n + u log k) with
+# --top k). In average n >> u, therefore, O(n + u log u) ≈ O(n). The files are
+# streamed, and counted in parallel by --processes processes.
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python PartA.py <filename>")
-        sys.exit(1)
-
-    file = sys.argv[1]
-    tokens = tokenize(file)
-    wordFreq = computeWordFrequencies(tokens)
-    printFrequencies(wordFreq)
+    parser = ArgumentParser(description="Word frequencies of text files.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="processes counting the files (default: all cores)")
+    parser.add_argument("--top", type=int, default=None,
+                        help="only print the TOP most frequent tokens")
+    args = parser.parse_args()
+
+    wordFreq = compute_files_frequencies(args.files, args.processes)
+    printFrequencies(wordFreq, args.top)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,34 +1,116 @@
-from PartA import tokenize, computeWordFrequencies
-import sys
+from PartA import iter_token_lists
+import os
+import zlib
+import shutil
+import tempfile
+
+from argparse import ArgumentParser
+
+# Estimated bytes of memory taken by one token held in a set.
+TOKEN_BYTES = 100
 
 # Time complexity: O(n1 + n2), where n1 is the number of characters of file1
 # and n2 is the number of character of file2.
 #
-# O(n1 + n2 + t1), n1 >> t1 in average. Then, time complexity is linear with respect
-# to number of characters in the files => O(n1 + n2).
+# Both files are streamed (see PartA.iter_file_tokens) and only the unique
+# tokens of file1 are held in memory, O(t1) where t1 is the number of unique
+# tokens in file1. The tokens of file2 are checked against them a chunk at a
+# time as they are read, so file2 only needs as much memory as the
+# intersection.
 def fileTokensIntersection(file1, file2):
-    tokens1 = computeWordFrequencies(tokenize(file1))  # O(n1)
-    tokens2 = computeWordFrequencies(tokenize(file2))  # O(n2)
+    tokens1 = set()
+    for tokens in iter_token_lists(file1):             # O(n1)
+        tokens1.update(tokens)
+
+    intersection = set()
+    for tokens in iter_token_lists(file2):             # O(n2)
+        intersection.update(tokens1.intersection(tokens))
+
+    return [token.decode('ascii') for token in intersection]
+
+
+# Time complexity: O(n)
+# Where n is the number of characters of the file.
+#
+# Writes the unique tokens of path to the partition files given by a hash of
+# the token. Tokens are deduplicated in a set that is written out and cleared
+# every `memory` bytes worth of tokens, so a token can be written more than once.
+def _partitionTokens(path, outputs, memory):
+    limit = max(memory // TOKEN_BYTES, 1)
+    tokens = set()
+    for chunk in iter_token_lists(path):
+        tokens.update(chunk)
+        if len(tokens) >= limit:
+            _spillTokens(tokens, outputs)
+    _spillTokens(tokens, outputs)
 
-    intersection = []
-    for token in tokens1:                              # O(t1), t1 is the number of unique tokens in file1
-        if token in tokens2:                           # O(1)
-            intersection.append(token)
 
-    return intersection
+def _spillTokens(tokens, outputs):
+    lines = [list() for _ in outputs]
+    for token in tokens:
+        lines[zlib.crc32(token) % len(outputs)].append(token + b'\n')
+    for output, partition in zip(outputs, lines):
+        output.write(b''.join(partition))
+    tokens.clear()
+
+
+# Time complexity: O(n1 + n2), where n1 is the number of characters of file1
+# and n2 is the number of character of file2.
+#
+# Same tokens as fileTokensIntersection, for vocabularies that do not fit in
+# memory. The unique tokens of both files are split by a hash of the token
+# into partitions of about `memory` bytes of the smaller file each, written to
+# temporary files in workDir, and intersected one partition at a time: only
+# the tokens of one partition of the smaller file are held in memory while
+# the same partition of the other file is streamed. Tokens are yielded as
+# each partition is done.
+def iterTokensIntersection(file1, file2, memory, workDir=None):
+    if os.path.getsize(file2) < os.path.getsize(file1):
+        file1, file2 = file2, file1
+    partitions = max(-(-os.path.getsize(file1) // memory), 1)
+    workDir = tempfile.mkdtemp(prefix="intersection.", dir=workDir)
+    try:
+        for name, path in (("tokens1", file1), ("tokens2", file2)):
+            outputs = [open(os.path.join(workDir, f"{name}.{p}"), "wb")
+                       for p in range(partitions)]
+            try:
+                _partitionTokens(path, outputs, memory)
+            finally:
+                for output in outputs:
+                    output.close()
+
+        for p in range(partitions):
+            with open(os.path.join(workDir, f"tokens1.{p}"), "rb") as f:
+                tokens1 = set(f)
+            with open(os.path.join(workDir, f"tokens2.{p}"), "rb") as f:
+                for line in f:
+                    if line in tokens1:
+                        # Yielded once, even if written by several spills.
+                        tokens1.discard(line)
+                        yield line[:-1].decode('ascii')
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
 
 
 # Time complexity: O(n1 + n2), where n1 is the number of characters of file1
 # and n2 is the number of character of file2.
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python PartB.py <file1> <file2>")
-        sys.exit(1)
+    parser = ArgumentParser(description="Number of tokens two text files share.")
+    parser.add_argument("file1")
+    parser.add_argument("file2")
+    parser.add_argument("--memory", type=int, default=None,
+                        help="intersect on disk, holding about MEMORY MB of "
+                             "the smaller file's tokens at a time")
+    args = parser.parse_args()
 
-    files_intersection = fileTokensIntersection(sys.argv[1], sys.argv[2])
-    print(len(files_intersection))
+    if args.memory:
+        files_intersection = iterTokensIntersection(
+            args.file1, args.file2, args.memory * 1024 * 1024)
+        print(sum(1 for _ in files_intersection))
+    else:
+        files_intersection = fileTokensIntersection(args.file1, args.file2)
+        print(len(files_intersection))
 
 
 if __name__ == '__main__':
     main()
-
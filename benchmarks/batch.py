@@ -0,0 +1,145 @@
+''' Word frequencies and vocabulary intersection of a large corpus with the
+PartA/PartB batch tools: wall clock time and peak memory of reading each
+file whole (what PartA.main used to do), of streaming it in one process and
+of the map-reduce over --processes processes, plus the top --top words with
+a heap against a sort of all unique words, and PartB's intersection in
+memory against on disk with --memory MB.
+
+The corpus is --files synthetic files of --mb MB in total, with Zipf-like
+word frequencies over a --vocabulary word vocabulary and some non-ASCII
+text, written to a temporary directory. Every measurement runs in a fresh
+process, whose peak resident set size (with its own children) is reported.
+
+Usage: python -m benchmarks.batch [--mb 200] [--files 4] [--vocabulary 500000]
+           [--processes 4] [--top 50] [--memory 16]
+'''
+import os
+import time
+import shutil
+import random
+import resource
+import tempfile
+import multiprocessing
+
+from argparse import ArgumentParser
+
+import PartA
+import PartB
+
+
+def write_corpus(work_dir, mb, files, vocabulary, rng):
+    words = [f"w{i:x}" for i in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    paths = list()
+    for i in range(files):
+        path = os.path.join(work_dir, f"corpus.{i}.txt")
+        size = 0
+        with open(path, "w", encoding="utf-8") as f:
+            while size < mb * 1e6 / files:
+                line = " ".join(rng.choices(words, weights, k=20000)) + " café —\n"
+                size += f.write(line)
+        paths.append(path)
+    return paths
+
+
+def whole_files(paths, top):
+    wordFreq = dict()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for token, count in PartA.computeWordFrequencies(PartA.tokenize(f.read())).items():
+                wordFreq[token] = wordFreq.get(token, 0) + count
+    return sorted(wordFreq.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+
+def streamed(paths, top, processes):
+    return PartA.top_frequencies(PartA.compute_files_frequencies(paths, processes), top)
+
+
+def sort_all(paths, top):
+    wordFreq = PartA.compute_files_frequencies(paths, 1)
+    start = time.perf_counter()
+    result = PartA.top_frequencies(wordFreq)[:top]
+    return result, time.perf_counter() - start
+
+
+def heap_top(paths, top):
+    wordFreq = PartA.compute_files_frequencies(paths, 1)
+    start = time.perf_counter()
+    result = PartA.top_frequencies(wordFreq, top)
+    return result, time.perf_counter() - start
+
+
+def in_memory(file1, file2):
+    return sorted(PartB.fileTokensIntersection(file1, file2))
+
+
+def on_disk(file1, file2, memory):
+    return sorted(PartB.iterTokensIntersection(file1, file2, memory * 1024 * 1024))
+
+
+def _measure(queue, function, args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    queue.put((result, elapsed, rss * 1024))
+
+
+def measure(function, *args):
+    # Spawned, not forked, so that the corpus generation does not count.
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(queue, function, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="batch-benchmark.")
+    try:
+        paths = write_corpus(work_dir, args.mb, args.files, args.vocabulary,
+                             random.Random(0))
+        print(f"{args.mb} MB in {args.files} files")
+        expected = None
+        for name, function, function_args in (
+                ("whole files", whole_files, (paths, args.top)),
+                ("streamed", streamed, (paths, args.top, 1)),
+                (f"map-reduce x{args.processes}", streamed,
+                 (paths, args.top, args.processes))):
+            result, elapsed, rss = measure(function, *function_args)
+            expected = expected or result
+            assert result == expected, name
+            print(f"{name:>16}: {elapsed:6.2f}s {args.mb / elapsed:6.1f} MB/s, "
+                  f"{rss / 2 ** 20:6.0f} MiB peak")
+
+        for name, function in (("sort all", sort_all), (f"heap top {args.top}", heap_top)):
+            (result, elapsed), _, _ = measure(function, paths, args.top)
+            assert result == expected, name
+            print(f"{name:>16}: {elapsed * 1000:8.1f} ms")
+
+        file1, file2 = paths[0], paths[-1]
+        expected = None
+        for name, function, function_args in (
+                ("in memory", in_memory, (file1, file2)),
+                (f"on disk {args.memory} MB", on_disk, (file1, file2, args.memory))):
+            result, elapsed, rss = measure(function, *function_args)
+            expected = expected or result
+            assert result == expected, name
+            print(f"{name:>16}: {elapsed:6.2f}s, {len(result)} shared tokens, "
+                  f"{rss / 2 ** 20:6.0f} MiB peak")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--mb", type=int, default=200)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--vocabulary", type=int, default=500000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--memory", type=int, default=16)
+    main(parser.parse_args())
@@ -0,0 +1,57 @@
+''' Memory per million urls and lookup throughput of the frontier's Bloom
+filter, against looking every url up in the shelve save file. How much the
+filter saves depends on the dbm behind shelve: dbm.dumb keeps its index in a
+dict, dbm.gnu and dbm.ndbm go to disk for every lookup.
+
+Usage: python -m benchmarks.bloom [urls]
+'''
+import os
+import sys
+import dbm
+import time
+import shelve
+import tempfile
+
+from utils import get_urlhash
+from utils.bloom import ScalableBloomFilter
+
+ERROR_RATES = (0.01, 0.001, 0.0001)
+
+
+def lookups_per_second(contains, hashes):
+    start = time.perf_counter()
+    for urlhash in hashes:
+        contains(urlhash)
+    return len(hashes) / (time.perf_counter() - start)
+
+
+def main(count):
+    seen = [get_urlhash(f"https://www.ics.uci.edu/page/{i}") for i in range(count)]
+    new = [get_urlhash(f"https://www.cs.uci.edu/other/{i}") for i in range(count)]
+    lookups = 20000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save = shelve.open(os.path.join(tmp, "frontier.shelve"))
+        for urlhash in seen:
+            save[urlhash] = ("", True)
+        save.sync()
+        backend = dbm.whichdb(os.path.join(tmp, "frontier.shelve"))
+        shelve_seen = lookups_per_second(save.__contains__, seen[:lookups])
+        shelve_new = lookups_per_second(save.__contains__, new[:lookups])
+        save.close()
+    print(f"shelve on {backend} ({count} urls): {shelve_seen:,.0f} seen/s, {shelve_new:,.0f} new/s")
+
+    for error_rate in ERROR_RATES:
+        bloom = ScalableBloomFilter(initial_capacity=count, error_rate=error_rate)
+        for urlhash in seen:
+            bloom.add(urlhash)
+        false_positives = sum(urlhash in bloom for urlhash in new) / count
+        bloom_new = lookups_per_second(bloom.__contains__, new[:lookups])
+        bloom_seen = lookups_per_second(bloom.__contains__, seen[:lookups])
+        print(f"bloom p={error_rate}: {bloom.memory() / count * 1e6 / 2 ** 20:.2f} MiB per "
+              f"million urls, measured p={false_positives:.5f}, "
+              f"{bloom_new:,.0f} new/s, {bloom_seen:,.0f} seen/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
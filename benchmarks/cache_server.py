@@ -0,0 +1,246 @@
+''' Local stand-in for the spacetime cache server, for measuring the crawler
+without the real one. It answers GET /?q=<url>&u=<user agent> like the
+cache server does (see utils/download): a CBOR map with the url, the status
+and the pickled requests.Response of the page.
+
+Pages come from a recorded link graph ({"url": ..., "links": [...]} lines,
+see LINK_GRAPH_FILE in scraper.py) or from a synthetic site of --hosts hosts
+of --pages pages each. Synthetic pages have --words words and --links links
+to pages of the same host, some pages link to other hosts, a share of
+--duplicates pages repeat their host's front page, and each of the --traps
+trap hosts is an endless chain of near identical calendar pages. With
+--robots every synthetic host has a robots.txt disallowing /page/1 (pages
+1, 10-19 and 100-199) and a sitemap of its first 50 pages with their
+lastmod; without it robots.txt and sitemaps are not found. At a --revision
+above 0, a --changes share of the synthetic pages that are neither front
+pages nor duplicates have new words (their links stay the same), as if the
+site had been edited since revision 0. Pages carry an ETag. Every response
+is delayed --latency seconds, plus up to --jitter.
+
+Usage: python -m benchmarks.cache_server [--port 8765] [--graph graph.jsonl]
+           [--hosts 20] [--pages 200] [--links 10] [--words 400]
+           [--duplicates 0.1] [--traps 2] [--robots] [--revision 0]
+           [--changes 0.3] [--latency 0.02] [--jitter 0.01]
+'''
+import sys
+import json
+import time
+import zlib
+import random
+import pickle
+
+from argparse import ArgumentParser
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cbor
+import requests
+
+# Pages mix common words, with Zipf-like frequencies as in real text, and
+# topic words drawn evenly from a larger vocabulary, so that different pages
+# are not near duplicates of each other.
+COMMON_WORDS = [f"word{i}" for i in range(2000)]
+CUMULATIVE_WEIGHTS = list()
+for rank in range(len(COMMON_WORDS)):
+    CUMULATIVE_WEIGHTS.append(1 / (rank + 1) + (CUMULATIVE_WEIGHTS[-1] if CUMULATIVE_WEIGHTS else 0))
+TOPIC_WORDS = [f"topic{i}" for i in range(50000)]
+TOPIC_SHARE = 0.7
+
+
+def host_name(i):
+    return f"host{i}.ics.uci.edu"
+
+
+def trap_name(i):
+    return f"events{i}.ics.uci.edu"
+
+
+class SyntheticSite(object):
+    ''' Pages are derived from their url alone, so nothing is stored. '''
+    def __init__(self, hosts, pages, links, words, duplicates, traps, robots=False,
+                 revision=0, changes=0.3):
+        self.hosts = hosts
+        self.pages = pages
+        self.links = links
+        self.words = words
+        self.duplicates = duplicates
+        self.traps = traps
+        self.robots = robots
+        self.revision = revision
+        self.changes = changes
+
+    def seeds(self):
+        return [f"http://{host_name(0)}/"]
+
+    def document(self, url):
+        ''' Returns the robots.txt or sitemap at url, None for pages. '''
+        parsed = urlparse(url)
+        if not self.robots or not parsed.netloc.startswith("host"):
+            return None
+        root = f"{parsed.scheme}://{parsed.netloc}"
+        if parsed.path == "/robots.txt":
+            return (f"User-agent: *\nDisallow: /page/1\n"
+                    f"Sitemap: {root}/sitemap.xml\n").encode("utf-8")
+        if parsed.path == "/sitemap.xml":
+            entries = "".join(
+                f"<url><loc>{root}/page/{k}</loc>"
+                f"<lastmod>2024-01-{k % 28 + 1:02d}</lastmod></url>"
+                for k in range(min(self.pages, 50)))
+            return (f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns='
+                    f'"http://www.sitemaps.org/schemas/sitemap/0.9">{entries}'
+                    f'</urlset>').encode("utf-8")
+        return None
+
+    def page(self, url):
+        ''' Returns (status, words seed, links) of url. '''
+        parsed = urlparse(url)
+        rng = random.Random(zlib.crc32(url.encode("utf-8")))
+        last = parsed.path.rstrip("/").rsplit("/", 1)[-1]
+        if parsed.netloc.startswith("events"):
+            if not last.isdigit():
+                return 200, parsed.netloc, ["/cal/1"]
+            day = int(last)
+            # Near duplicates: the same text apart from the day.
+            return 200, parsed.netloc, [f"/cal/{day + 1}", f"/cal/{day + 2}"]
+        host = parsed.netloc.split(".", 1)[0]
+        if not host.startswith("host") or not host[4:].isdigit():
+            return 404, None, []
+        host_id = int(host[4:])
+        if host_id >= self.hosts:
+            return 404, None, []
+        if last.isdigit():
+            k = int(last)
+            if k >= self.pages:
+                return 404, None, []
+        elif parsed.path.strip("/"):
+            return 404, None, []
+        else:
+            k = 0
+        links = [f"/page/{rng.randrange(self.pages)}" for _ in range(self.links)]
+        if k % 10 == 0:
+            # Every tenth page links to the front pages of two other hosts.
+            links += [f"http://{host_name(rng.randrange(self.hosts))}/" for _ in range(2)]
+        if k == 0 and host_id < self.traps:
+            links.append(f"http://{trap_name(host_id)}/")
+        seed = url if k and rng.random() >= self.duplicates else host
+        if seed == url and self.revision and self.changed(url):
+            seed = f"{url}#{self.revision}"
+        return 200, seed, links
+
+    def changed(self, url):
+        # Whether url changed since revision 0, the same for every revision.
+        return zlib.crc32(url.encode("utf-8")) % 1000 < self.changes * 1000
+
+
+class RecordedSite(object):
+    def __init__(self, path, words):
+        self.graph = dict()
+        self.words = words
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                page = json.loads(line)
+                self.graph[page["url"].rstrip("/")] = page["links"]
+
+    def seeds(self):
+        return [next(iter(self.graph))]
+
+    def document(self, url):
+        return None
+
+    def page(self, url):
+        links = self.graph.get(url.rstrip("/"))
+        if links is None:
+            return 404, None, []
+        return 200, url, links
+
+
+def render(seed, word_count, links, url):
+    rng = random.Random(seed)
+    topic_count = int(word_count * TOPIC_SHARE)
+    words = rng.choices(COMMON_WORDS, cum_weights=CUMULATIVE_WEIGHTS, k=word_count - topic_count)
+    words += rng.choices(rng.sample(TOPIC_WORDS, 50), k=topic_count)
+    rng.shuffle(words)
+    if urlparse(url).netloc.startswith("events"):
+        # Calendar pages only differ in their date.
+        words.append(urlparse(url).path.replace("/", " "))
+    paragraphs = [" ".join(words[i:i + 80]) for i in range(0, len(words), 80)]
+    anchors = "".join(f'<li><a href="{link}">{link}</a></li>' for link in links)
+    return (f"<html><head><title>{url}</title></head><body>"
+            + "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+            + f"<ul>{anchors}</ul></body></html>").encode("utf-8")
+
+
+def envelope(url, status, body):
+    response = requests.models.Response()
+    response.status_code = status
+    response.url = url
+    response._content = body
+    response.headers["Content-Type"] = "text/html; charset=utf-8"
+    response.headers["ETag"] = f'"{zlib.crc32(body):08x}"'
+    return cbor.dumps({"url": url, "status": status, "response": pickle.dumps(response)})
+
+
+def make_handler(site, latency, jitter):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            url = query.get("q", [""])[0]
+            body = site.document(url)
+            if body is not None:
+                data = envelope(url, 200, body)
+            else:
+                status, seed, links = site.page(url)
+                body = render(seed, site.words, links, url) if status == 200 else b"Not Found"
+                data = envelope(url, status, body)
+            time.sleep(latency + random.random() * jitter)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def make_site(args):
+    if args.graph:
+        return RecordedSite(args.graph, args.words)
+    return SyntheticSite(
+        args.hosts, args.pages, args.links, args.words, args.duplicates, args.traps,
+        args.robots, args.revision, args.changes)
+
+
+def add_site_arguments(parser):
+    parser.add_argument("--graph", type=str, default=None)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links", type=int, default=10)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    parser.add_argument("--traps", type=int, default=2)
+    parser.add_argument("--robots", action="store_true", default=False)
+    parser.add_argument("--revision", type=int, default=0)
+    parser.add_argument("--changes", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+
+
+def main(args):
+    site = make_site(args)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port), make_handler(site, args.latency, args.jitter))
+    server.daemon_threads = True
+    print(f"Serving on 127.0.0.1:{args.port}, seeds: {','.join(site.seeds())}")
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    add_site_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,249 @@
+''' End to end crawler throughput against the local cache server in
+benchmarks/cache_server.py, which is started on a free port with the given
+site options (see its docstring).
+
+The crawl runs in a temporary directory with config.ini, POLITENESS set to
+--politeness and the seeds of the site. Reports pages per second, p50/p99
+download latency, CPU time per page split by stage and memory growth.
+Stages are timed with the CPU clock of the thread running them, so the
+split is only complete for the threads engine; with --engine async downloads
+are not split out of "other" and parsing runs in other processes, shown as
+"parse processes". --metrics also enables the crawler's own instrumentation
+(utils/metrics.py) and prints its wall clock stage times and lock contention.
+
+Usage: python -m benchmarks.crawl [--engine threads|async] [--threads 4]
+           [--politeness 0.05] [--metrics] [--verbose] [cache server site options]
+'''
+import os
+import sys
+import time
+import shutil
+import socket
+import logging
+import resource
+import tempfile
+import subprocess
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from contextlib import redirect_stdout
+from threading import Thread, Lock, Event
+
+from benchmarks.cache_server import add_site_arguments, make_site
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StageTimer(object):
+    ''' CPU seconds and calls per stage, from wrapped functions. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.cpu = dict()
+        self.calls = dict()
+        self.wall = list()
+
+    def wrap(self, module, name, stage, record_wall=False):
+        function = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            start_cpu = time.thread_time()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                cpu = time.thread_time() - start_cpu
+                with self.lock:
+                    self.cpu[stage] = self.cpu.get(stage, 0) + cpu
+                    self.calls[stage] = self.calls.get(stage, 0) + 1
+                    if record_wall:
+                        self.wall.append(elapsed)
+
+        setattr(module, name, timed)
+
+    def wrap_async(self, module, name, stage):
+        # Other coroutines run while this one waits, so only count calls and
+        # wall time.
+        function = getattr(module, name)
+
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.calls[stage] = self.calls.get(stage, 0) + 1
+                    self.wall.append(elapsed)
+
+        setattr(module, name, timed)
+
+
+class MemorySampler(Thread):
+    ''' Resident set size of this process every `interval` seconds. '''
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = [rss()]
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.samples.append(rss())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.samples.append(rss())
+
+
+def rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current size, but still shows growth.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port):
+    command = [sys.executable, "-m", "benchmarks.cache_server", "--port", str(port)]
+    for name in ("graph", "hosts", "pages", "links", "words", "duplicates",
+                 "traps", "revision", "changes", "latency", "jitter"):
+        value = getattr(args, name)
+        if value is not None:
+            command += [f"--{name}", str(value)]
+    if args.robots:
+        command.append("--robots")
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The cache server did not start.")
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def make_config(args, port, seeds):
+    from utils.config import Config
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(seeds)
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    cparser["LOCAL PROPERTIES"]["SAVE"] = "frontier.shelve"
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(args.threads)
+    cparser["LOCAL PROPERTIES"]["METRICS"] = str(args.metrics).lower()
+    cparser["LOCAL PROPERTIES"]["METRICSPORT"] = "0"
+    cparser["LOCAL PROPERTIES"]["METRICSINTERVAL"] = "0"
+    config = Config(cparser)
+    config.cache_server = ("127.0.0.1", port)
+    return config
+
+
+def crawl(args, port, seeds):
+    # scraper reads stopwords.txt and its stats files from the working
+    # directory when it is imported, so import the crawler from here on.
+    import scraper
+    import crawler.worker
+    from crawler import Crawler
+    from crawler.frontier import Frontier
+
+    timer = StageTimer()
+    timer.wrap(crawler.worker, "download", "download", record_wall=True)
+    timer.wrap(scraper, "parse_page", "parse")
+    timer.wrap(scraper, "tokenize", "tokenize")
+    timer.wrap(scraper, "simhash", "simhash")
+    timer.wrap(scraper, "is_valid", "is_valid")
+    timer.wrap(scraper.stats, "add_page", "stats")
+    for name in ("get_tbd_url", "add_url", "report_fetch", "mark_url_complete"):
+        timer.wrap(Frontier, name, "frontier")
+
+    worker_factory = crawler.worker.Worker
+    if args.engine == "async":
+        import crawler.async_worker
+        timer.wrap_async(crawler.async_worker, "download_async", "download")
+        worker_factory = crawler.async_worker.AsyncWorker
+
+    config = make_config(args, port, seeds)
+    memory = MemorySampler()
+    memory.start()
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        Crawler(config, True, worker_factory=worker_factory).start()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    memory.stop()
+    return timer, memory, elapsed, cpu, len(scraper.stats.pages)
+
+
+def report(timer, memory, elapsed, cpu, unique_pages, engine):
+    fetched = timer.calls.get("download", 0)
+    print(f"{fetched} pages fetched ({unique_pages} unique) in {elapsed:.1f}s: "
+          f"{fetched / elapsed:.1f} pages/s")
+    print(f"download latency: p50 {percentile(timer.wall, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(timer.wall, 0.99) * 1000:.1f} ms")
+    per_page = 1000 / max(fetched, 1)
+    print(f"CPU per page: {cpu * per_page:.2f} ms")
+    stages = sorted(timer.cpu.items(), key=lambda item: -item[1])
+    for stage, seconds in stages:
+        print(f"  {stage:>16}: {seconds * per_page:7.2f} ms")
+    print(f"  {'other':>16}: {(cpu - sum(timer.cpu.values())) * per_page:7.2f} ms")
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if engine == "async":
+        print(f"  {'parse processes':>16}: "
+              f"{(children.ru_utime + children.ru_stime) * per_page:7.2f} ms")
+    start, peak, end = memory.samples[0], max(memory.samples), memory.samples[-1]
+    print(f"memory: {start / 2 ** 20:.0f} MiB at start, {peak / 2 ** 20:.0f} MiB peak, "
+          f"{end / 2 ** 20:.0f} MiB at the end, "
+          f"{(end - start) / max(fetched, 1) * 1000 / 2 ** 20:.2f} MiB per 1000 pages")
+
+
+def main(args):
+    seeds = make_site(args).seeds()
+    port = free_port()
+    server = start_server(args, port)
+    work_dir = tempfile.mkdtemp(prefix="crawl-benchmark.")
+    cwd = os.getcwd()
+    try:
+        shutil.copy(os.path.join(ROOT, "stopwords.txt"), work_dir)
+        os.chdir(work_dir)
+        sys.path.insert(0, ROOT)
+        if not args.verbose:
+            logging.disable(logging.WARNING)
+        report(*crawl(args, port, seeds), args.engine)
+        if args.metrics:
+            from utils.metrics import metrics
+            print("metrics: " + metrics.summary().replace("; ", "\n  "))
+    finally:
+        os.chdir(cwd)
+        server.kill()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--politeness", type=float, default=0.05)
+    parser.add_argument("--metrics", action="store_true", default=False)
+    parser.add_argument("--verbose", action="store_true", default=False)
+    add_site_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,133 @@
+''' Memory and speed of the scraper's duplicate detection structures.
+
+Exact duplicates: utils.dedup.DigestSet of 64 bit digests, in memory and
+memory-mapped to a file, against the set of SHA-256 hex strings it replaced.
+Near duplicates: SimhashIndex with position chains against the lists of
+fingerprints per block value it had before.
+
+Each structure is built in a process of its own, and its memory is the
+growth of that process' resident set size (including the mapped file's
+pages it touched).
+
+Usage: python -m benchmarks.dedup [size ...]
+'''
+import os
+import sys
+import time
+import random
+import hashlib
+import tempfile
+
+from multiprocessing import Process, Pipe
+
+from utils.dedup import DigestSet, digest64
+from utils.simhash import SimhashIndex, hamming_distance
+
+SIZES = (1000000, 10000000)
+LOOKUPS = 200000
+
+
+class ListSimhashIndex(SimhashIndex):
+    def add(self, fingerprint):
+        for table, (shift, mask) in zip(self.tables, self.ranges):
+            table.setdefault((fingerprint >> shift) & mask, []).append(fingerprint)
+        self.fingerprints.append(fingerprint)
+
+    def query_within(self, fingerprint, k):
+        for table, (shift, mask) in zip(self.tables, self.ranges):
+            for candidate in table.get((fingerprint >> shift) & mask, ()):
+                if hamming_distance(fingerprint, candidate) <= k:
+                    return candidate
+        return None
+
+
+def rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def page_hash(i):
+    return hashlib.sha256(i.to_bytes(8, "little"))
+
+
+def hex_set(size):
+    before = rss()
+    start = time.perf_counter()
+    hashes = set()
+    for i in range(size):
+        hashes.add(page_hash(i).hexdigest())
+    build = time.perf_counter() - start
+    memory = rss() - before
+    hits = [page_hash(i).hexdigest() for i in random.sample(range(size), LOOKUPS)]
+    misses = [page_hash(size + i).hexdigest() for i in range(LOOKUPS)]
+    return build, memory, timed(hashes.__contains__, hits), timed(hashes.__contains__, misses)
+
+
+def digest_set(size, path):
+    before = rss()
+    start = time.perf_counter()
+    hashes = DigestSet(path)
+    for i in range(size):
+        hashes.add(digest64(page_hash(i).digest()))
+    hashes.flush()
+    build = time.perf_counter() - start
+    memory = rss() - before
+    hits = [digest64(page_hash(i).digest()) for i in random.sample(range(size), LOOKUPS)]
+    misses = [digest64(page_hash(size + i).digest()) for i in range(LOOKUPS)]
+    return build, memory, timed(hashes.__contains__, hits), timed(hashes.__contains__, misses)
+
+
+def simhash_index(size, factory):
+    rng = random.Random(0)
+    before = rss()
+    start = time.perf_counter()
+    index = factory()
+    # Fingerprints are created as pages come in, count them too.
+    for _ in range(size):
+        index.add(rng.getrandbits(64))
+    build = time.perf_counter() - start
+    memory = rss() - before
+    queries = [rng.getrandbits(64) for _ in range(LOOKUPS // 100)]
+    hits = [index.fingerprints[i] for i in random.sample(range(size), LOOKUPS // 100)]
+    query = lambda fingerprint: index.query_within(fingerprint, 3)
+    return build, memory, timed(query, hits), timed(query, queries)
+
+
+def timed(lookup, keys):
+    start = time.perf_counter()
+    for key in keys:
+        lookup(key)
+    return (time.perf_counter() - start) / len(keys)
+
+
+def run(function, *args):
+    # In a process of its own, so that memory freed by the previous run does
+    # not hide the growth of this one.
+    receiver, sender = Pipe(False)
+    process = Process(target=lambda: sender.send(function(*args)))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def main(sizes):
+    print(f"{'structure':>28} {'size':>9} {'build s':>8} {'bytes/entry':>12} "
+          f"{'hit us':>7} {'miss us':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            rows = [
+                ("set of hex strings", hex_set, size),
+                ("DigestSet in memory", digest_set, size, None),
+                ("DigestSet on file", digest_set, size, os.path.join(tmp, f"{size}.bin")),
+                ("SimhashIndex, lists", simhash_index, size, ListSimhashIndex),
+                ("SimhashIndex, chains", simhash_index, size, SimhashIndex),
+            ]
+            for name, function, *args in rows:
+                build, memory, hit, miss = run(function, *args)
+                print(f"{name:>28} {size:>9} {build:>8.1f} {memory / size:>12.1f} "
+                      f"{hit * 1e6:>7.2f} {miss * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or SIZES)
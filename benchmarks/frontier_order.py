@@ -0,0 +1,131 @@
+''' Replays a link graph against every frontier priority (crawler/priority.py)
+with a simulated clock, and prints how many fetches and how much crawl time
+each one needs to reach a share of the hosts of the graph.
+
+The graph is a file of {"url": ..., "links": [...]} lines, as recorded by
+setting LINK_GRAPH_FILE in scraper.py; its first url is the seed. Without a
+file a synthetic site is used: a tree of pages per host, hosts linked from
+pages a few levels deep in other hosts, and a few large trap hosts linked
+from the seed.
+
+Usage: python -m benchmarks.frontier_order [graph.jsonl]
+           [--threads 4] [--politeness 0.5] [--fetch-time 0.3]
+'''
+import json
+import time
+import heapq
+import random
+
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+from crawler.priority import HostScheduler, SCORERS, make_scorer
+
+COVERAGE = (0.25, 0.5, 0.75, 0.9, 1.0)
+
+
+def load_graph(path):
+    graph = dict()
+    seeds = list()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            page = json.loads(line)
+            if not seeds:
+                seeds.append(page["url"])
+            graph[page["url"]] = page["links"]
+    return graph, seeds
+
+
+def synthetic_graph(hosts=80, host_pages=200, traps=3, trap_pages=20000,
+                    branching=4, seed=0):
+    rng = random.Random(seed)
+    names = [f"http://host{i}.ics.uci.edu" for i in range(hosts)]
+    sizes = [trap_pages if 1 <= i <= traps else host_pages for i in range(hosts)]
+    graph = dict()
+    paths = [""]
+    for k in range(1, max(sizes)):
+        paths.append(f"{paths[(k - 1) // branching]}/p{k}")
+    for name, size in zip(names, sizes):
+        for k in range(size):
+            children = range(branching * k + 1, min(branching * k + branching + 1, size))
+            graph[f"{name}{paths[k]}"] = (
+                [f"{name}{paths[child]}" for child in children] + [name])
+    for i in range(1, hosts):
+        if i <= traps:
+            parent = names[0]
+        else:
+            j = rng.randrange(traps + 1, i) if i > traps + 1 else 0
+            parent = f"{names[j]}{paths[rng.randrange(5, 100)]}"
+        graph[parent].append(names[i])
+    return graph, [names[0]]
+
+
+def simulate(graph, seeds, priority, threads, politeness, fetch_time):
+    ''' Returns (fetches, time) at which each COVERAGE share of the hosts of
+    the graph had a page fetched. '''
+    scheduler = HostScheduler(make_scorer(priority), lambda domain: politeness)
+    hosts = {urlparse(url).netloc for url in graph}
+    known = set(seeds)
+    for url in seeds:
+        scheduler.push(url)
+    covered = set()
+    milestones = list()
+    in_flight = list()
+    now = 0.0
+    fetches = 0
+    while len(milestones) < len(COVERAGE):
+        while len(in_flight) < threads:
+            url = scheduler.pop(now)
+            if url is None:
+                break
+            fetches += 1
+            heapq.heappush(in_flight, (now + fetch_time, fetches, url))
+            domain = urlparse(url).netloc
+            if domain in hosts and domain not in covered:
+                covered.add(domain)
+                while (len(milestones) < len(COVERAGE) and
+                       len(covered) >= COVERAGE[len(milestones)] * len(hosts)):
+                    milestones.append((fetches, now))
+        events = [t for t in (
+            in_flight[0][0] if in_flight else None,
+            scheduler.ready_at() if len(in_flight) < threads else None)
+            if t is not None]
+        if not events:
+            break
+        now = max(now, min(events))
+        while in_flight and in_flight[0][0] <= now:
+            _, _, url = heapq.heappop(in_flight)
+            for link in graph.get(url, ()):
+                if link in known:
+                    scheduler.rediscover(link, url)
+                else:
+                    known.add(link)
+                    scheduler.push(link, url)
+            scheduler.done(url)
+    return milestones
+
+
+def main(path, threads, politeness, fetch_time):
+    graph, seeds = load_graph(path) if path else synthetic_graph()
+    hosts = len({urlparse(url).netloc for url in graph})
+    print(f"{len(graph)} pages on {hosts} hosts, {threads} threads, "
+          f"politeness {politeness}s, {fetch_time}s per fetch")
+    print("fetches (crawl time) until this share of the hosts was reached:")
+    print(f"{'priority':>10}" + "".join(f"{share:>18.0%}" for share in COVERAGE))
+    for priority in SCORERS:
+        start = time.perf_counter()
+        milestones = simulate(graph, seeds, priority, threads, politeness, fetch_time)
+        cells = [f"{fetches} ({crawl_time:.0f}s)" for fetches, crawl_time in milestones]
+        cells += ["-"] * (len(COVERAGE) - len(cells))
+        print(f"{priority:>10}" + "".join(f"{cell:>18}" for cell in cells)
+              + f"   [{time.perf_counter() - start:.1f}s]")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("graph", nargs="?", default=None)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--politeness", type=float, default=0.5)
+    parser.add_argument("--fetch-time", type=float, default=0.3)
+    args = parser.parse_args()
+    main(args.graph, args.threads, args.politeness, args.fetch_time)
@@ -0,0 +1,100 @@
+''' Time from creating the frontier of a resumed crawl until its first url
+can be fetched, and until its save file is fully loaded, with the pending
+log (fast restart) and without it (the whole save file is read and every
+pending url checked by is_valid again).
+
+The save file holds --urls urls, a --pending share of them not downloaded
+yet, spread over --hosts hosts. It is built once in a temporary directory
+for each --store.
+
+Usage: python -m benchmarks.frontier_restart [--urls 1000000]
+           [--pending 0.05] [--hosts 200] [--store log|shelve]
+'''
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_config(store):
+    from utils.config import Config
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    cparser["CRAWLER"]["SEEDURL"] = "https://www.ics.uci.edu"
+    cparser["LOCAL PROPERTIES"]["SAVE"] = "frontier.save"
+    cparser["LOCAL PROPERTIES"]["STORE"] = store
+    # There is no cache server to fetch robots.txt from.
+    cparser["CRAWLER"]["ROBOTS"] = "false"
+    return Config(cparser)
+
+
+def build(config, urls, pending, hosts):
+    from utils import get_urlhash
+    from crawler.store import open_store, PendingLog
+    from scraper import url_filter
+    save = open_store(config)
+    log = PendingLog(f"{config.save_file}.pending", url_filter.version, None)
+    every = max(int(1 / pending), 1) if pending else 0
+    for i in range(urls):
+        url = f"https://host{i % hosts}.ics.uci.edu/page/{i}"
+        urlhash = get_urlhash(url)
+        completed = not every or i % every != 0
+        if not completed:
+            log.add(urlhash, url, url_filter.version)
+        save[urlhash] = (url, completed)
+    save.close()
+    log.close()
+
+
+def resume(config, fast):
+    from crawler.frontier import Frontier
+    if not fast:
+        os.remove(f"{config.save_file}.pending")
+    start = time.perf_counter()
+    frontier = Frontier(config, False)
+    url = frontier.get_tbd_url()
+    first = time.perf_counter() - start
+    frontier.loaded.wait()
+    loaded = time.perf_counter() - start
+    frontier.mark_url_complete(url)
+    frontier.close()
+    return first, loaded
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="frontier-restart.")
+    cwd = os.getcwd()
+    try:
+        shutil.copy(os.path.join(ROOT, "stopwords.txt"), work_dir)
+        os.chdir(work_dir)
+        sys.path.insert(0, ROOT)
+        logging.disable(logging.WARNING)
+        config = make_config(args.store)
+        start = time.perf_counter()
+        build(config, args.urls, args.pending, args.hosts)
+        print(f"{args.urls} urls, {args.pending:.0%} pending, {args.store} store "
+              f"(built in {time.perf_counter() - start:.1f}s)")
+        # The scan run rebuilds the pending log, so the fast one goes first.
+        for name, fast in (("pending log", True), ("full scan", False)):
+            first, loaded = resume(config, fast)
+            print(f"{name:>12}: first url after {first:.2f}s, "
+                  f"save file loaded after {loaded:.2f}s")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--pending", type=float, default=0.05)
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--store", choices=("log", "shelve"), default="log")
+    main(parser.parse_args())
@@ -0,0 +1,77 @@
+''' Per-page parse time of utils.parse.parse_page against the BeautifulSoup
+path it replaced (get_text plus find_all('a') over one soup).
+
+Pages are read from the given files or directories of saved HTML; a
+synthetic publication-list page is used when none are given.
+
+Usage: python -m benchmarks.parse [page_or_directory ...]
+'''
+import os
+import sys
+import time
+import random
+
+from utils.parse import parse_page
+
+REPEAT = 3
+
+
+def soup_parse(content):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'lxml')
+    text = soup.get_text(separator=" ", strip=True)
+    links = [link.get('href') for link in soup.find_all('a') if link.get('href')]
+    return text, links
+
+
+def synthetic_page(rng, entries=3000):
+    rows = []
+    for i in range(entries):
+        words = " ".join(f"word{rng.randint(0, 5000)}" for _ in range(20))
+        # Comments and processing instructions split text nodes too.
+        rows.append(f'<li><a href="/pub/{i}.html">Paper {i}</a> <em>{words}</em>'
+                    f'<script>track({i});</script>cited<!-- entry {i} -->by'
+                    f'<?php count({i}); ?>{i}</li>')
+    return ("<html><head><style>li{margin:0}</style></head><body><ul>"
+            + "".join(rows) + "</ul></body></html>").encode("utf-8")
+
+
+def load_pages(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            yield from load_pages(os.path.join(path, name) for name in names)
+        else:
+            with open(path, "rb") as f:
+                yield path, f.read()
+
+
+def best_of(function, content):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(content)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(paths):
+    pages = list(load_pages(paths)) or [("synthetic", synthetic_page(random.Random(0)))]
+    total_soup = total_fast = 0
+    mismatches = 0
+    for name, content in pages:
+        soup_time, expected = best_of(soup_parse, content)
+        fast_time, got = best_of(parse_page, content)
+        total_soup += soup_time
+        total_fast += fast_time
+        if got != expected:
+            mismatches += 1
+        print(f"{name[-40:]:>40} {len(content) / 1e3:>8.0f} kB "
+              f"soup {soup_time * 1e3:>8.1f} ms  lxml {fast_time * 1e3:>7.1f} ms")
+    print(f"{len(pages)} pages: soup {total_soup / len(pages) * 1e3:.1f} ms/page, "
+          f"lxml {total_fast / len(pages) * 1e3:.1f} ms/page, "
+          f"{total_soup / total_fast:.1f}x faster, {mismatches} pages with different output")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
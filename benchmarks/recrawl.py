@@ -0,0 +1,113 @@
+''' Cost of keeping a crawl up to date: a crawl of revision 0 of the site of
+benchmarks/cache_server.py, then a recrawl (launch.py --recrawl, with
+RECRAWLMIN = 0 so that every page is due) of revision 1, where a --changes
+share of the pages has new words, against a fresh crawl of revision 1.
+
+Reports pages fetched and parsed, wall clock and CPU time of each, and
+checks that the recrawl ends with the same stats (unique pages, word
+counts, length of the longest page, subdomains) as the fresh crawl, and
+that it indexes no more fingerprints than it parsed changed pages. The
+site has no duplicates and no traps by default, which a recrawl may resolve
+in another order than a fresh crawl.
+
+Usage: python -m benchmarks.recrawl [--threads 4] [--politeness 0.05]
+           [--changes 0.3] [cache server site options]
+'''
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+
+from benchmarks.cache_server import add_site_arguments, make_site
+from benchmarks.crawl import ROOT, StageTimer, free_port, start_server, make_config
+
+
+def run(args, port, seeds, recrawl):
+    import scraper
+    from crawler import Crawler
+    config = make_config(args, port, seeds)
+    config.recrawl = recrawl
+    config.fetch_history = True
+    config.recrawl_min = 0
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        Crawler(config, not recrawl).start()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    return elapsed, cpu, scraper.stats.snapshot(), scraper.stats.summary()
+
+
+def main(args):
+    seeds = make_site(args).seeds()
+    port = free_port()
+    work_dir = tempfile.mkdtemp(prefix="recrawl-benchmark.")
+    cwd = os.getcwd()
+    server = None
+    try:
+        shutil.copy(os.path.join(ROOT, "stopwords.txt"), work_dir)
+        os.chdir(work_dir)
+        sys.path.insert(0, ROOT)
+        logging.disable(logging.WARNING)
+        import scraper
+        import crawler.worker
+        timer = StageTimer()
+        timer.wrap(crawler.worker, "download", "fetched")
+        timer.wrap(scraper, "parse_page", "parsed")
+
+        results = dict()
+        for name, revision, recrawl in (("crawl r0", 0, False),
+                                        ("recrawl r1", 1, True),
+                                        ("fresh r1", 1, False)):
+            args.revision = revision
+            server = start_server(args, port)
+            timer.calls.clear()
+            if name == "fresh r1":
+                scraper.reset_stats()
+            fingerprints = len(scraper.simhash_index)
+            elapsed, cpu, snapshot, summary = run(args, port, seeds, recrawl)
+            if recrawl:
+                # Revisits replace their page, only changed ones are indexed.
+                added = len(scraper.simhash_index) - fingerprints
+                parsed = timer.calls.get("parsed", 0)
+                print(f"fingerprints added by the recrawl: {added} for {parsed} "
+                      f"parsed pages, {'ok' if added <= parsed else 'TOO MANY'}")
+            results[name] = (snapshot, summary)
+            print(f"{name:>10}: {timer.calls.get('fetched', 0):6d} fetched "
+                  f"{timer.calls.get('parsed', 0):6d} parsed {elapsed:6.1f}s "
+                  f"{cpu:6.2f}s CPU, {summary['unique_pages']} unique pages")
+            server.kill()
+            server.wait()
+            server = None
+
+        recrawled, recrawled_summary = results["recrawl r1"]
+        fresh, fresh_summary = results["fresh r1"]
+        for key in ("words", "subdomains", "pages"):
+            print(f"{key}: {'same' if recrawled[key] == fresh[key] else 'DIFFERENT'}")
+        # Pages of the same length are met in another order.
+        same = (recrawled_summary["most_word_in_page"]["word_count"]
+                == fresh_summary["most_word_in_page"]["word_count"])
+        print(f"longest page: {'same' if same else 'DIFFERENT'}")
+        same = recrawled_summary["top_50_words"] == fresh_summary["top_50_words"]
+        print(f"top_50_words: {'same' if same else 'DIFFERENT'}")
+    finally:
+        os.chdir(cwd)
+        if server is not None:
+            server.kill()
+            server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--politeness", type=float, default=0.05)
+    parser.add_argument("--metrics", action="store_true", default=False)
+    add_site_arguments(parser)
+    parser.set_defaults(duplicates=0, traps=0)
+    main(parser.parse_args())
@@ -0,0 +1,103 @@
+''' Decode time and peak memory per fetch of the lazy utils.response.Response
+against the eager one it replaced, which unpickled the page while the
+answer of the cache server was still referenced.
+
+For each page size, a cache server answer (as built by
+benchmarks/cache_server.py) is decoded the way download() does and the
+scraper's is_html check and body access are run on it, for an HTML page, a
+PDF and a 404 of that size. Peak memory is measured with tracemalloc and
+includes the copy of the answer read from the socket.
+
+Usage: python -m benchmarks.response [size_in_kB ...]
+'''
+import sys
+import time
+import pickle
+import tracemalloc
+
+import cbor
+
+from benchmarks.cache_server import envelope
+from utils.download import decode
+
+REPEAT = 5
+
+
+class EagerResponse(object):
+    def __init__(self, resp_dict):
+        self.url = resp_dict["url"]
+        self.status = resp_dict["status"]
+        self.error = resp_dict["error"] if "error" in resp_dict else None
+        try:
+            self.raw_response = (
+                pickle.loads(resp_dict["response"])
+                if "response" in resp_dict else
+                None)
+        except TypeError:
+            self.raw_response = None
+
+
+def is_html(resp):
+    if resp.status != 200 or not resp.raw_response:
+        return False
+    content_type = resp.raw_response.headers.get('content-type')
+    return bool(content_type) and "text/html" in content_type.lower()
+
+
+def eager(answer):
+    content = memoryview(answer).tobytes()
+    resp = EagerResponse(cbor.loads(content))
+    del content
+    return len(resp.raw_response.content) if is_html(resp) else 0
+
+
+def lazy(answer):
+    content = memoryview(answer).tobytes()
+    resp = decode(content)
+    del content
+    return len(resp.raw_response.content) if is_html(resp) else 0
+
+
+def make_answer(size, status, content_type):
+    url = "http://www.ics.uci.edu/big"
+    body = (b"<html><body><p>" + b"word " * (size // 5) + b"</p></body></html>")
+    answer = envelope(url, status, body)
+    if content_type != "text/html":
+        # envelope() always sends HTML, rewrite the pickled header.
+        answer_dict = cbor.loads(answer)
+        response = pickle.loads(answer_dict["response"])
+        response.headers["Content-Type"] = content_type
+        answer_dict["response"] = pickle.dumps(response)
+        answer = cbor.dumps(answer_dict)
+    return answer
+
+
+def measure(function, answer):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function(answer)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function(answer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(sizes):
+    print(f"{'page':>20} {'eager':>22} {'lazy':>22}")
+    for size in sizes:
+        for status, content_type in ((200, "text/html"), (200, "application/pdf"),
+                                     (404, "text/html")):
+            answer = make_answer(size * 1000, status, content_type)
+            cells = list()
+            for function in (eager, lazy):
+                seconds, peak = measure(function, answer)
+                cells.append(f"{seconds * 1e3:7.2f} ms {peak / 2 ** 20:7.1f} MiB")
+            name = f"{size} kB {status} {content_type.split('/')[1]}"
+            print(f"{name:>20} {cells[0]:>22} {cells[1]:>22}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [100, 1000, 10000])
@@ -0,0 +1,61 @@
+''' Time to check a url against a robots.txt of a given number of rules with
+crawler.robots.RobotsRules (compiled once, a trie walked along the path)
+and with urllib.robotparser (rules tried in turn until one matches), and
+the time to compile one. A tenth of the rules have wildcards, which
+robotparser does not support, so it only gets the others.
+
+Usage: python -m benchmarks.robots [rules ...]
+'''
+import sys
+import time
+import random
+
+from urllib.robotparser import RobotFileParser
+
+from crawler.robots import RobotsRules
+
+RULE_COUNTS = (10, 100, 1000)
+USER_AGENT = "IR US25 57973675"
+CHECKS = 20000
+
+
+def make_robots(rule_count, rng):
+    lines = ["User-agent: *"]
+    for i in range(rule_count):
+        directory = f"/{rng.choice(('wp', 'people', 'events', 'pub'))}/{i}"
+        if i % 10 == 9:
+            lines.append(f"Disallow: {directory}/*.pdf$")
+        else:
+            lines.append(f"{'Allow' if i % 3 == 0 else 'Disallow'}: {directory}/")
+    return "\n".join(lines) + "\n"
+
+
+def per_check(can_fetch, urls):
+    start = time.perf_counter()
+    for url in urls:
+        can_fetch(url)
+    return (time.perf_counter() - start) / len(urls)
+
+
+def main(rule_counts):
+    rng = random.Random(0)
+    print(f"{'rules':>6} {'compile ms':>11} {'trie us':>8} {'robotparser us':>15}")
+    for rule_count in rule_counts:
+        text = make_robots(rule_count, rng)
+        urls = [
+            f"https://www.ics.uci.edu/{rng.choice(('wp', 'people', 'events', 'pub'))}/"
+            f"{rng.randrange(2 * rule_count)}/some/page/{i}.html"
+            for i in range(CHECKS)]
+        start = time.perf_counter()
+        rules = RobotsRules(text, USER_AGENT)
+        compile_time = time.perf_counter() - start
+        parser = RobotFileParser()
+        parser.parse(line for line in text.splitlines() if not line.endswith("$"))
+        trie = per_check(rules.allowed, urls)
+        robotparser = per_check(lambda url: parser.can_fetch(USER_AGENT, url), urls)
+        print(f"{rule_count:>6} {compile_time * 1000:>11.2f} {trie * 1e6:>8.2f} "
+              f"{robotparser * 1e6:>15.2f}")
+
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or RULE_COUNTS)
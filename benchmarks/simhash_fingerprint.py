@@ -0,0 +1,68 @@
+''' Compares utils.simhash.simhash with the per-token md5 + 64 step loop it
+replaced, on synthetic Zipf-distributed pages or on the text files given.
+
+Usage: python -m benchmarks.simhash_fingerprint [text_file ...]
+'''
+import sys
+import time
+import random
+import hashlib
+
+from PartA import tokenize
+from utils import simhash as fast
+
+PAGE_SIZES = (1000, 10000, 50000)
+REPEAT = 5
+
+
+def reference_simhash(tokens):
+    hashbits = 64
+    v = [0] * hashbits
+    for token in tokens:
+        h = int(hashlib.md5(token.encode('utf-8')).hexdigest(), 16)
+        for i in range(hashbits):
+            bitmask = 1 << i
+            v[i] += 1 if h & bitmask else -1
+    fingerprint = 0
+    for i in range(hashbits):
+        if v[i] > 0:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+def synthetic_pages(rng):
+    vocabulary = [f"word{i}" for i in range(20000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    for size in PAGE_SIZES:
+        yield f"zipf-{size}", rng.choices(vocabulary, weights, k=size)
+
+
+def best_of(function, tokens):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(tokens)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(paths):
+    if paths:
+        pages = [(path, tokenize(open(path, encoding="utf-8").read())) for path in paths]
+    else:
+        pages = synthetic_pages(random.Random(0))
+    numpy = fast.np
+    print(f"{'page':>24} {'tokens':>7} {'reference ms':>13} {'numpy ms':>9} {'python ms':>10}")
+    for name, tokens in pages:
+        reference, expected = best_of(reference_simhash, tokens)
+        vectorized, got = best_of(fast.simhash, tokens)
+        fast.np = None
+        fallback, got_fallback = best_of(fast.simhash, tokens)
+        fast.np = numpy
+        assert expected == got == got_fallback
+        print(f"{name[-24:]:>24} {len(tokens):>7} {reference * 1e3:>13.1f} "
+              f"{vectorized * 1e3:>9.1f} {fallback * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,63 @@
+''' Compares SimhashIndex.query_within with the linear scan it replaced.
+
+Usage: python -m benchmarks.simhash_index [size ...]
+'''
+import sys
+import time
+import random
+
+from utils.simhash import SimhashIndex, hamming_distance
+
+SIZES = (10000, 100000, 1000000)
+QUERIES = 200
+LINEAR_QUERIES = 20
+
+
+def linear_scan(fingerprints, fingerprint, k):
+    for existing in fingerprints:
+        if hamming_distance(fingerprint, existing) <= k:
+            return existing
+    return None
+
+
+def near(fingerprint, rng, k=3):
+    for bit in rng.sample(range(64), rng.randint(0, k)):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def time_queries(lookup, queries):
+    start = time.perf_counter()
+    for query in queries:
+        lookup(query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main(sizes):
+    rng = random.Random(0)
+    print(f"{'size':>9} {'build s':>9} {'index us':>10} {'linear us':>11} {'speedup':>8}")
+    for size in sizes:
+        fingerprints = [rng.getrandbits(64) for _ in range(size)]
+        start = time.perf_counter()
+        index = SimhashIndex()
+        for fingerprint in fingerprints:
+            index.add(fingerprint)
+        build = time.perf_counter() - start
+
+        # Half the queries are near duplicates, half are new pages.
+        queries = [near(rng.choice(fingerprints), rng) for _ in range(QUERIES // 2)]
+        queries += [rng.getrandbits(64) for _ in range(QUERIES // 2)]
+        rng.shuffle(queries)
+        for query in queries[:LINEAR_QUERIES]:
+            assert ((index.query_within(query, 3) is None)
+                    == (linear_scan(fingerprints, query, 3) is None))
+
+        indexed = time_queries(lambda q: index.query_within(q, 3), queries)
+        linear = time_queries(
+            lambda q: linear_scan(fingerprints, q, 3), queries[:LINEAR_QUERIES])
+        print(f"{size:>9} {build:>9.2f} {indexed * 1e6:>10.1f} "
+              f"{linear * 1e6:>11.1f} {linear / indexed:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
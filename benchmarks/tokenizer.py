@@ -0,0 +1,97 @@
+''' Throughput of PartA.tokenize and PartA.iter_tokens in MB/s, checked
+against the character-by-character tokenizer they replaced.
+
+Synthetic text is used unless files are given; .html files are reduced to
+their visible text first.
+
+Usage: python -m benchmarks.tokenizer [file ...]
+'''
+import sys
+import time
+import random
+
+from PartA import VALID_CHARS, tokenize, iter_tokens
+
+CHUNK_SIZE = 64 * 1024
+REPEAT = 3
+
+
+def reference_tokenize(text):
+    tokens = []
+    new_token = ''
+    for character in text:
+        if character in VALID_CHARS:
+            new_token += character
+        else:
+            if new_token:
+                new_token = new_token.lower()
+                tokens.append(new_token)
+                new_token = ''
+    if new_token:
+        new_token = new_token.lower()
+        tokens.append(new_token)
+    return tokens
+
+
+def synthetic_texts(rng):
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    separators = [' ', ' ', ' ', ', ', '.\n', '\t', '-', 'é', '—', 'K', '\x00']
+    words = [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+             for _ in range(5000)]
+    ascii_text = ' '.join(rng.choice(words) for _ in range(400000))
+    mixed_text = ''.join(rng.choice(words) + rng.choice(separators)
+                         for _ in range(400000))
+    return [("synthetic ascii", ascii_text), ("synthetic mixed", mixed_text)]
+
+
+def file_text(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if path.endswith((".html", ".htm")):
+        from bs4 import BeautifulSoup
+        text = BeautifulSoup(text, 'lxml').get_text(separator=" ", strip=True)
+    return text
+
+
+def chunked(text):
+    return list(iter_tokens(
+        text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)))
+
+
+def throughput(function, text):
+    size = len(text.encode("utf-8")) / 1e6
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(text)
+        best = min(best, time.perf_counter() - start)
+    return size / best, result
+
+
+def check_edge_cases():
+    cases = ["", " ", "a", "A", "aB c", "  x  ", "abc def", "é", "aéb",
+             "Kelvin", "İstanbul", "x\ud800y", "tab\there", "12ab-34CD",
+             "___", "a\x00b", " nbsp "]
+    for text in cases:
+        expected = reference_tokenize(text)
+        assert tokenize(text) == expected, text
+        for size in range(1, len(text) + 1):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            assert list(iter_tokens(chunks)) == expected, (text, size)
+
+
+def main(paths):
+    check_edge_cases()
+    texts = [(path, file_text(path)) for path in paths] or synthetic_texts(random.Random(0))
+    print(f"{'text':>24} {'MB':>6} {'reference':>10} {'tokenize':>9} {'iter_tokens':>12}  (MB/s)")
+    for name, text in texts:
+        reference, expected = throughput(reference_tokenize, text)
+        fast, tokens = throughput(tokenize, text)
+        streaming, streamed = throughput(chunked, text)
+        assert tokens == expected and streamed == expected, name
+        print(f"{name[-24:]:>24} {len(text) / 1e6:>6.1f} {reference:>10.1f} "
+              f"{fast:>9.1f} {streaming:>12.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,4 +1,9 @@
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
 from utils import get_logger
+from utils.download import connection_stats, close_archive
+from utils.metrics import metrics
 from crawler.frontier import Frontier
 from crawler.worker import Worker
 
@@ -6,13 +11,25 @@ class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        if config.metrics:
+            # Before the frontier is created, so that its lock is timed.
+            metrics.enable(config.metrics_port, config.metrics_interval, self.logger)
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
+        self.parse_pool = None
 
     def start_async(self):
+        extra = dict()
+        if getattr(self.worker_factory, "uses_parse_pool", False):
+            # One pool for every worker. Its processes are forked from a
+            # forkserver, not from this process: other threads (metrics,
+            # workers) may hold a lock at the time of the fork.
+            self.parse_pool = extra["parse_pool"] = ProcessPoolExecutor(
+                self.config.parse_processes or None,
+                mp_context=get_context("forkserver"))
         self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
+            self.worker_factory(worker_id, self.config, self.frontier, **extra)
             for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
@@ -20,6 +37,17 @@ class Crawler(object):
     def start(self):
         self.start_async()
         self.join()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+        self.frontier.close()
+        close_archive()
+        stats = connection_stats()
+        self.logger.info(
+            f"Sent {stats['requests']} requests to the cache server over "
+            f"{stats['connections']} connections, {stats['reused']} reused "
+            f"an open connection.")
+        if metrics.enabled:
+            self.logger.info(f"Metrics: {metrics.summary()}")
 
     def join(self):
         for worker in self.workers:
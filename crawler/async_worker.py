@@ -0,0 +1,108 @@
+import time
+import asyncio
+
+from threading import Thread
+from urllib.parse import urlparse
+
+import aiohttp
+
+from utils.download import download_async
+from utils import get_logger
+from utils.metrics import metrics
+import scraper
+
+
+class AsyncWorker(Thread):
+    ''' Worker running an asyncio event loop with up to config.async_fetches
+    downloads in flight, at most config.async_fetches_per_host of them for
+    the same host; both limits are per worker. Parsing runs in parse_pool,
+    the pool of config.parse_processes processes the Crawler shares among
+    its workers; stats and the frontier are only touched from this process. '''
+    # Tells the Crawler to create parse_pool.
+    uses_parse_pool = True
+
+    def __init__(self, worker_id, config, frontier, parse_pool):
+        self.logger = get_logger(f"AsyncWorker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        self.parse_pool = parse_pool
+        self.host_slots = dict()
+        super().__init__(daemon=True)
+
+    def run(self):
+        asyncio.run(self._crawl())
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+        scraper.save_stats()
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.config.async_fetches)
+        tasks = set()
+        connector = aiohttp.TCPConnector(limit=self.config.async_fetches)
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.config.connect_timeout,
+            sock_read=self.config.read_timeout)
+        async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout) as session:
+            while True:
+                await slots.acquire()
+                # get_tbd_url blocks until a host is ready, keep it off the loop.
+                try:
+                    tbd_url = await loop.run_in_executor(
+                        None, self.frontier.get_tbd_url)
+                except Exception:
+                    self.logger.exception("Could not get a url from the frontier.")
+                    tbd_url = None
+                if not tbd_url:
+                    slots.release()
+                    break
+                task = loop.create_task(self._process(tbd_url, session, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+
+    async def _process(self, tbd_url, session, slots):
+        loop = asyncio.get_running_loop()
+        domain = urlparse(tbd_url).netloc
+        host_slots = self.host_slots.get(domain)
+        if host_slots is None:
+            host_slots = self.host_slots[domain] = asyncio.Semaphore(
+                self.config.async_fetches_per_host)
+        try:
+            async with host_slots:
+                start = time.perf_counter()
+                resp = await download_async(tbd_url, self.config, session, self.logger)
+                latency = time.perf_counter() - start
+            metrics.observe("download", latency)
+            metrics.count("pages")
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server}.")
+            duplicate = False
+            changed = await loop.run_in_executor(
+                None, self.frontier.content_changed, tbd_url, resp)
+            if not changed:
+                metrics.count("unchanged_pages")
+            elif scraper.is_html(resp):
+                # The parser processes have metrics of their own, only the
+                # whole round trip is timed here.
+                with metrics.timer("analyze"):
+                    page = await loop.run_in_executor(
+                        self.parse_pool, scraper.analyze_page, tbd_url, resp.raw_response.content)
+                duplicate = await loop.run_in_executor(None, self._record, tbd_url, page)
+            if changed:
+                await loop.run_in_executor(
+                    None, self.frontier.mark_scraped, tbd_url, resp)
+            await loop.run_in_executor(
+                None, self.frontier.report_fetch, tbd_url, resp.status, latency, duplicate)
+        except Exception:
+            self.logger.exception(f"Failed to process {tbd_url}.")
+        finally:
+            await loop.run_in_executor(None, self.frontier.mark_url_complete, tbd_url)
+            slots.release()
+
+    def _record(self, tbd_url, page):
+        # Returns whether the page was a duplicate.
+        for scraped_url in scraper.record_page(tbd_url, page):
+            self.frontier.add_url(scraped_url, tbd_url)
+        return scraper.was_duplicate()
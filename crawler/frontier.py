@@ -1,92 +1,595 @@
-import os
-import shelve
-import time
-
-from threading import Thread, RLock
-from queue import Queue, Empty
-
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
-
-
-class Frontier(object):
-    def __init__(self, config, restart):
-        self.logger = get_logger("FRONTIER")
-        self.config = config
-        self.to_be_downloaded = list()
-        self.lock = RLock()
-        self.last_access = {}
-
-        if not os.path.exists(self.config.save_file) and not restart:
-            # Save file does not exist, but request to load save.
-            self.logger.info(
-                f"Did not find save file {self.config.save_file}, "
-                f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
-            # Save file does exists, but request to start from seed.
-            self.logger.info(
-                f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
-        else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
-
-    def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
-        tbd_count = 0
-        with self.lock:
-            for url, completed in self.save.values():
-                if not completed and is_valid(url):
-                    self.to_be_downloaded.append(url)
-                    tbd_count += 1
-        self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
-
-    def get_tbd_url(self):
-        with self.lock:
-            try:
-                return self.to_be_downloaded.pop()
-            except IndexError:
-                return None
-
-    def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        with self.lock:
-            if urlhash not in self.save:
-                self.save[urlhash] = (url, False)
-                self.save.sync()
-                self.to_be_downloaded.append(url)
-
-    def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        with self.lock:
-            if urlhash not in self.save:
-                # This should not happen.
-                self.logger.error(
-                    f"Completed url {url}, but have not seen it before.")
-        self.save[urlhash] = (url, True)
-        self.save.sync()
-
-    def can_access_domain(self, domain):
-        with self.lock:
-            now = time.time()
-            last_time = self.last_access.get(domain, 0)
-            if now - last_time >= self.config.time_delay:
-                self.last_access[domain] = now
-                return True
-            return False
-
-    def wait_until_access_allowed(self, domain):
-        while not self.can_access_domain(domain):
-            time.sleep(0.05)
+import os
+import time
+import heapq
+
+from itertools import count
+from threading import RLock, Condition, Event, Thread
+from urllib.parse import urlparse
+
+from utils import get_logger, get_urlhash, normalize
+from crawler.store import open_store, store_files, PendingLog
+from crawler.priority import HostScheduler, make_scorer
+from crawler.politeness import AdaptivePoliteness
+from crawler.robots import RobotsCache, SitemapRead, sitemap_content
+from crawler.recrawl import FetchHistory
+from utils.bloom import ScalableBloomFilter
+from utils.download import download, CONNECTION_ERROR_STATUS
+from utils.metrics import metrics
+from utils.parse import parse_sitemap
+from scraper import is_valid, url_filter
+import scraper
+
+# Threads downloading robots.txt files and sitemaps for the frontier.
+POLICY_THREADS = 4
+
+
+class Frontier(object):
+    def __init__(self, config, restart):
+        self.logger = get_logger("FRONTIER")
+        self.config = config
+        # Times waits for the lock when metrics are enabled.
+        self.lock = metrics.instrument_lock(RLock(), "frontier")
+        self.has_work = Condition(self.lock)
+        # Queued urls per host, in the order given by config.priority, and
+        # the delay between fetches of each host.
+        self.politeness = AdaptivePoliteness(self.config)
+        self.scheduler = HostScheduler(
+            make_scorer(self.config.priority), self.politeness.delay)
+        # Urls handed out by get_tbd_url that are not marked complete yet.
+        self.in_progress = 0
+        # How long an idle get_tbd_url waits before checking _finished again
+        # without being notified; None waits for a notification.
+        self.idle_wait = None
+        # Version of the filter rules the queued urls passed.
+        self.rules_version = url_filter.version
+
+        # The urls still to download are also logged on their own, so that a
+        # restart does not have to go through the save file to find them.
+        pending_file = f"{self.config.save_file}.pending"
+        save_files = store_files(self.config)
+        if not save_files and not restart:
+            # Save file does not exist, but request to load save.
+            self.logger.info(
+                f"Did not find save file {self.config.save_file}, "
+                f"starting from seed.")
+        elif save_files and restart:
+            # Save file does exists, but request to start from seed.
+            self.logger.info(
+                f"Found save file {self.config.save_file}, deleting it.")
+            for path in save_files:
+                os.remove(path)
+        fast_restart = bool(not restart and save_files and os.path.exists(pending_file))
+        if not fast_restart and os.path.exists(pending_file):
+            os.remove(pending_file)
+        # robots.txt of the hosts met so far, and the urls popped while the
+        # robots.txt of their host is fetched, by host.
+        robots_file = f"{self.config.save_file}.robots"
+        if restart and os.path.exists(robots_file):
+            os.remove(robots_file)
+        self.robots = None
+        if self.config.robots:
+            self.robots = RobotsCache(
+                robots_file, self.config.user_agent, self.config.robots_expiry)
+        self.policy_fetches = dict()
+        # robots.txt and sitemap downloads are jobs run by the policy threads,
+        # not by the workers: a heap of (time it may run, sequence number,
+        # host, root url of the host), and the sitemap reads in progress by
+        # host. A host has at most one job queued or running at a time.
+        self.policy_jobs = list()
+        self.policy_sequence = count()
+        self.policy_ready = Condition(self.lock)
+        self.sitemap_reads = dict()
+        self.closed = False
+        self.policy_threads = list()
+        if self.robots is not None:
+            for _ in range(POLICY_THREADS):
+                thread = Thread(target=self._run_policy_jobs, daemon=True)
+                thread.start()
+                self.policy_threads.append(thread)
+        # What pages looked like when last downloaded, for recrawls.
+        history_file = f"{self.config.save_file}.fetches"
+        if restart and os.path.exists(history_file):
+            os.remove(history_file)
+        self.history = None
+        if self.config.fetch_history:
+            self.history = FetchHistory(
+                history_file, self.config.recrawl_min, self.config.recrawl_max)
+        if self.history is not None and self.history.discarded_bytes:
+            self.logger.warning(
+                f"Recovered {history_file} after an unclean shutdown, "
+                f"discarded {self.history.discarded_bytes} bytes of incomplete "
+                f"records.")
+        self.seen_file = f"{self.config.save_file}.bloom"
+        self.save = self.seen = None
+        # Urls skipped by get_tbd_url (disallowed by a saved robots.txt)
+        # while the save file is still loading, saved once it is loaded.
+        self.unsaved_skips = list()
+        # Set once the save file is loaded; every method but get_tbd_url
+        # waits for it.
+        self.loaded = Event()
+        self.load_error = None
+        self.pending = PendingLog(pending_file, self.rules_version, is_valid)
+        if fast_restart:
+            # Workers start on the pending urls while the save file loads.
+            urls = self._parse_pending_file()
+            self.loader = Thread(
+                target=self._load_save_file, args=(restart, urls), daemon=True)
+            self.loader.start()
+        else:
+            # Load existing save file, or create one if it does not exist.
+            self._load_save_file(restart, ())
+            if self.load_error is not None:
+                raise self.load_error
+            if restart:
+                for url in self.config.seed_urls:
+                    self.add_url(url)
+            else:
+                # Set the frontier state with contents of save file.
+                self._parse_save_file()
+                if not self.save:
+                    for url in self.config.seed_urls:
+                        self.add_url(url)
+        if self.config.recrawl and not restart:
+            self._queue_revisits()
+
+    def _parse_save_file(self):
+        ''' This function can be overridden for alternate saving techniques. '''
+        total_count = len(self.save)
+        tbd_count = 0
+        with self.lock:
+            for url, completed in self.save.values():
+                if not completed and is_valid(url):
+                    self._enqueue(url)
+                    self.pending.add(get_urlhash(url), url, self.rules_version)
+                    tbd_count += 1
+        self.logger.info(
+            f"Found {tbd_count} urls to be downloaded from {total_count} "
+            f"total urls discovered.")
+
+    def _parse_pending_file(self):
+        if self.pending.discarded_bytes:
+            self.logger.warning(
+                f"Recovered {self.pending.path} after an unclean shutdown, "
+                f"discarded {self.pending.discarded_bytes} bytes of incomplete "
+                f"records.")
+        revalidated = self.pending.revalidated
+        urls = self.pending.drain()
+        with self.lock:
+            for url in urls:
+                self._enqueue(url)
+        self.logger.info(
+            f"Found {len(urls)} urls to be downloaded in {self.pending.path}"
+            + (f", checked {revalidated} of them again against the changed "
+               f"filter rules." if revalidated else "."))
+        return urls
+
+    def _queue_revisits(self):
+        ''' Queues the downloaded pages due for a revisit (see
+        FetchHistory.due) that are not queued already. They stay completed
+        in the save file, the pending log is what brings them back if the
+        crawler is killed. '''
+        revisits = 0
+        with self.lock:
+            for url in self.history.due(time.time()):
+                if url not in self.scheduler and self._enqueue(url):
+                    self.pending.add(get_urlhash(url), url, self.rules_version)
+                    revisits += 1
+        self.logger.info(
+            f"Queued {revisits} of {len(self.history)} downloaded pages "
+            f"for a revisit.")
+
+    def _load_save_file(self, restart, pending_urls):
+        ''' Opens the save file. pending_urls were queued from the pending
+        log; the ones the save file lost in an unclean shutdown are saved
+        again. '''
+        try:
+            save = open_store(self.config)
+            # The pending log reaches the disk first, so that no url can be
+            # saved as queued but missing from it.
+            save.before_commit = self.pending.flush
+            if save.discarded_bytes:
+                self.logger.warning(
+                    f"Recovered {self.config.save_file} after an unclean shutdown, "
+                    f"discarded {save.discarded_bytes} bytes of incomplete "
+                    f"records.")
+            seen = self._load_seen(save, restart)
+            lost = list()
+            for url in pending_urls:
+                urlhash = get_urlhash(url)
+                if (seen is not None and urlhash not in seen) or urlhash not in save:
+                    lost.append((urlhash, url))
+        except Exception as e:
+            self.logger.exception(f"Could not load {self.config.save_file}.")
+            self.load_error = e
+        else:
+            with self.lock:
+                for urlhash, url in lost:
+                    if seen is not None:
+                        seen.add(urlhash)
+                    save[urlhash] = (url, False)
+                self.save, self.seen = save, seen
+                skipped, self.unsaved_skips = self.unsaved_skips, list()
+                self._skip(skipped)
+            if lost:
+                self.logger.info(
+                    f"Saved {len(lost)} pending urls missing from "
+                    f"{self.config.save_file} again.")
+        self.loaded.set()
+
+    def _wait_loaded(self):
+        self.loaded.wait()
+        if self.load_error is not None:
+            raise RuntimeError(
+                f"Could not load {self.config.save_file}.") from self.load_error
+
+    def _load_seen(self, save, restart):
+        ''' In-memory filter of every url hash in the save file, so that add_url
+        only looks a url up in the save file when it has probably been seen.
+        Not needed when the store already keeps its index in memory. '''
+        if save.index_in_memory:
+            return None
+        seen = None
+        if not restart:
+            seen = ScalableBloomFilter.load(self.seen_file, len(save))
+        if os.path.exists(self.seen_file):
+            # Only valid until the save file changes; saved again by close().
+            os.remove(self.seen_file)
+        if seen is None:
+            seen = ScalableBloomFilter(
+                self.config.bloom_capacity, self.config.bloom_error_rate)
+            for urlhash in save.keys():
+                seen.add(urlhash)
+        return seen
+
+    def _enqueue(self, url, parent=None):
+        # Must be called with self.lock held. Returns whether url was queued.
+        host_count = len(self.scheduler.host_queues)
+        if not self.scheduler.push(url, parent):
+            self.logger.warning(f"Skipping URL with no domain: {url}")
+            return False
+        if len(self.scheduler.host_queues) > host_count:
+            # A new host may be ready before the time the workers wait for.
+            self.has_work.notify()
+        return True
+
+    def get_tbd_url(self):
+        ''' Blocks until some host may be fetched politely and returns its
+        best url. Returns None once nothing is queued or being processed.
+        Urls of hosts whose robots.txt is not known yet are held while a
+        policy thread fetches it, and another host's url is returned. '''
+        with metrics.timer("frontier_get"), self.lock:
+            while True:
+                now = time.time()
+                url = self.scheduler.pop(now)
+                if url is not None:
+                    self.in_progress += 1
+                    if self.robots is None:
+                        return url
+                    domain = urlparse(url).netloc
+                    held = self.policy_fetches.get(domain)
+                    if held is not None:
+                        # Queued again once the robots.txt is read.
+                        held.append(url)
+                        continue
+                    rules = self._rules(domain)
+                    if rules is None:
+                        self.policy_fetches[domain] = [url]
+                        parsed = urlparse(url)
+                        self._queue_policy_job(
+                            now, domain, f"{parsed.scheme}://{domain}")
+                        continue
+                    if rules.allowed(url):
+                        return url
+                    self._disallow(url)
+                    continue
+                ready_at = self.scheduler.ready_at()
+                if ready_at is None:
+                    if self._finished():
+                        # Wake up the other workers so they can stop too.
+                        self.has_work.notify_all()
+                        return None
+                    self.has_work.wait(self.idle_wait)
+                else:
+                    self.has_work.wait(ready_at - now)
+
+    def _rules(self, domain):
+        # Must be called with self.lock held. The robots.txt rules of domain,
+        # None if it has to be fetched.
+        rules = self.robots.get(domain)
+        if (rules is not None and rules.crawl_delay and not self.config.replay
+                and domain not in self.politeness.crawl_delays):
+            # Rules loaded from a previous run are compiled on first use.
+            self.politeness.crawl_delays[domain] = rules.crawl_delay
+        return rules
+
+    def _allowed(self, url, domain):
+        # Must be called with self.lock held. False if the robots.txt of
+        # domain is known and disallows url.
+        if self.robots is None:
+            return True
+        rules = self._rules(domain)
+        if rules is None or rules.allowed(url):
+            return True
+        metrics.count("robots_disallowed")
+        return False
+
+    def _disallow(self, url):
+        # Must be called with self.lock held, for a url popped by
+        # get_tbd_url that robots.txt disallows. Released before it is saved,
+        # which may fail.
+        metrics.count("robots_disallowed")
+        self.scheduler.done(url)
+        self.in_progress -= 1
+        self._skip([url])
+
+    def _queue_policy_job(self, ready_at, domain, root):
+        # Must be called with self.lock held.
+        heapq.heappush(
+            self.policy_jobs, (ready_at, next(self.policy_sequence), domain, root))
+        self.policy_ready.notify()
+
+    def _run_policy_jobs(self):
+        # Body of the policy threads: reads the robots.txt of a host whose
+        # urls are held, or the next sitemap of a host once the host may be
+        # fetched, reserving that fetch so that no worker fetches the host
+        # at the same time.
+        while True:
+            with self.lock:
+                while True:
+                    if self.closed:
+                        return
+                    now = time.time()
+                    if self.policy_jobs and self.policy_jobs[0][0] <= now:
+                        _, _, domain, root = heapq.heappop(self.policy_jobs)
+                        read = self.sitemap_reads.get(domain)
+                        if read is None:
+                            break
+                        ready_at = self.scheduler.next_access.get(domain, 0)
+                        if ready_at > now:
+                            # A worker fetched the host meanwhile.
+                            self._queue_policy_job(ready_at, domain, root)
+                            continue
+                        self.scheduler.defer(
+                            domain, now + self.politeness.delay(domain))
+                        break
+                    self.policy_ready.wait(
+                        self.policy_jobs[0][0] - now if self.policy_jobs else None)
+            try:
+                if read is None:
+                    self._read_robots(domain, root)
+                else:
+                    self._read_sitemap(domain, root, read)
+            except Exception:
+                self.logger.exception(f"Could not read the robots.txt or sitemaps of {domain}.")
+
+    def _read_robots(self, domain, root):
+        ''' Reads the robots.txt of domain. Then the urls of the host popped
+        meanwhile are queued again unless disallowed, the host waits for its
+        delay, and the reading of its sitemaps is queued. '''
+        sitemaps = list()
+        try:
+            with metrics.timer("robots"):
+                resp = download(f"{root}/robots.txt", self.config, self.logger)
+            status, text = resp.status, ""
+            if status == 200 and resp.raw_response is not None:
+                text = resp.raw_response.content.decode("utf-8", "replace")
+            rules = self.robots.compile(status, text)
+            if self.config.sitemap_urls:
+                # Only sitemaps of this host, whose politeness is known here.
+                sitemaps = [
+                    sitemap for sitemap in rules.sitemaps
+                    if urlparse(sitemap).netloc == domain]
+                if not rules.sitemaps and rules.allowed(f"{root}/sitemap.xml"):
+                    sitemaps.append(f"{root}/sitemap.xml")
+        except Exception:
+            self.logger.exception(f"Could not read the robots.txt of {domain}.")
+            status, text = CONNECTION_ERROR_STATUS, ""
+            rules = self.robots.compile(status, text)
+
+        with self.lock:
+            held = self.policy_fetches.pop(domain)
+            try:
+                self.robots.add(domain, status, text, rules)
+                if rules.crawl_delay and not self.config.replay:
+                    self.politeness.crawl_delays[domain] = rules.crawl_delay
+                else:
+                    self.politeness.crawl_delays.pop(domain, None)
+            finally:
+                # Even if the robots.txt could not be saved, otherwise the
+                # urls of the host are held and the crawl never ends.
+                for held_url in held:
+                    if rules.allowed(held_url):
+                        self.scheduler.requeue(held_url)
+                        self.in_progress -= 1
+                        continue
+                    try:
+                        self._disallow(held_url)
+                    except Exception:
+                        self.logger.exception(
+                            f"Could not save {held_url} as disallowed.")
+                self.scheduler.defer(domain, time.time() + self.politeness.delay(domain))
+                if sitemaps:
+                    self._start_read(domain, SitemapRead(sitemaps))
+                    self._queue_policy_job(
+                        self.scheduler.next_access.get(domain, 0), domain, root)
+                self.has_work.notify_all()
+        self.logger.info(
+            f"Read the robots.txt of {domain} (status {status}"
+            + (f", Crawl-delay {rules.crawl_delay}s" if rules.crawl_delay else "")
+            + ("), reading its sitemaps." if sitemaps else ")."))
+
+    def _read_sitemap(self, domain, root, read):
+        ''' Reads the next sitemap of domain, in a fetch of the host reserved
+        by _run_policy_jobs, and queues the one after it. Once they are all
+        read the config.sitemap_urls most recently modified valid urls of
+        the sitemaps are added. '''
+        sitemap = read.next_sitemap()
+        try:
+            with metrics.timer("sitemaps"):
+                resp = download(sitemap, self.config, self.logger)
+            if resp.status == 200 and resp.raw_response is not None:
+                read.add(*parse_sitemap(sitemap_content(
+                    resp.raw_response.content, self.config.max_page_size)))
+        except Exception:
+            self.logger.exception(f"Could not read the sitemap {sitemap}.")
+        if not read.done:
+            with self.lock:
+                self._queue_policy_job(
+                    self.scheduler.next_access.get(domain, 0), domain, root)
+            return
+
+        added = 0
+        try:
+            for entry_url, _ in read.newest():
+                if added == self.config.sitemap_urls:
+                    break
+                try:
+                    if is_valid(entry_url):
+                        self.add_url(entry_url)
+                        added += 1
+                except Exception:
+                    self.logger.exception(f"Could not add {entry_url} from a sitemap.")
+        finally:
+            # Only once its urls are queued, so that the crawl does not stop
+            # before them.
+            with self.lock:
+                self._finish_read(domain)
+                self.has_work.notify_all()
+        self.logger.info(
+            f"Added {added} of the {len(read.entries)} urls of the sitemaps "
+            f"of {domain}.")
+
+    def _start_read(self, domain, read):
+        # Must be called with self.lock held.
+        self.sitemap_reads[domain] = read
+
+    def _finish_read(self, domain):
+        # Must be called with self.lock held.
+        del self.sitemap_reads[domain]
+
+    def _skip(self, urls):
+        # Must be called with self.lock held. Marks urls that will not be
+        # fetched as completed, so that they are not loaded again on restart.
+        if self.save is None:
+            # get_tbd_url does not wait for the save file to load.
+            self.unsaved_skips.extend(urls)
+            return
+        for url in urls:
+            urlhash = get_urlhash(url)
+            self.save[urlhash] = (url, True)
+            self.pending.remove(urlhash)
+
+    def _drop_host(self, domain):
+        # Must be called with self.lock held. Returns how many urls were dropped.
+        urls = self.scheduler.drop(domain)
+        self._skip(urls)
+        if urls:
+            self.logger.warning(
+                f"Dropped {len(urls)} queued urls of {domain}, it reached "
+                f"{self.config.trap_page_cap} fetches as a trap.")
+        return len(urls)
+
+    def _finished(self):
+        # Called with self.lock held when no url is queued.
+        return not self.in_progress and not self.sitemap_reads
+
+    def add_url(self, url, parent=None):
+        ''' parent is the url of the page the link was found on, if any. '''
+        url = normalize(url)
+        urlhash = get_urlhash(url)
+        self._wait_loaded()
+        with metrics.timer("frontier_add"), self.lock:
+            seen = self.seen
+            if (seen is not None and urlhash not in seen) or urlhash not in self.save:
+                if seen is not None:
+                    seen.add(urlhash)
+                domain = urlparse(url).netloc
+                if self.politeness.is_capped(domain) or not self._allowed(url, domain):
+                    self.save[urlhash] = (url, True)
+                elif self._enqueue(url, parent):
+                    # Logged as pending before it is saved, so that it cannot
+                    # be saved but missing from the pending log.
+                    self.pending.add(urlhash, url, self.rules_version)
+                    self.save[urlhash] = (url, False)
+                else:
+                    # Not fetchable, do not try again on restart.
+                    self.save[urlhash] = (url, True)
+            else:
+                self.scheduler.rediscover(url, parent)
+
+    def content_changed(self, url, resp):
+        ''' Records the download of url in the fetch history. Returns False
+        if it is the same page as at its previous download and was scraped
+        then, so that it need not be scraped again. '''
+        if self.history is None:
+            return True
+        return self.history.observe(url, resp)
+
+    def mark_scraped(self, url, resp):
+        ''' Records in the fetch history that resp, the download of url, was
+        scraped, once the scraper returned and its links were added. '''
+        if self.history is not None and self.history.scraped(url, resp):
+            self._save_scraped()
+
+    def _save_scraped(self):
+        # The stats of the pages taken were recorded before they were marked
+        # scraped, the flush logs them before their flags are saved.
+        urls = self.history.take_scraped()
+        scraper.stats.flush()
+        self.history.save_scraped(urls)
+
+    def report_fetch(self, url, status, latency, duplicate):
+        ''' Adapts the politeness of url's host to the outcome of its fetch:
+        the response status, how many seconds the download took and whether
+        the page was rejected as a duplicate. '''
+        domain = urlparse(url).netloc
+        politeness = self.politeness
+        self._wait_loaded()
+        with metrics.timer("frontier_report"), self.lock:
+            if politeness.record(url, status, latency, duplicate):
+                if politeness.is_trap(domain):
+                    self.logger.warning(
+                        f"Most pages of {domain} are duplicates, throttling it.")
+                    self.scheduler.throttled.add(domain)
+                else:
+                    self.logger.info(f"Stopped throttling {domain}.")
+                    self.scheduler.throttled.discard(domain)
+            if politeness.is_capped(domain):
+                self._drop_host(domain)
+            # The fetch started latency seconds ago.
+            self.scheduler.defer(
+                domain, time.time() - latency + politeness.delay(domain))
+
+    def mark_url_complete(self, url):
+        urlhash = get_urlhash(url)
+        self._wait_loaded()
+        with metrics.timer("frontier_complete"), self.lock:
+            if urlhash not in self.save:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+            self.save[urlhash] = (url, True)
+            self.pending.remove(urlhash)
+            self.scheduler.done(url)
+            self.in_progress -= 1
+            if not self.in_progress and not self.scheduler:
+                self.has_work.notify_all()
+
+    def close(self):
+        self._wait_loaded()
+        with self.lock:
+            self.closed = True
+            self.policy_ready.notify_all()
+        # Their jobs write to the save files.
+        for thread in self.policy_threads:
+            thread.join()
+        with self.lock:
+            if self.seen is not None:
+                self.seen.save(self.seen_file, len(self.save))
+            self.save.close()
+            self.pending.close()
+            if self.robots is not None:
+                self.robots.close()
+            if self.history is not None:
+                self._save_scraped()
+                self.history.close()
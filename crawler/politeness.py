@@ -0,0 +1,94 @@
+from urllib.parse import urlparse
+
+from utils.download import CONNECTION_ERROR_STATUS
+
+
+class HostHealth(object):
+    __slots__ = ("latency", "errors", "fetched", "duplicate_rate", "trap",
+                 "trap_fetches")
+
+    def __init__(self):
+        # Moving averages of the fetch latency and of the share of pages
+        # rejected as duplicates, consecutive failed fetches, fetches, and
+        # fetches since the host was flagged as a trap.
+        self.latency = 0.0
+        self.errors = 0
+        self.fetched = 0
+        self.duplicate_rate = 0.0
+        self.trap = False
+        self.trap_fetches = 0
+
+
+class AdaptivePoliteness(object):
+    ''' Per-host delay between fetches, derived from how the host behaves.
+
+    A host is never fetched more often than every config.time_delay seconds,
+    nor than the Crawl-delay of its robots.txt (set in crawl_delays by the
+    frontier). Slow hosts wait config.latency_factor times their average
+    fetch latency, and every consecutive error (connection failures, 5xx and
+    cache server errors) doubles the delay, up to config.max_delay or the
+    Crawl-delay if that is longer.
+
+    A host whose recent pages (roughly the last 1 / DUPLICATE_SMOOTHING)
+    were mostly rejected as duplicates, once it has config.trap_min_pages
+    fetches, is flagged as a trap: it is only fetched when no other host is
+    ready, and after config.trap_page_cap more fetches (0 for no cap) its
+    remaining urls are dropped. '''
+    # Weight of the latest fetch in the moving averages.
+    LATENCY_SMOOTHING = 0.2
+    DUPLICATE_SMOOTHING = 0.05
+
+    def __init__(self, config):
+        self.base_delay = config.time_delay
+        self.max_delay = max(config.max_delay, config.time_delay)
+        self.latency_factor = config.latency_factor
+        self.trap_ratio = config.trap_ratio
+        self.trap_min_pages = config.trap_min_pages
+        self.trap_page_cap = config.trap_page_cap
+        self.hosts = dict()
+        self.crawl_delays = dict()
+
+    def delay(self, domain):
+        crawl_delay = self.crawl_delays.get(domain, 0)
+        health = self.hosts.get(domain)
+        if health is None:
+            return max(self.base_delay, crawl_delay)
+        delay = max(self.base_delay, crawl_delay, self.latency_factor * health.latency)
+        if health.errors:
+            delay *= 2 ** min(health.errors, 16)
+        return min(delay, max(self.max_delay, crawl_delay))
+
+    def is_trap(self, domain):
+        health = self.hosts.get(domain)
+        return health is not None and health.trap
+
+    def is_capped(self, domain):
+        health = self.hosts.get(domain)
+        return (health is not None and health.trap and self.trap_page_cap > 0
+                and health.trap_fetches >= self.trap_page_cap)
+
+    def record(self, url, status, latency, duplicate):
+        ''' Updates the health of url's host after a fetch. Returns whether
+        the host was flagged as a trap or cleared by this fetch. '''
+        domain = urlparse(url).netloc
+        health = self.hosts.get(domain)
+        if health is None:
+            health = self.hosts[domain] = HostHealth()
+            health.latency = latency
+        health.latency += self.LATENCY_SMOOTHING * (latency - health.latency)
+        if status == CONNECTION_ERROR_STATUS or status >= 500:
+            health.errors += 1
+        else:
+            health.errors = 0
+        health.fetched += 1
+        health.duplicate_rate += self.DUPLICATE_SMOOTHING * (
+            duplicate - health.duplicate_rate)
+        if health.trap:
+            health.trap_fetches += 1
+        trap = (health.fetched >= self.trap_min_pages
+                and health.duplicate_rate >= self.trap_ratio)
+        if trap == health.trap:
+            return False
+        health.trap = trap
+        health.trap_fetches = 0
+        return True
@@ -0,0 +1,267 @@
+import heapq
+
+from itertools import count
+from urllib.parse import urlparse
+
+
+def url_depth(url):
+    parsed = urlparse(url)
+    depth = sum(1 for segment in parsed.path.split("/") if segment)
+    return depth + 1 if parsed.query else depth
+
+
+class Scorer(object):
+    ''' Decides the crawl order. Among the hosts that may be fetched without
+    breaking politeness the one with the lowest host_score is fetched first,
+    then the one whose best url has the lowest score. Within a host, urls are
+    fetched by score, in discovery order when scores are equal.
+
+    This base scorer scores everything 0: urls of a host are fetched in
+    discovery order and hosts in the order they become ready. '''
+    def discovered(self, url, parent):
+        ''' Called when a link from parent (None for seeds and urls loaded
+        from the save file) to a queued url is found, including when the url
+        is first queued. Returns whether score(url) may have changed. '''
+        return False
+
+    def score(self, url):
+        return 0
+
+    def host_score(self, domain):
+        # Read when the host becomes ready to be fetched.
+        return 0
+
+    def fetched(self, url):
+        ''' Called once url has been processed. '''
+        pass
+
+
+class DepthScorer(Scorer):
+    ''' Urls with fewer path segments first. '''
+    def score(self, url):
+        return url_depth(url)
+
+
+class LevelScorer(Scorer):
+    ''' Breadth first: urls by the number of links followed from a seed.
+    Urls without a known parent are placed at their path depth. '''
+    def __init__(self):
+        # Levels of the urls queued or being fetched.
+        self.levels = dict()
+
+    def discovered(self, url, parent):
+        parent_level = self.levels.get(parent)
+        level = url_depth(url) if parent_level is None else parent_level + 1
+        if level < self.levels.get(url, level + 1):
+            self.levels[url] = level
+            return True
+        return False
+
+    def score(self, url):
+        return self.levels.get(url, 0)
+
+    def fetched(self, url):
+        self.levels.pop(url, None)
+
+
+class InlinksScorer(Scorer):
+    ''' Urls with more links to them first. Scores only change when the
+    number of links doubles, which bounds how often a url is re-queued. '''
+    def __init__(self):
+        self.inlinks = dict()
+
+    def discovered(self, url, parent):
+        inlinks = self.inlinks.get(url, 0) + 1
+        self.inlinks[url] = inlinks
+        # True when inlinks is a power of two, i.e. its bit length grew.
+        return not inlinks & (inlinks - 1)
+
+    def score(self, url):
+        return -self.inlinks.get(url, 0).bit_length()
+
+    def fetched(self, url):
+        self.inlinks.pop(url, None)
+
+
+class NoveltyScorer(DepthScorer):
+    ''' Hosts with the fewest fetched pages first, so that every subdomain is
+    reached early, and shallow urls first within a host. '''
+    def __init__(self):
+        self.host_pages = dict()
+
+    def host_score(self, domain):
+        return self.host_pages.get(domain, 0)
+
+    def fetched(self, url):
+        domain = urlparse(url).netloc
+        self.host_pages[domain] = self.host_pages.get(domain, 0) + 1
+
+
+SCORERS = {
+    "fifo": Scorer,
+    "depth": DepthScorer,
+    "level": LevelScorer,
+    "inlinks": InlinksScorer,
+    "novelty": NoveltyScorer,
+}
+
+
+def make_scorer(name):
+    try:
+        scorer_factory = SCORERS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown frontier priority {name!r}, "
+            f"expected one of {', '.join(SCORERS)}.")
+    return scorer_factory()
+
+
+class HostScheduler(object):
+    ''' Queued urls ordered by a Scorer, handed out so that a host is
+    fetched at most once every delay(host) seconds.
+
+    Every host with queued urls is either waiting, in a heap by the time it
+    may be fetched again, or runnable, in a heap by (throttled, host score,
+    score of its best url, time it became ready); hosts in `throttled` are
+    only fetched when no other host is ready. Each host keeps its urls in a heap by
+    (score, discovery order). A url whose score changes is pushed again and
+    its old entry is skipped when it reaches the top.
+
+    Not thread safe, and time is passed in so that the same code can run
+    against a simulated clock. '''
+    def __init__(self, scorer, delay):
+        self.scorer = scorer
+        self.delay = delay
+        self.throttled = set()
+        self.host_queues = dict()
+        # (score, sequence number) of the live entry of every queued url.
+        self.queued = dict()
+        self.waiting = list()
+        self.runnable = list()
+        self.runnable_keys = dict()
+        self.next_access = dict()
+        self.sequence = count()
+
+    def __len__(self):
+        return len(self.queued)
+
+    def __contains__(self, url):
+        return url in self.queued
+
+    def push(self, url, parent=None):
+        ''' Queues a new url. Returns False if it has no host. '''
+        domain = urlparse(url).netloc
+        if not domain:
+            return False
+        self.scorer.discovered(url, parent)
+        self._queue(url, domain)
+        return True
+
+    def requeue(self, url):
+        ''' Queues again a url handed out by pop but not fetched. The scorer
+        already knows its links, they are not counted again. '''
+        self._queue(url, urlparse(url).netloc)
+
+    def _queue(self, url, domain):
+        entry = (self.scorer.score(url), next(self.sequence), url)
+        self.queued[url] = entry[:2]
+        queue = self.host_queues.get(domain)
+        if queue is None:
+            self.host_queues[domain] = [entry]
+            heapq.heappush(
+                self.waiting, (self.next_access.get(domain, 0), domain))
+        else:
+            heapq.heappush(queue, entry)
+            self._improve(domain, entry[0])
+
+    def rediscover(self, url, parent=None):
+        ''' Tells the scorer about another link to url, re-queueing it if it
+        is still queued and its score changed. '''
+        if url not in self.queued or not self.scorer.discovered(url, parent):
+            return
+        score = self.scorer.score(url)
+        if score == self.queued[url][0]:
+            return
+        domain = urlparse(url).netloc
+        entry = (score, next(self.sequence), url)
+        self.queued[url] = entry[:2]
+        heapq.heappush(self.host_queues[domain], entry)
+        self._improve(domain, score)
+
+    def _improve(self, domain, score):
+        # A runnable host got a better url, re-key it.
+        key = self.runnable_keys.get(domain)
+        if key is not None and score < key[2]:
+            key = key[:2] + (score,) + key[3:]
+            self.runnable_keys[domain] = key
+            heapq.heappush(self.runnable, key)
+
+    def _head(self, domain):
+        # Best live entry of domain, dropping outdated ones on the way.
+        queue = self.host_queues[domain]
+        queued = self.queued
+        while queue and queued.get(queue[0][2]) != queue[0][:2]:
+            heapq.heappop(queue)
+        return queue[0] if queue else None
+
+    def pop(self, now):
+        ''' Returns the best url of the best host that may be fetched at
+        `now`, or None if no host may be fetched yet. '''
+        waiting = self.waiting
+        while waiting and waiting[0][0] <= now:
+            ready_at, domain = heapq.heappop(waiting)
+            if (domain not in self.host_queues or domain in self.runnable_keys
+                    or ready_at < self.next_access.get(domain, 0)):
+                # Outdated by defer or drop.
+                continue
+            head = self._head(domain)
+            key = (domain in self.throttled, self.scorer.host_score(domain),
+                   head[0], ready_at, domain)
+            self.runnable_keys[domain] = key
+            heapq.heappush(self.runnable, key)
+        while self.runnable:
+            key = heapq.heappop(self.runnable)
+            domain = key[-1]
+            if self.runnable_keys.get(domain) != key:
+                continue
+            del self.runnable_keys[domain]
+            self._head(domain)
+            url = heapq.heappop(self.host_queues[domain])[2]
+            del self.queued[url]
+            self.next_access[domain] = now + self.delay(domain)
+            if self._head(domain) is not None:
+                heapq.heappush(waiting, (self.next_access[domain], domain))
+            else:
+                del self.host_queues[domain]
+            return url
+        return None
+
+    def ready_at(self):
+        ''' When pop may return a url next, None if nothing is queued. Only
+        meaningful right after pop returned None. '''
+        return self.waiting[0][0] if self.waiting else None
+
+    def done(self, url):
+        self.scorer.fetched(url)
+
+    def defer(self, domain, until):
+        ''' Makes domain wait until `until` before its next fetch. '''
+        if until <= self.next_access.get(domain, 0):
+            return
+        self.next_access[domain] = until
+        if domain in self.host_queues:
+            self.runnable_keys.pop(domain, None)
+            heapq.heappush(self.waiting, (until, domain))
+
+    def drop(self, domain):
+        ''' Removes and returns the queued urls of domain. '''
+        queue = self.host_queues.pop(domain, None)
+        self.runnable_keys.pop(domain, None)
+        if queue is None:
+            return []
+        urls = list()
+        for score, sequence, url in queue:
+            if self.queued.get(url) == (score, sequence):
+                del self.queued[url]
+                urls.append(url)
+        return urls
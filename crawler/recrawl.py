@@ -0,0 +1,152 @@
+import json
+import math
+import time
+import hashlib
+
+from threading import Lock
+
+from utils import line_log
+from utils.dedup import digest64
+
+# In seconds, how often the scraped flags are saved, see FetchHistory.scraped.
+SCRAPED_SAVE_INTERVAL = 1
+
+
+class FetchHistory(object):
+    ''' What every page looked like the last time it was downloaded, for
+    recrawls (launch.py --recrawl).
+
+    For each url: the time of its first and last download, the number of
+    downloads, how many of them found the content changed, the ETag and
+    Last-Modified headers, a digest of the content and whether this content
+    was scraped (see scraped), so that a page downloaded but not scraped
+    before the crawler stopped is scraped the next time. Every download is
+    appended as a JSON line to a log next to the save file (see
+    utils.line_log), flushed to the OS with the scraped flags. Only kept
+    with FETCHHISTORY or --recrawl.
+
+    The cache server only takes a url, so conditional requests cannot be sent
+    through it: the headers and the digest are compared once the page is
+    downloaded, which still saves scraping pages that did not change. '''
+    def __init__(self, path, min_interval, max_interval):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.lock = Lock()
+        # url -> [first, last, downloads, changes, etag, last modified, digest,
+        #         scraped]
+        self.records = dict()
+        # Urls scraped since the last take_scraped.
+        self.unsaved = list()
+        self.next_save = 0
+        line_count, self.discarded_bytes = line_log.replay(self.path, self._decode)
+        if line_log.is_stale(line_count, len(self.records), 1000):
+            line_log.rewrite(self.path, (
+                self._line(url, record) for url, record in self.records.items()))
+        self.log = open(self.path, "a", encoding="utf-8")
+
+    def __len__(self):
+        return len(self.records)
+
+    def _decode(self, line):
+        url, *record = json.loads(line)
+        self.records[url] = record
+
+    @staticmethod
+    def _line(url, record):
+        return json.dumps([url] + record) + "\n"
+
+    def observe(self, url, resp):
+        ''' Records a download of url. Returns False if it is a 200 whose
+        ETag or Last-Modified, or else whose content, is the same as at the
+        previous download and was scraped then, True otherwise. '''
+        if resp.status != 200 or resp.raw_response is None:
+            return True
+        headers = resp.raw_response.headers
+        etag = headers.get("ETag") or ""
+        last_modified = headers.get("Last-Modified") or ""
+        previous = self.records.get(url)
+        if previous is not None and (
+                etag and etag == previous[4]
+                or last_modified and last_modified == previous[5]):
+            digest = previous[6]
+        else:
+            digest = digest64(hashlib.sha256(resp.raw_response.content).digest())
+        now = time.time()
+        if previous is None:
+            record = [now, now, 1, 0, etag, last_modified, digest, False]
+            changed = True
+        else:
+            changed = digest != previous[6]
+            # Records written before the flag existed count as not scraped.
+            scraped = not changed and len(previous) > 7 and previous[7]
+            record = [previous[0], now, previous[2] + 1, previous[3] + changed,
+                      etag, last_modified, digest, scraped]
+        with self.lock:
+            self.records[url] = record
+            self.log.write(self._line(url, record))
+        return not record[7]
+
+    def scraped(self, url, resp):
+        ''' Records that the content of url downloaded as resp (after an
+        observe) has been scraped. The flag is only saved by save_scraped,
+        once the stats of the page are logged: a page saved as scraped whose
+        stats were lost would never be scraped again. Returns whether
+        take_scraped is due. '''
+        if resp.status != 200 or resp.raw_response is None:
+            return False
+        with self.lock:
+            record = self.records.get(url)
+            if record is None or record[7]:
+                return False
+            record[7] = True
+            self.unsaved.append(url)
+            return time.monotonic() >= self.next_save
+
+    def take_scraped(self):
+        ''' The urls scraped since the last call, for save_scraped. '''
+        with self.lock:
+            urls, self.unsaved = self.unsaved, list()
+            self.next_save = time.monotonic() + SCRAPED_SAVE_INTERVAL
+            return urls
+
+    def save_scraped(self, urls):
+        ''' Saves the scraped flags of urls, from take_scraped. '''
+        with self.lock:
+            for url in urls:
+                record = self.records.get(url)
+                if record is not None and record[7]:
+                    self.log.write(self._line(url, record))
+            self.log.flush()
+
+    def revisit_interval(self, record):
+        ''' Seconds between downloads of a page, the inverse of its estimated
+        rate of change, within [min_interval, max_interval].
+
+        With n intervals between downloads of average length I, X of which
+        saw a change, the rate is -log((n - X + 0.5) / (n + 0.5)) / I (Cho
+        and Garcia-Molina), which unlike X / (n I) accounts for changes
+        missed between two downloads and is not 0 for pages seen once. '''
+        first, last, downloads, changes = record[:4]
+        intervals = downloads - 1
+        if intervals < 1 or last <= first:
+            return self.min_interval
+        average = (last - first) / intervals
+        rate = -math.log((intervals - changes + 0.5) / (intervals + 0.5)) / average
+        if rate <= 0:
+            return self.max_interval
+        return min(max(1 / rate, self.min_interval), self.max_interval)
+
+    def due(self, now):
+        ''' The urls due for a revisit at now, the longest overdue first. '''
+        due = list()
+        for url, record in self.records.items():
+            due_at = record[1] + self.revisit_interval(record)
+            if due_at <= now:
+                due.append((due_at, url))
+        due.sort()
+        return [url for _, url in due]
+
+    def close(self):
+        with self.lock:
+            self.log.close()
@@ -0,0 +1,233 @@
+import re
+import json
+import time
+import zlib
+
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils import line_log
+
+# A robots.txt answered with another status than 200 allows everything. Only
+# answers from the host itself are saved: connection errors (status 0), 5xx
+# and cache server errors (6xx) are tried again on the next run.
+SAVED_STATUSES = range(200, 500)
+# Sitemaps read per host, counting those listed by sitemap indexes.
+MAX_SITEMAPS = 5
+# Key of the wildcard rules in the nodes of RobotsRules.trie.
+PATTERNS = 0
+
+
+def parse_robots(text, user_agent):
+    ''' Returns the (allow, path) rules, the Crawl-delay (None if not given)
+    and the sitemap urls of a robots.txt for user_agent.
+
+    Rules come from the groups whose User-agent is the product token of
+    user_agent, its first word without a version (case insensitive, as in
+    RFC 9309), or from the "*" groups when there are none. Empty User-agent
+    values match no crawler. '''
+    agent = user_agent.split()[0].split("/")[0].lower() if user_agent.strip() else ""
+    groups = list()
+    sitemaps = list()
+    group = None
+    in_agents = False
+    for line in text.splitlines():
+        line = line.split("#", 1)[0]
+        field, colon, value = line.partition(":")
+        if not colon:
+            continue
+        field, value = field.strip().lower(), value.strip()
+        if field == "user-agent":
+            if not in_agents:
+                # [agents, rules, crawl delay]
+                group = [list(), list(), None]
+                groups.append(group)
+                in_agents = True
+            # Some sites give a version, which is not part of the token.
+            value = value.split("/")[0].strip()
+            if value:
+                group[0].append(value.lower())
+        elif field == "sitemap":
+            if value:
+                sitemaps.append(value)
+        elif group is not None:
+            in_agents = False
+            if field in ("allow", "disallow") and value:
+                group[1].append((field == "allow", value))
+            elif field == "crawl-delay":
+                try:
+                    group[2] = max(float(value), 0.0)
+                except ValueError:
+                    pass
+    chosen = [g for g in groups if agent and agent in g[0] and agent != "*"]
+    if not chosen:
+        chosen = [g for g in groups if "*" in g[0]]
+    rules = [rule for g in chosen for rule in g[1]]
+    delays = [g[2] for g in chosen if g[2] is not None]
+    return rules, (delays[0] if delays else None), sitemaps
+
+
+class RobotsRules(object):
+    ''' The rules of one host's robots.txt for our user agent, compiled once.
+
+    Rules go into a character trie that is walked once along the path of a
+    url, so checking it takes time linear in the length of the path however
+    many rules there are. Rules with "*" or "$" are compiled to regular
+    expressions, hung in the trie at the text before their first "*", and
+    only tried when the path starts with that text. As in RFC 9309 the
+    longest matching rule decides, Allow wins ties, and a path no rule
+    matches is allowed. '''
+    __slots__ = ("trie", "crawl_delay", "sitemaps")
+
+    def __init__(self, text="", user_agent=""):
+        rules, self.crawl_delay, self.sitemaps = parse_robots(text, user_agent)
+        # Nested dicts keyed by character. At a node, None maps to the plain
+        # rule ending there and PATTERNS to the wildcard rules starting there.
+        self.trie = dict()
+        for allow, path in rules:
+            prefix, star, _ = path.partition("*")
+            anchored = path.endswith("$")
+            if not star and anchored:
+                prefix = path[:-1]
+            node = self.trie
+            for char in prefix:
+                node = node.setdefault(char, dict())
+            if star or anchored:
+                pattern = ".*".join(map(re.escape, path.rstrip("$").split("*")))
+                match = re.compile(pattern + ("\\Z" if anchored else "")).match
+                node.setdefault(PATTERNS, list()).append((len(path), allow, match))
+            else:
+                node[None] = node.get(None, False) or allow
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        length, allow = 0, True
+        node = self.trie
+        patterns = node.get(PATTERNS, ())
+        for i, char in enumerate(path):
+            node = node.get(char)
+            if node is None:
+                break
+            rule = node.get(None)
+            if rule is not None:
+                length, allow = i + 1, rule
+            if PATTERNS in node:
+                patterns = [*patterns, *node[PATTERNS]]
+        for pattern_length, pattern_allow, match in patterns:
+            if (pattern_length > length or pattern_length == length and pattern_allow
+                    and not allow) and match(path):
+                length, allow = pattern_length, pattern_allow
+        return allow
+
+
+def sitemap_content(content, limit):
+    ''' content, gunzipped if it is compressed (sitemap.xml.gz), to at most
+    limit bytes (0 for no limit). '''
+    if content[:2] != b"\x1f\x8b":
+        return content
+    try:
+        # 16 + MAX_WBITS reads the gzip header.
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(content, limit)
+    except zlib.error:
+        return b""
+
+
+class SitemapRead(object):
+    ''' The sitemaps of one host, read one at a time: the queue of sitemaps,
+    which grows with those the sitemap indexes list, and the (url, lastmod)
+    entries read so far. At most MAX_SITEMAPS are read. '''
+    def __init__(self, sitemaps):
+        self.queue = list(sitemaps)
+        self.read_count = 0
+        self.entries = list()
+
+    @property
+    def done(self):
+        return self.read_count == min(len(self.queue), MAX_SITEMAPS)
+
+    def next_sitemap(self):
+        self.read_count += 1
+        return self.queue[self.read_count - 1]
+
+    def add(self, urls, indexed):
+        self.entries.extend(urls)
+        self.queue.extend(indexed)
+
+    def newest(self):
+        ''' The entries, most recently modified first, pages without lastmod
+        last. '''
+        return sorted(self.entries, key=lambda entry: entry[1], reverse=True)
+
+
+class RobotsCache(object):
+    ''' robots.txt of every host met, fetched once per host (see
+    Frontier._read_robots) and kept for `expiry` seconds.
+
+    Fetches are appended as JSON lines (domain, time, status and text) to a
+    log next to the save file (see utils.line_log), so a resumed crawl does
+    not fetch them again. Rules are compiled the first time a host is looked
+    up. '''
+    def __init__(self, path, user_agent, expiry):
+        self.logger = get_logger("ROBOTS")
+        self.path = path
+        self.user_agent = user_agent
+        self.expiry = expiry
+        self.lock = Lock()
+        # domain -> [time fetched, status, text until compiled]
+        self.records = dict()
+        self.rules = dict()
+        line_count, discarded_bytes = line_log.replay(self.path, self._decode)
+        if discarded_bytes:
+            self.logger.warning(
+                f"Recovered {self.path} after an unclean shutdown, discarded "
+                f"{discarded_bytes} bytes of incomplete records.")
+        if line_log.is_stale(line_count, len(self.records), 100):
+            line_log.rewrite(self.path, (
+                self._line(domain, *record) for domain, record in self.records.items()))
+        self.log = open(self.path, "a", encoding="utf-8")
+
+    def _decode(self, line):
+        domain, fetched, status, text = json.loads(line)
+        self.records[domain] = [fetched, status, text]
+
+    @staticmethod
+    def _line(domain, fetched, status, text):
+        return json.dumps([domain, fetched, status, text]) + "\n"
+
+    def compile(self, status, text):
+        ''' The rules of a robots.txt fetched with status. '''
+        if status == 200:
+            return RobotsRules(text, self.user_agent)
+        return RobotsRules()
+
+    def get(self, domain):
+        ''' The rules of domain, None if its robots.txt was never fetched or
+        is older than expiry. '''
+        record = self.records.get(domain)
+        if record is None or record[0] + self.expiry < time.time():
+            return None
+        rules = self.rules.get(domain)
+        if rules is None:
+            rules = self.rules[domain] = self.compile(record[1], record[2])
+            # Only needed to compile, and to rewrite the log on open.
+            record[2] = None
+        return rules
+
+    def add(self, domain, status, text, rules):
+        ''' Records domain's robots.txt, fetched now with status, and its
+        compiled rules. '''
+        fetched = time.time()
+        self.records[domain] = [fetched, status, None]
+        self.rules[domain] = rules
+        if status in SAVED_STATUSES:
+            with self.lock:
+                self.log.write(self._line(domain, fetched, status, text))
+                self.log.flush()
+
+    def close(self):
+        with self.lock:
+            self.log.close()
@@ -0,0 +1,253 @@
+import zlib
+
+from functools import partial
+from threading import Thread, Lock
+from urllib.parse import urlparse
+from multiprocessing import Process, Queue, Value, Barrier
+
+from crawler import Crawler
+from crawler.frontier import Frontier
+from crawler.worker import Worker
+from utils import get_logger
+import scraper
+
+
+def shard_of(url, shards):
+    # crc32 rather than hash() so that every process agrees on the owner.
+    return zlib.crc32(urlparse(url).netloc.encode("utf-8")) % shards
+
+
+class ShardFrontier(Frontier):
+    ''' Frontier holding the hosts owned by one of several crawler processes.
+
+    Urls of hosts owned by another shard are sent to that shard's inbox.
+    outstanding is shared by all shards and counts urls queued or being
+    downloaded in any shard plus urls in transit between shards, so a shard
+    only stops once every shard has run dry. '''
+    def __init__(self, config, restart, shard_id, inboxes, outstanding):
+        self.shard_id = shard_id
+        self.inboxes = inboxes
+        self.outstanding = outstanding
+        super().__init__(config, restart)
+        self.idle_wait = 0.5
+        self.receiver = Thread(target=self._receive_urls, daemon=True)
+        self.receiver.start()
+
+    def _count(self, delta):
+        with self.outstanding.get_lock():
+            self.outstanding.value += delta
+
+    def _receive_urls(self):
+        inbox = self.inboxes[self.shard_id]
+        while True:
+            url = inbox.get()
+            Frontier.add_url(self, url)
+            # Counted by the sender, and by _enqueue again if it was new.
+            self._count(-1)
+
+    def _enqueue(self, url, parent=None):
+        queued = super()._enqueue(url, parent)
+        if queued:
+            self._count(1)
+        return queued
+
+    def _drop_host(self, domain):
+        dropped = super()._drop_host(domain)
+        self._count(-dropped)
+        return dropped
+
+    def _disallow(self, url):
+        try:
+            super()._disallow(url)
+        finally:
+            self._count(-1)
+
+    def _start_read(self, domain, read):
+        # Counted so that no shard stops before the sitemap urls are added.
+        super()._start_read(domain, read)
+        self._count(1)
+
+    def _finish_read(self, domain):
+        super()._finish_read(domain)
+        self._count(-1)
+
+    def _finished(self):
+        return not self.outstanding.value
+
+    def add_url(self, url, parent=None):
+        owner = shard_of(url, len(self.inboxes))
+        if owner == self.shard_id:
+            super().add_url(url, parent)
+        else:
+            self._count(1)
+            self.inboxes[owner].put(url)
+
+    def mark_url_complete(self, url):
+        super().mark_url_complete(url)
+        self._count(-1)
+
+
+class _DedupChannel(object):
+    ''' One shard's end of the duplicate checks served by the parent process
+    (see _serve_dedup). Requests go to the queue shared by all shards and the
+    answers come back on the shard's own queue, one request at a time so
+    that every thread gets its own answer. '''
+    def __init__(self, shard_id, requests, replies):
+        self.shard_id = shard_id
+        self.requests = requests
+        self.replies = replies[shard_id]
+        self.lock = Lock()
+
+    def ask(self, kind, value, distance=None):
+        with self.lock:
+            self.requests.put((self.shard_id, kind, value, distance))
+            return self.replies.get()
+
+    def tell(self, kind, value):
+        self.requests.put((self.shard_id, kind, value, None))
+
+
+class SharedDigests(object):
+    ''' Stands in for scraper.page_hashes (a DigestSet) in a shard. The
+    digests are held and saved by the parent process. '''
+    def __init__(self, channel):
+        self.channel = channel
+
+    def __contains__(self, digest):
+        return self.channel.ask("contains", digest)
+
+    def add(self, digest):
+        return self.channel.ask("digest", digest)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SharedSimhashIndex(object):
+    ''' Stands in for scraper.simhash_index (a SimhashIndex) in a shard. The
+    fingerprints are held and saved by the parent process. '''
+    def __init__(self, channel):
+        self.channel = channel
+
+    def add(self, fingerprint):
+        self.channel.tell("fingerprint", fingerprint)
+
+    def add_if_new(self, fingerprint, k):
+        return self.channel.ask("near", fingerprint, k)
+
+    def save(self, path):
+        pass
+
+
+def _serve_dedup(requests, replies):
+    # Checks the pages of every shard against each other with the parent
+    # process' scraper.page_hashes and scraper.simhash_index, until a None
+    # request. The fingerprints are saved every scraper.save_frequency new ones.
+    unsaved = 0
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        shard_id, kind, value, distance = request
+        if kind == "digest":
+            replies[shard_id].put(scraper.page_hashes.add(value))
+            continue
+        if kind == "contains":
+            replies[shard_id].put(value in scraper.page_hashes)
+            continue
+        if kind == "near":
+            near = scraper.simhash_index.add_if_new(value, distance)
+            replies[shard_id].put(near)
+            if near is not None:
+                continue
+        else:
+            scraper.simhash_index.add(value)
+        unsaved += 1
+        if unsaved >= scraper.save_frequency:
+            scraper.simhash_index.save(scraper.simhash_file)
+            unsaved = 0
+
+
+def _run_shard(shard_id, config, restart, inboxes, outstanding, barrier,
+               results, worker_factory, requests, replies):
+    snapshot = None
+    try:
+        channel = _DedupChannel(shard_id, requests, replies)
+        scraper.use_shard(shard_id, restart, dedup=(
+            SharedDigests(channel), SharedSimhashIndex(channel)))
+        config.save_file = f"{config.save_file}.shard{shard_id}"
+        if config.archive and not config.replay:
+            # Replays read the archives of every process.
+            config.archive = f"{config.archive}.shard{shard_id}"
+        if config.metrics_port:
+            config.metrics_port += shard_id
+        frontier_factory = partial(
+            ShardFrontier, shard_id=shard_id, inboxes=inboxes,
+            outstanding=outstanding)
+        crawler = Crawler(
+            config, restart, frontier_factory=frontier_factory,
+            worker_factory=worker_factory)
+        # Nobody may decide the crawl is over before every shard has loaded
+        # its save file and sent out its seeds.
+        barrier.wait()
+        try:
+            crawler.start()
+        finally:
+            # Processes started by multiprocessing exit without running the
+            # atexit hooks, log what the threads recorded since their last
+            # merge here, also when stopped with Ctrl-C.
+            scraper.stats.flush()
+        scraper.filter_log.close()
+        snapshot = scraper.stats_snapshot()
+    finally:
+        results.put(snapshot)
+
+
+def crawl_sharded(config, restart, processes, worker_factory=Worker):
+    ''' Crawls with `processes` crawler processes, each owning the hosts
+    hashed to it, and merges their stats into stats.json at the end.
+
+    Duplicate pages are detected across processes: this process holds the
+    page hashes and fingerprints of every page (in page_hashes.bin and
+    simhashes.bin, like a crawl in one process) and checks the pages of
+    every shard against them. '''
+    logger = get_logger("CRAWLER")
+    if restart:
+        scraper.reset_stats()
+    inboxes = [Queue() for _ in range(processes)]
+    outstanding = Value("q", 0)
+    barrier = Barrier(processes)
+    results = Queue()
+    requests = Queue()
+    replies = [Queue() for _ in range(processes)]
+    shards = [
+        Process(target=_run_shard, args=(
+            shard_id, config, restart, inboxes, outstanding, barrier,
+            results, worker_factory, requests, replies))
+        for shard_id in range(processes)]
+    for shard in shards:
+        shard.start()
+    # Started after the shards, so that no process is forked while it holds
+    # a lock of the duplicate checks.
+    server = Thread(target=_serve_dedup, args=(requests, replies), daemon=True)
+    server.start()
+    # Collect results before joining, a process does not exit while the data
+    # it put in a queue has not been read.
+    snapshots = [results.get() for _ in shards]
+    for shard in shards:
+        shard.join()
+    requests.put(None)
+    server.join()
+    scraper.simhash_index.save(scraper.simhash_file)
+    scraper.page_hashes.flush()
+
+    scraper.clear_stats()
+    for snapshot in snapshots:
+        if snapshot is None:
+            logger.error("A crawler process failed, its stats are not merged.")
+        else:
+            scraper.merge_stats(snapshot)
+    scraper.save_stats()
@@ -0,0 +1,227 @@
+import os
+import json
+import shelve
+
+from threading import Thread, Lock, Event
+
+from utils import get_logger
+from utils import line_log
+
+
+class ShelveStore(object):
+    ''' Default frontier store. Every write is synced to disk immediately. '''
+    # Lookups may go to disk, so the frontier keeps a Bloom filter in front.
+    index_in_memory = False
+
+    def __init__(self, config):
+        self.save = shelve.open(config.save_file)
+        self.discarded_bytes = 0
+        # Called before every write reaches the disk, see PendingLog.
+        self.before_commit = None
+
+    def __contains__(self, urlhash):
+        return urlhash in self.save
+
+    def __len__(self):
+        return len(self.save)
+
+    def __getitem__(self, urlhash):
+        return self.save[urlhash]
+
+    def __setitem__(self, urlhash, record):
+        if self.before_commit is not None:
+            self.before_commit()
+        self.save[urlhash] = record
+        self.save.sync()
+
+    def keys(self):
+        return self.save.keys()
+
+    def values(self):
+        return self.save.values()
+
+    def close(self):
+        self.save.close()
+
+
+class LogStore(object):
+    ''' Append-only log of (urlhash, url, completed) records.
+
+    Writes are buffered and committed as a group, either when
+    config.store_batch records are pending or every config.store_interval
+    seconds, whichever comes first; before_commit, if set, is called before
+    each group is written. Opened with utils.line_log.replay, and compacted
+    when stale. '''
+    index_in_memory = True
+
+    def __init__(self, config):
+        self.logger = get_logger("STORE")
+        self.path = config.save_file
+        self.batch_size = config.store_batch
+        self.interval = config.store_interval
+        self.records = dict()
+        self.pending = list()
+        self.lock = Lock()
+        self.closed = Event()
+        self.before_commit = None
+
+        line_count, self.discarded_bytes = line_log.replay(self.path, self._decode)
+        if line_log.is_stale(line_count, len(self.records), self.batch_size):
+            self._compact()
+        self.log = open(self.path, "ab")
+        self.flusher = Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def _decode(self, line):
+        urlhash, url, completed = json.loads(line)
+        self.records[urlhash] = (url, bool(completed))
+
+    def _compact(self):
+        line_log.rewrite(self.path, (
+            self._line(urlhash, url, completed)
+            for urlhash, (url, completed) in self.records.items()), sync=True)
+        self.logger.info(
+            f"Compacted {self.path} to {len(self.records)} records.")
+
+    @staticmethod
+    def _line(urlhash, url, completed):
+        return json.dumps([urlhash, url, int(completed)]) + "\n"
+
+    def __contains__(self, urlhash):
+        return urlhash in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, urlhash):
+        return self.records[urlhash]
+
+    def __setitem__(self, urlhash, record):
+        url, completed = record
+        with self.lock:
+            self.records[urlhash] = (url, completed)
+            self.pending.append(self._line(urlhash, url, completed).encode("utf-8"))
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+
+    def keys(self):
+        return self.records.keys()
+
+    def values(self):
+        return self.records.values()
+
+    def _flush(self):
+        # Must be called with self.lock held.
+        if not self.pending:
+            return
+        if self.before_commit is not None:
+            self.before_commit()
+        self.log.write(b"".join(self.pending))
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.pending = list()
+
+    def _flush_periodically(self):
+        while not self.closed.wait(self.interval):
+            with self.lock:
+                self._flush()
+
+    def close(self):
+        self.closed.set()
+        self.flusher.join()
+        with self.lock:
+            self._flush()
+            self.log.close()
+
+
+class PendingLog(object):
+    ''' Append-only log of the urls queued in the frontier, kept next to the
+    save file so that a restart reads the urls left to download without
+    going through every url ever discovered.
+
+    A "+" line (rules version, urlhash and url, tab separated) records that
+    url was queued after passing that version of the filter rules, a "-"
+    line with a urlhash that it is done. Lines are buffered until flush(),
+    which the frontier has its store call before each commit: a url the
+    save file has as queued is then in the log too, even if the crawler is
+    killed, without a write per url under the frontier lock. Opened with
+    utils.line_log.replay. Urls queued under other rules than `version` are
+    checked with validate(url) again, and forgotten if they fail. The log is
+    rewritten when that changed anything or when it is stale. '''
+    def __init__(self, path, version, validate):
+        self.path = path
+        self.lock = Lock()
+        self.pending = dict()
+        line_count, self.discarded_bytes = line_log.replay(self.path, self._decode)
+        self.revalidated = 0
+        for urlhash, (url, url_version) in list(self.pending.items()):
+            if url_version != version:
+                self.revalidated += 1
+                if validate(url):
+                    self.pending[urlhash] = (url, version)
+                else:
+                    del self.pending[urlhash]
+        if self.revalidated or line_log.is_stale(line_count, len(self.pending), 1000):
+            line_log.rewrite(self.path, (
+                self._line(urlhash, url, url_version)
+                for urlhash, (url, url_version) in self.pending.items()))
+        self.log = open(self.path, "a", encoding="utf-8")
+
+    def _decode(self, line):
+        record = line[:-1].decode("utf-8")
+        if record.startswith("+"):
+            version, urlhash, url = record[1:].split("\t", 2)
+            self.pending[urlhash] = (url, version)
+        else:
+            self.pending.pop(record[1:], None)
+
+    def drain(self):
+        ''' Returns the urls found pending on open, in the order they were
+        queued, and forgets them. '''
+        pending, self.pending = self.pending, dict()
+        return [url for url, _ in pending.values()]
+
+    @staticmethod
+    def _line(urlhash, url, version):
+        return f"+{version}\t{urlhash}\t{url}\n"
+
+    def add(self, urlhash, url, version):
+        with self.lock:
+            self.log.write(self._line(urlhash, url, version))
+
+    def remove(self, urlhash):
+        with self.lock:
+            self.log.write(f"-{urlhash}\n")
+
+    def flush(self):
+        ''' Writes the buffered lines to the OS. '''
+        with self.lock:
+            self.log.flush()
+
+    def close(self):
+        with self.lock:
+            self.log.close()
+
+
+def store_files(config):
+    ''' The existing files of the save file. Depending on the dbm module
+    shelve uses, they have the name of the save file or add a suffix. '''
+    paths = [config.save_file] + [
+        f"{config.save_file}{suffix}" for suffix in (".db", ".dat", ".dir", ".bak")]
+    return [path for path in paths if os.path.exists(path)]
+
+
+STORES = {
+    "shelve": ShelveStore,
+    "log": LogStore,
+}
+
+
+def open_store(config):
+    try:
+        store_factory = STORES[config.store]
+    except KeyError:
+        raise ValueError(
+            f"Unknown frontier store {config.store!r}, "
+            f"expected one of {', '.join(STORES)}.")
+    return store_factory(config)
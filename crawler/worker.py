@@ -1,11 +1,12 @@
+import time
+
 from threading import Thread
 
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
 import scraper
-import time
-from urllib.parse import urlparse
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
@@ -19,30 +20,43 @@ class Worker(Thread):
         
     def run(self):
         while True:
-            tbd_url = self.frontier.get_tbd_url()
+            try:
+                tbd_url = self.frontier.get_tbd_url()
+            except Exception:
+                self.logger.exception("Could not get a url from the frontier.")
+                scraper.save_stats()
+                break
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 scraper.save_stats()
                 break
 
-            if not isinstance(tbd_url, str):
-                self.logger.warning(f"Skipping invalid URL object: {tbd_url}")
-                continue
-
-            parsed = urlparse(tbd_url)
-            domain = parsed.netloc
-
-            if not domain:
-                self.logger.warning(f"Skipping URL with no domain: {tbd_url}")
-                continue
-
-            self.frontier.wait_until_access_allowed(domain)
-
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
+            try:
+                start = time.perf_counter()
+                with metrics.timer("download"):
+                    resp = download(tbd_url, self.config, self.logger)
+                latency = time.perf_counter() - start
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.")
+                changed = self.frontier.content_changed(tbd_url, resp)
+                if changed:
+                    with metrics.timer("scrape"):
+                        scraped_urls = scraper.scraper(tbd_url, resp)
+                    duplicate = scraper.was_duplicate()
+                else:
+                    # Same page as at its last download: already scraped.
+                    scraped_urls, duplicate = [], False
+                    metrics.count("unchanged_pages")
+                metrics.count("pages")
+                self.frontier.report_fetch(tbd_url, resp.status, latency, duplicate)
+                for scraped_url in scraped_urls:
+                    self.frontier.add_url(scraped_url, tbd_url)
+                if changed:
+                    # Only once its links are in the frontier, a crawl killed
+                    # before then scrapes the page again on resume.
+                    self.frontier.mark_scraped(tbd_url, resp)
+            except Exception:
+                self.logger.exception(f"Failed to process {tbd_url}.")
+            # Always release the url, otherwise the frontier never drains.
             self.frontier.mark_url_complete(tbd_url)
@@ -1,23 +1,53 @@
-from configparser import ConfigParser
-from argparse import ArgumentParser
-
-from utils.server_registration import get_cache_server
-from utils.config import Config
-from crawler import Crawler
-
-
-def main(config_file, restart):
-    cparser = ConfigParser()
-    cparser.read(config_file)
-    config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
-
-
-if __name__ == "__main__":
-    parser = ArgumentParser()
-    parser.add_argument("--restart", action="store_true", default=False)
-    parser.add_argument("--config_file", type=str, default="config.ini")
-    args = parser.parse_args()
-    main(args.config_file, args.restart)
+from configparser import ConfigParser
+from argparse import ArgumentParser
+
+from utils.server_registration import get_cache_server
+from utils.config import Config
+from crawler import Crawler
+from crawler.worker import Worker
+from crawler.shard import crawl_sharded
+import scraper
+
+
+def main(config_file, restart, engine, processes, replay, recrawl):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    if recrawl:
+        if restart:
+            raise ValueError("--recrawl needs the fetch history that --restart deletes.")
+        config.recrawl = config.fetch_history = True
+    if replay:
+        if not config.archive:
+            raise ValueError("Set ARCHIVE in the config file to replay a crawl.")
+        # Pages come from the archive, no need to wait between them.
+        config.replay = True
+        config.time_delay = config.max_delay = 0
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    if engine == "async":
+        # Imported here so that aiohttp is only needed by the async engine.
+        from crawler.async_worker import AsyncWorker
+        worker_factory = AsyncWorker
+    else:
+        worker_factory = Worker
+    if processes > 1:
+        crawl_sharded(config, restart, processes, worker_factory)
+    else:
+        if restart:
+            scraper.reset_stats()
+        crawler = Crawler(config, restart, worker_factory=worker_factory)
+        crawler.start()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--restart", action="store_true", default=False)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--replay", action="store_true", default=False)
+    parser.add_argument("--recrawl", action="store_true", default=False)
+    args = parser.parse_args()
+    main(args.config_file, args.restart, args.engine, args.processes, args.replay,
+         args.recrawl)
@@ -0,0 +1,35 @@
+import json
+import os
+
+from argparse import ArgumentParser
+from glob import glob
+
+from utils.report import build_report
+
+
+def main(paths, processes, memory, output):
+    if not paths:
+        paths = [path for path in ["pages.log"] + sorted(glob("pages.shard*.log"))
+                 if os.path.exists(path)]
+    if not paths:
+        raise SystemExit("No page logs found, run the crawler first.")
+    report = build_report(paths, processes=processes, memory=memory * 1024 * 1024)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Crawl report (unique pages, longest page, top 50 words "
+                    "and subdomains) from the page logs of one or more runs.")
+    parser.add_argument("paths", nargs="*",
+                        help="page logs, by default pages.log and pages.shard*.log")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--memory", type=int, default=256,
+                        help="MB of page records each process holds at a time")
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+    main(args.paths, args.processes, args.memory, args.output)
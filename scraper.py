@@ -1,77 +1,211 @@
 import re
-from bs4 import BeautifulSoup
+import atexit
 from urllib.parse import urlparse, urldefrag, urljoin
 from PartA import tokenize
+from utils.parse import parse_page
+from utils.url_filter import UrlFilter, repeated_segments
+from utils.filter_log import FilterLog
 import json
-from collections import Counter, defaultdict
+from collections import Counter
 import hashlib
 import os
+import time
+from threading import Lock, local
+from utils.simhash import simhash, SimhashIndex
+from utils.dedup import DigestSet, digest64
+from utils.stats import CrawlStats, subdomain_of
+from utils.metrics import metrics
 
 with open("stopwords.txt", "r", encoding="utf-8") as f:
     stopwords = set(w.strip() for w in f.readlines())
 
-word_counter = Counter()
-subdomain_counter = defaultdict(int)
-word_in_page = dict()
-most_word_in_page = ("", 0)
-
 stats_file = "stats.json"
+stats_log_file = "stats.log"
+# One line per unique page with its word frequencies, the input of report.py.
+pages_file = "pages.log"
+simhash_file = "simhashes.bin"
+page_hash_file = "page_hashes.bin"
 save_frequency = 100
-
-page_hashes = set()  # ← Exact duplicate detection
-simhashes = set()
+# In seconds, at most this much of the stats is lost if the crawler is killed.
+save_interval = 1
+# In seconds, how often stats.json is rewritten with the running totals.
+summary_interval = 10
+summary_lock = Lock()
+next_summary = 0
+
+stats = CrawlStats(stats_log_file, merge_every=save_frequency, page_log_path=pages_file,
+                   merge_interval=save_interval)
+
+# Rejected and duplicate urls. Set FILTER_LOG_SAMPLE_RATE to 0 to keep only the
+# per-reason counters saved with the stats.
+FILTER_LOG_FILE = "filtered_urls.log"
+FILTER_LOG_SAMPLE_RATE = 1.0
+FILTER_LOG_JSONL = False
+filter_log = FilterLog(FILTER_LOG_FILE, sample_rate=FILTER_LOG_SAMPLE_RATE, jsonl=FILTER_LOG_JSONL)
+
+# Set to a file name to record the valid links of every page as JSON lines,
+# the link graph replayed by benchmarks/frontier_order.py.
+LINK_GRAPH_FILE = None
+link_graph_lock = Lock()
+
+# Whether the last page this thread scraped was rejected as a duplicate.
+last_page = local()
+
+# ← Exact duplicate detection, opened on page_hash_file by load_stats
+page_hashes = DigestSet()
+simhash_index = SimhashIndex()
+# Set by use_shard when page_hashes and simhash_index are stand-ins for those
+# of the parent process, shared by every process of the crawl.
+shared_dedup = False
 
 
 def load_stats():
-    global word_counter, subdomain_counter, word_in_page, most_word_in_page
-    if os.path.exists(stats_file):
-        try:
-            with open(stats_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                word_counter.update(dict(data.get("top_50_words", [])))
-                subdomain_counter.update(data.get("subdomains", {}))
-                word_in_page.update(data.get("word_in_page", {}))
-                most = data.get("most_word_in_page", {})
-                if most and most.get("url") and most.get("word_count", 0) > most_word_in_page[1]:
-                    most_word_in_page = (most["url"], most["word_count"])
-            print(f"[STATS] Cargadas estadísticas desde {stats_file}")
-        except Exception as e:
-            print(f"[STATS] Error al cargar {stats_file}: {e}")
+    global page_hashes
+    if stats.load():
+        print(f"[STATS] Cargadas estadísticas desde {stats_log_file}")
+    elif stats.load_pages(pages_file):
+        stats.compact()
+        print(f"[STATS] Cargadas estadísticas desde {pages_file}")
+    elif os.path.exists(stats_file):
+        _load_legacy_stats()
+    if not shared_dedup:
+        simhash_index.load(simhash_file)
+        page_hashes.close()
+        page_hashes = DigestSet(page_hash_file)
+
+
+def _load_legacy_stats():
+    # Stats saved before stats_log_file existed. They only hold the top 50
+    # words, so word counts are only exact for those words. Summaries saved
+    # since then have no word_in_page and are left alone: their pages are in
+    # stats_log_file, or were deleted with it.
+    try:
+        with open(stats_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if "word_in_page" not in data:
+            return
+        most = data.get("most_word_in_page") or {}
+        stats.merge({
+            "words": dict(data.get("top_50_words", [])),
+            "subdomains": data.get("subdomains", {}),
+            "pages": data.get("word_in_page", {}),
+            "longest": [most.get("url", ""), most.get("word_count", 0)],
+        })
+        stats.compact()
+        print(f"[STATS] Cargadas estadísticas desde {stats_file} "
+              f"(solo las 50 palabras más frecuentes)")
+    except Exception as e:
+        print(f"[STATS] Error al cargar {stats_file}: {e}")
+
+
+def _write_summary():
+    summary = stats.summary()
+    summary["filtered"] = filter_log.snapshot()
+    # Replaced at once, it may be read while the crawl runs.
+    tmp_file = f"{stats_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_file, stats_file)
+    return summary
+
+
+def _write_summary_periodically():
+    # Called after a merge, writes stats.json if summary_interval passed.
+    global next_summary
+    if time.monotonic() < next_summary or not summary_lock.acquire(blocking=False):
+        return
+    try:
+        _write_summary()
+        next_summary = time.monotonic() + summary_interval
+    finally:
+        summary_lock.release()
 
 
 def save_stats():
-    stats = {
-        "unique_pages": len(word_in_page),
-        "most_word_in_page": {
-            "url": most_word_in_page[0],
-            "word_count": most_word_in_page[1]
-        },
-        "top_50_words": word_counter.most_common(50),
-        "subdomains": dict(sorted(subdomain_counter.items())),
-        "word_in_page": word_in_page
-    }
-    with open(stats_file, "w", encoding="utf-8") as f:
-        json.dump(stats, f, indent=2)
-    print(f"[STATS] Stats saved in {stats_file} | Unique pages: {len(word_in_page)}")
-
-
-def simhash(tokens):
-    hashbits = 64
-    v = [0] * hashbits
-    for token in tokens:
-        h = int(hashlib.md5(token.encode('utf-8')).hexdigest(), 16)
-        for i in range(hashbits):
-            bitmask = 1 << i
-            v[i] += 1 if h & bitmask else -1
-    fingerprint = 0
-    for i in range(hashbits):
-        if v[i] > 0:
-            fingerprint |= 1 << i
-    return fingerprint
-
-
-def hamming_distance(x, y):
-    return bin(x ^ y).count('1')
+    with summary_lock:
+        summary = _write_summary()
+    simhash_index.save(simhash_file)
+    page_hashes.flush()
+    print(f"[STATS] Stats saved in {stats_file} | Unique pages: {summary['unique_pages']}")
+
+
+def _save_on_exit():
+    # Workers are daemon threads: a crawl stopped with Ctrl-C does not get
+    # to save_stats, log what its threads recorded since their last merge.
+    stats.flush()
+    simhash_index.save(simhash_file)
+    page_hashes.flush()
+
+
+atexit.register(_save_on_exit)
+
+
+def use_shard(shard_id, restart=False, dedup=None):
+    ''' Switches this process to its own stats, simhash and filter log files
+    and loads them (or deletes them on restart), for crawls split across
+    processes. With dedup, a (page_hashes, simhash_index) pair checking pages
+    against those of every process (see crawler.shard), this process keeps
+    no duplicate detection files of its own. '''
+    global stats_file, stats_log_file, pages_file, simhash_file, page_hash_file
+    global filter_log, stats, page_hashes, simhash_index, shared_dedup
+    stats_file = f"stats.shard{shard_id}.json"
+    stats_log_file = f"stats.shard{shard_id}.log"
+    pages_file = f"pages.shard{shard_id}.log"
+    simhash_file = f"simhashes.shard{shard_id}.bin"
+    page_hash_file = f"page_hashes.shard{shard_id}.bin"
+    filter_log = FilterLog(
+        f"filtered_urls.shard{shard_id}.log",
+        sample_rate=FILTER_LOG_SAMPLE_RATE, jsonl=FILTER_LOG_JSONL)
+    stats = CrawlStats(stats_log_file, merge_every=save_frequency, page_log_path=pages_file,
+                       merge_interval=save_interval)
+    if dedup is not None:
+        # Not closed, a forked process shares the parent's mapping.
+        page_hashes, simhash_index = dedup
+        shared_dedup = True
+    if restart:
+        reset_stats()
+    else:
+        clear_stats()
+        load_stats()
+
+
+def reset_stats():
+    ''' Forgets the stats of previous runs, for crawls restarted from the
+    seed urls. '''
+    global page_hashes
+    clear_stats()
+    stats.discard()
+    if os.path.exists(stats_file):
+        os.remove(stats_file)
+    if shared_dedup:
+        return
+    for path in (simhash_file, page_hash_file):
+        if os.path.exists(path):
+            os.remove(path)
+    page_hashes.close()
+    page_hashes = DigestSet(page_hash_file)
+
+
+def clear_stats():
+    global simhash_index, page_hashes
+    stats.clear()
+    if shared_dedup:
+        return
+    page_hashes.close()
+    page_hashes = DigestSet()
+    simhash_index = SimhashIndex()
+
+
+def stats_snapshot():
+    snapshot = stats.snapshot()
+    snapshot["filtered"] = filter_log.snapshot()
+    return snapshot
+
+
+def merge_stats(snapshot):
+    ''' Adds the stats of another process (see stats_snapshot) to ours. '''
+    stats.merge(snapshot)
+    filter_log.counts.update(snapshot["filtered"])
 
 
 # ← Cargar stats al inicio
@@ -79,166 +213,176 @@ load_stats()
 
 
 def scraper(url, resp):
-    links = extract_next_links(url, resp)
-    return [link for link in links if is_valid(link)]
+    # extract_next_links only returns links that passed is_valid.
+    return extract_next_links(url, resp)
 
 
-def extract_next_links(url, resp):
+def is_html(resp):
     if resp.status != 200 or not resp.raw_response:
-        return []
-
+        return False
     content_type = resp.raw_response.headers.get('content-type')
-    if not content_type or "text/html" not in content_type.lower():
-        return []
-
-    soup = BeautifulSoup(resp.raw_response.content, 'lxml')
-    text = soup.get_text(separator=" ", strip=True).lower()
-    raw_tokens = tokenize(text)
-    tokens = [t for t in raw_tokens if t not in stopwords and len(t) > 1 and not t.isdigit()]
-
-    # Exact duplicate
-    page_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
-    if page_hash in page_hashes:
-        print(f"Exact duplicate hash → {url}\n")
-        with open("filtered_urls.log", "a", encoding="utf-8") as log_file:
-            log_file.write(f"[DUPLICATE] Motivo: Exact duplicate hash → {url}\n")
-        return []
-    page_hashes.add(page_hash)
-
-    # Near duplicate
-    fingerprint = simhash(tokens)
-    for existing in simhashes:
-        if hamming_distance(fingerprint, existing) <= 3:
-            print(f"Near duplicate (SimHash) → {url}\n")
-            with open("filtered_urls.log", "a", encoding="utf-8") as log_file:
-                log_file.write(f"[DUPLICATE] Motivo: Near duplicate (SimHash) → {url}\n")
-            return []
-    simhashes.add(fingerprint)
+    return bool(content_type) and "text/html" in content_type.lower()
 
-    word_counter.update(tokens)
-    word_count = len(tokens)
-    word_in_page[url] = word_count
 
-    global most_word_in_page
-    if word_count > most_word_in_page[1]:
-        most_word_in_page = (url, word_count)
+def was_duplicate():
+    return getattr(last_page, "duplicate", False)
 
-    parsed = urlparse(url)
-    if parsed.netloc.endswith(".ics.uci.edu"):
-        subdomain_counter[parsed.netloc] += 1
 
-    if len(word_in_page) % save_frequency == 0:
-        save_stats()
+def extract_next_links(url, resp):
+    last_page.duplicate = False
+    if not is_html(resp):
+        return []
+    return record_page(url, analyze_page(url, resp.raw_response.content))
+
+
+def analyze_page(url, content):
+    ''' CPU heavy part of scraping, with no shared state so that it can run
+    in another process. Returns (page_hash, fingerprint, frequencies,
+    word_count, links); links are absolute, defragmented and not validated. '''
+    with metrics.timer("parse"):
+        text, hrefs = parse_page(content)
+    with metrics.timer("tokenize"):
+        text = text.lower()
+        raw_tokens = tokenize(text)
+        tokens = [t for t in raw_tokens if t not in stopwords and len(t) > 1 and not t.isdigit()]
+        frequencies = Counter(tokens)
+
+    with metrics.timer("simhash"):
+        page_hash = digest64(hashlib.sha256(text.encode('utf-8')).digest())
+        fingerprint = simhash(frequencies)
+
+    links = []
+    for href in hrefs:
+        try:
+            joined = urljoin(url, href)
+        except ValueError:
+            continue
+        clean_url, _ = urldefrag(joined)
+        links.append(clean_url)
+    return page_hash, fingerprint, frequencies, len(tokens), links
+
+
+def url_page_hash(url, page_hash):
+    ''' Digest of a url together with the hash of its content, kept in
+    page_hashes next to the page hashes to tell which url a hash came from. '''
+    return digest64(hashlib.sha256(f"{page_hash} {url}".encode("utf-8")).digest())
+
+
+def record_page(url, page):
+    ''' Checks an analyzed page against the pages seen so far, updates the
+    stats and returns its valid links, or [] for duplicates. '''
+    page_hash, fingerprint, frequencies, word_count, links = page
+
+    # A page downloaded again by a recrawl replaces its earlier version,
+    # which its new content would otherwise be a near duplicate of. Its
+    # fingerprint is only indexed if no fingerprint (usually the earlier
+    # version's) is within 3 bits of it, so that pages with small changes do
+    # not grow the index at every recrawl. Earlier versions stay indexed.
+    revisit = stats.has_page(url)
+    own_hash = url_page_hash(url, page_hash)
+    if revisit:
+        page_hashes.add(page_hash)
+        simhash_index.add_if_new(fingerprint, 3)
+    # Exact duplicate, checked and added at once so that two threads with
+    # the same page cannot both see it as new.
+    elif not page_hashes.add(page_hash):
+        if own_hash not in page_hashes:
+            print(f"Exact duplicate hash → {url}\n")
+            filter_log.record("exact-duplicate", "Exact duplicate hash", "DUPLICATE", url)
+            last_page.duplicate = True
+            metrics.count("exact_duplicates")
+            return []
+        # page_hashes is written at once but the stats only when logged: this
+        # is the url's own download by a crawl killed in between, not a
+        # duplicate. Its fingerprint may well be indexed too.
+        simhash_index.add_if_new(fingerprint, 3)
+
+    # Near duplicate, checked and added at once too.
+    elif simhash_index.add_if_new(fingerprint, 3) is not None:
+        print(f"Near duplicate (SimHash) → {url}\n")
+        filter_log.record("near-duplicate", "Near duplicate (SimHash)", "DUPLICATE", url)
+        last_page.duplicate = True
+        metrics.count("near_duplicates")
+        return []
+    else:
+        # Only for pages that are kept, a duplicate downloaded again must
+        # still be one.
+        page_hashes.add(own_hash)
+    last_page.duplicate = False
+
+    with metrics.timer("stats"):
+        if revisit:
+            logged = stats.update_page(url, frequencies, word_count)
+        else:
+            logged = stats.add_page(url, frequencies, word_count, subdomain_of(url))
+        if logged:
+            # The page stats were just logged, persist the new fingerprints too.
+            simhash_index.save(simhash_file)
+            page_hashes.flush()
+            _write_summary_periodically()
 
     new_links = []
-    for link in soup.find_all('a'):
-        href = link.get('href')
-        if href:
-            joined = urljoin(url, href)
-            clean_url, _ = urldefrag(joined)
+    with metrics.timer("is_valid"):
+        for clean_url in links:
             try:
                 if is_valid(clean_url):
                     new_links.append(clean_url)
             except Exception as e:
                 print(f"[ERROR] is_valid failed for URL {clean_url}: {e}")
+
+    if LINK_GRAPH_FILE:
+        line = json.dumps({"url": url, "links": new_links}) + "\n"
+        with link_graph_lock:
+            with open(LINK_GRAPH_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
     return new_links
 
 
-def is_valid(url):
-    try:
-        parsed = urlparse(url)
-        domain = parsed.netloc
-        path = parsed.path
-        scheme = parsed.scheme
-        query = parsed.query
-
-        def log_reason(reason):
-            with open("filtered_urls.log", "a", encoding="utf-8") as log_file:
-                log_file.write(f"[{domain}] Motivo: {reason} → {url}\n")
-
-        if scheme not in {"http", "https"}:
-            log_reason("Invalid Scheme")
-            return False
-
-        if not (domain == "ics.uci.edu"
-                or domain.endswith(".ics.uci.edu")
-                or domain == "cs.uci.edu"
-                or domain.endswith(".cs.uci.edu")
-                or domain == "informatics.uci.edu"
-                or domain.endswith(".informatics.uci.edu")
-                or domain == "stat.uci.edu"
-                or domain.endswith(".stat.uci.edu")
-                or (domain == "today.uci.edu" and path.startswith("/department/information_computer_sciences/"))):
-            log_reason("Out of permitted domain")
-            return False
-
-        bad_params = {"share=", "action=login", "pwd=", "format=",
-                      "action=download", "upname=", "ical=", "action=edit",
-                      "replytocom=", "print=", "session=", "redirect_to=",
-                      "post_type=", "tribe-bar-date=", "eventDisplay=past",
-                      "do=media", "tab_files=", "image=", "do=diff", "difftype="}
-
-        if any(p in query for p in bad_params):
-            log_reason("Query bad parameters")
-            return False
-
-        if "doku.php" in url:
-            log_reason("Trap: DokuWiki URL")
-            return False
-
-        if re.search(r'/day/(19|20)\d{2}-\d{2}-\d{2}', path):
-            log_reason("Tramp: specific day calendar")
-            return False
-
-        segments = path.strip("/").split("/")
-        if len(segments) != len(set(segments)):
-            log_reason("Trap: repeated path segments")
-            return False
-
-        if re.search(r'/events?/\d{4}-\d{2}-\d{2}', path):
-            log_reason("Trap: /event(s)/ with specific date")
-            return False
-
-        if re.search(r'/events?/month(/\\d{4}-\\d{2})?/?$', path):
-            log_reason("Trap : /events/month/")
-            return False
-
-        if re.search(r'/events/category/.*/(19|20)\d{2}-\d{2}', path):
-            log_reason("Trap: /events/category/.../YYYY-MM")
-            return False
-
-        if re.search(r'/-/(blob|blame|raw|commits|tree)/', path) and "README.md" in path:
-            log_reason("Trap: GitLab redundant README views")
-            return False
-
-        if re.search(r'~epstein/pix/', path):
-            log_reason("Low-value personal photo page (epstein/pix)")
-            return False
-
-        if any(part in path.lower() for part in ["/pix/", "/photos/", "/gallery/"]):
-            log_reason("Trap: low-value image folder")
-            return False
-
-        # GitLab commit and tree views
-        if "/-/commit/" in path:
-            log_reason("Trap: GitLab commit view")
-            return False
-
-        if "/-/tree/" in path:
-            log_reason("Trap: GitLab tree view")
-            return False
-
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
+# Declarative url filter. To add a trap, add a rule to TRAP_RULES:
+# (rule id, part of the url it applies to, regex or predicate, reason).
+ALLOWED_SCHEMES = ("http", "https")
+ALLOWED_DOMAINS = ("ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu")
+ALLOWED_PATHS = {"today.uci.edu": "/department/information_computer_sciences/"}
+
+BAD_QUERY_PARAMS = ("share=", "action=login", "pwd=", "format=",
+                    "action=download", "upname=", "ical=", "action=edit",
+                    "replytocom=", "print=", "session=", "redirect_to=",
+                    "post_type=", "tribe-bar-date=", "eventDisplay=past",
+                    "do=media", "tab_files=", "image=", "do=diff", "difftype=")
+
+TRAP_RULES = [
+    ("bad-query", "query", "|".join(map(re.escape, BAD_QUERY_PARAMS)), "Query bad parameters"),
+    ("dokuwiki", "url", r"doku\.php", "Trap: DokuWiki URL"),
+    ("calendar-day", "path", r"/day/(?:19|20)\d{2}-\d{2}-\d{2}", "Tramp: specific day calendar"),
+    ("repeated-segments", "path", repeated_segments, "Trap: repeated path segments"),
+    ("event-date", "path", r"/events?/\d{4}-\d{2}-\d{2}", "Trap: /event(s)/ with specific date"),
+    ("event-month", "path", r"/events?/month(?:/\d{4}-\d{2})?/?$", "Trap : /events/month/"),
+    ("event-category-month", "path", r"/events/category/.*/(?:19|20)\d{2}-\d{2}", "Trap: /events/category/.../YYYY-MM"),
+    ("gitlab-readme", "path", r"^(?=.*README\.md).*/-/(?:blob|blame|raw|commits|tree)/", "Trap: GitLab redundant README views"),
+    ("epstein-pix", "path", r"~epstein/pix/", "Low-value personal photo page (epstein/pix)"),
+    ("image-folder", "path", r"(?i:/pix/|/photos/|/gallery/)", "Trap: low-value image folder"),
+    ("gitlab-commit", "path", r"/-/commit/", "Trap: GitLab commit view"),
+    ("gitlab-tree", "path", r"/-/tree/", "Trap: GitLab tree view"),
+]
+
+BLOCKED_EXTENSIONS = (
+    "css", "js", "bmp", "gif", "jpg", "jpeg", "ico",
+    "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz")
+
+url_filter = UrlFilter(
+    ALLOWED_SCHEMES, ALLOWED_DOMAINS, ALLOWED_PATHS, TRAP_RULES, BLOCKED_EXTENSIONS)
 
-    except Exception as e:
-        with open("filtered_urls.log", "a", encoding="utf-8") as log_file:
-            log_file.write(f"[ERROR] Motivo: Exception ({e}) → {url}\n")
-        return False
+
+def is_valid(url):
+    rule_id = url_filter.check(url)
+    if rule_id is None:
+        return True
+    domain = "ERROR" if rule_id == "malformed-url" else urlparse(url).netloc
+    filter_log.record(rule_id, url_filter.reasons[rule_id], domain, url)
+    return False
@@ -0,0 +1,127 @@
+import os
+import glob
+import json
+import mmap
+import zlib
+
+from threading import Lock
+
+from requests.models import Response as PageResponse
+from requests.structures import CaseInsensitiveDict
+
+INDEX_FILE = "index.tsv"
+COMPRESSION_LEVEL = 6
+
+
+def archive_paths(path):
+    ''' The archive at path and those of the processes of a sharded crawl. '''
+    paths = [path] + sorted(glob.glob(f"{glob.escape(path)}.shard*"))
+    return [p for p in paths if os.path.isdir(p)]
+
+
+def _gzip(*chunks):
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+    return b"".join([compressor.compress(chunk) for chunk in chunks] + [compressor.flush()])
+
+
+class ArchiveWriter(object):
+    ''' Appends fetched pages to the segment-NNNNN.gz files of a directory.
+
+    A page is two gzip members, its metadata (url, status and headers as a
+    JSON line) and its body, so each one can be decompressed on its own
+    and the segment stays a valid gzip file. index.tsv maps every url to
+    its segment, offset and the lengths of both members; it is written
+    after the segment, so an index line never points to missing data. A
+    new segment is started on every open and once the current one is
+    segment_size bytes. '''
+    def __init__(self, directory, segment_size):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.lock = Lock()
+        self.segment_id = len(glob.glob(os.path.join(directory, "segment-*.gz"))) - 1
+        self.segment = None
+        self.index = open(os.path.join(directory, INDEX_FILE), "a", encoding="utf-8")
+
+    def write(self, url, status, headers=None, body=b""):
+        meta = _gzip(json.dumps({
+            "url": url, "status": status,
+            "headers": dict(headers) if headers else {}}).encode("utf-8"))
+        data = _gzip(body)
+        with self.lock:
+            if self.segment is None or self.segment.tell() >= self.segment_size:
+                if self.segment is not None:
+                    self.segment.close()
+                self.segment_id += 1
+                self.segment = open(os.path.join(
+                    self.directory, f"segment-{self.segment_id:05d}.gz"), "ab")
+            offset = self.segment.tell()
+            self.segment.write(meta)
+            self.segment.write(data)
+            self.segment.flush()
+            self.index.write(
+                f"{url}\t{self.segment_id}\t{offset}\t{len(meta)}\t{len(data)}\n")
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+            self.index.close()
+
+
+class ArchiveReader(object):
+    ''' Pages of one or more archives by url, read from memory-mapped
+    segments so that processes replaying the same archive share the page
+    cache. The last record of a url archived several times wins. '''
+    def __init__(self, paths):
+        self.lock = Lock()
+        self.index = dict()
+        self.segments = dict()
+        for path in paths:
+            with open(os.path.join(path, INDEX_FILE), encoding="utf-8") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if not line.endswith("\n") or len(fields) != 5:
+                        # Torn by an unclean shutdown.
+                        continue
+                    url, segment_id, offset, meta_length, length = fields
+                    segment = os.path.join(path, f"segment-{int(segment_id):05d}.gz")
+                    self.index[url] = (segment, int(offset), int(meta_length), int(length))
+
+    def __len__(self):
+        return len(self.index)
+
+    def _segment(self, path):
+        segment = self.segments.get(path)
+        if segment is None:
+            with self.lock:
+                segment = self.segments.get(path)
+                if segment is None:
+                    with open(path, "rb") as f:
+                        segment = self.segments[path] = mmap.mmap(
+                            f.fileno(), 0, access=mmap.ACCESS_READ)
+        return segment
+
+    def read(self, url):
+        ''' The archived page of url as a requests.Response, or None. '''
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        path, offset, meta_length, length = entry
+        with memoryview(self._segment(path)) as segment:
+            meta = json.loads(zlib.decompress(segment[offset:offset + meta_length], 31))
+            body = zlib.decompress(
+                segment[offset + meta_length:offset + meta_length + length], 31)
+        page = PageResponse()
+        page.url = meta["url"]
+        page.status_code = meta["status"]
+        page.headers = CaseInsensitiveDict(meta["headers"])
+        page._content = body
+        return page
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments.values():
+                segment.close()
+            self.segments.clear()
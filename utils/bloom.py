@@ -0,0 +1,110 @@
+import os
+import json
+import math
+
+MASK_64 = (1 << 64) - 1
+
+
+class BloomFilter(object):
+    ''' Fixed size Bloom filter over hex digests (e.g. utils.get_urlhash).
+    The k bit positions come from double hashing the first 128 bits of the
+    digest, so no extra hashing is done. '''
+    def __init__(self, capacity, error_rate, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def __contains__(self, digest):
+        value = int(digest[:32], 16)
+        h1, h2 = value & MASK_64, (value >> 64) | 1
+        bits, num_bits = self.bits, self.num_bits
+        for i in range(self.num_hashes):
+            p = (h1 + i * h2) % num_bits
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, digest):
+        value = int(digest[:32], 16)
+        h1, h2 = value & MASK_64, (value >> 64) | 1
+        bits, num_bits = self.bits, self.num_bits
+        for i in range(self.num_hashes):
+            p = (h1 + i * h2) % num_bits
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter(object):
+    ''' Bloom filter that grows with the number of items. When the current
+    filter reaches its capacity a new one with `growth` times the capacity
+    and `tightening` times the error rate is added, which keeps the overall
+    false positive rate below error_rate / (1 - tightening).
+
+    A digest that is not in the filter has certainly never been added; one
+    that is in it has probably been added. '''
+    def __init__(self, initial_capacity=1000000, error_rate=0.001,
+                 growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = list()
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    def __contains__(self, digest):
+        return any(digest in bloom for bloom in self.filters)
+
+    def add(self, digest):
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            stage = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.initial_capacity * self.growth ** stage,
+                self.error_rate * (1 - self.tightening) * self.tightening ** stage))
+        self.filters[-1].add(digest)
+
+    def memory(self):
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+    def save(self, path, item_count):
+        ''' Writes the filter to path. item_count identifies the state of the
+        store it was built from, see load. '''
+        header = {
+            "initial_capacity": self.initial_capacity,
+            "error_rate": self.error_rate,
+            "growth": self.growth,
+            "tightening": self.tightening,
+            "item_count": item_count,
+            "filters": [[bloom.capacity, bloom.error_rate, bloom.count]
+                        for bloom in self.filters],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write((json.dumps(header) + "\n").encode("utf-8"))
+            for bloom in self.filters:
+                f.write(bloom.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, item_count):
+        ''' Returns the filter saved at path, or None if there is none or it
+        was saved for a store with a different item_count. '''
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            if header["item_count"] != item_count:
+                return None
+            seen = cls(header["initial_capacity"], header["error_rate"],
+                       header["growth"], header["tightening"])
+            for capacity, error_rate, count in header["filters"]:
+                bloom = BloomFilter(capacity, error_rate, count=count)
+                if f.readinto(bloom.bits) != len(bloom.bits):
+                    return None
+                seen.filters.append(bloom)
+        return seen
@@ -9,11 +9,47 @@ class Config(object):
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "shelve").strip()
+        self.store_batch = int(config["LOCAL PROPERTIES"].get("STOREBATCH", "500"))
+        self.store_interval = float(config["LOCAL PROPERTIES"].get("STOREINTERVAL", "0.2"))
+        self.bloom_capacity = int(config["LOCAL PROPERTIES"].get("BLOOMCAPACITY", "1000000"))
+        self.bloom_error_rate = float(config["LOCAL PROPERTIES"].get("BLOOMERRORRATE", "0.001"))
+        self.async_fetches = int(config["LOCAL PROPERTIES"].get("ASYNCFETCHES", "100"))
+        self.async_fetches_per_host = int(config["LOCAL PROPERTIES"].get("ASYNCFETCHESPERHOST", "2"))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSEPROCESSES", "0"))
+        self.archive = config["LOCAL PROPERTIES"].get("ARCHIVE", "").strip()
+        self.archive_segment_size = int(config["LOCAL PROPERTIES"].get("ARCHIVESEGMENTSIZE", "1073741824"))
+        self.metrics = config["LOCAL PROPERTIES"].getboolean("METRICS", False)
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICSPORT", "9100"))
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICSINTERVAL", "60"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.pool_size = int(config["CONNECTION"].get("POOLSIZE", "10"))
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECTTIMEOUT", "5"))
+        self.read_timeout = float(config["CONNECTION"].get("READTIMEOUT", "60"))
+        self.retries = int(config["CONNECTION"].get("RETRIES", "3"))
+        self.retry_backoff = float(config["CONNECTION"].get("RETRYBACKOFF", "0.5"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.priority = config["CRAWLER"].get("PRIORITY", "novelty").strip()
+        self.max_delay = float(config["CRAWLER"].get("MAXPOLITENESS", "30"))
+        self.latency_factor = float(config["CRAWLER"].get("LATENCYFACTOR", "1"))
+        self.trap_ratio = float(config["CRAWLER"].get("TRAPRATIO", "0.8"))
+        self.trap_min_pages = int(config["CRAWLER"].get("TRAPMINPAGES", "20"))
+        self.trap_page_cap = int(config["CRAWLER"].get("TRAPPAGECAP", "200"))
+        self.max_page_size = int(config["CRAWLER"].get("MAXPAGESIZE", "10485760"))
+        self.robots = config["CRAWLER"].getboolean("ROBOTS", True)
+        self.robots_expiry = float(config["CRAWLER"].get("ROBOTSEXPIRY", "86400"))
+        self.sitemap_urls = int(config["CRAWLER"].get("SITEMAPURLS", "1000"))
+        self.fetch_history = config["CRAWLER"].getboolean("FETCHHISTORY", False)
+        self.recrawl_min = float(config["CRAWLER"].get("RECRAWLMIN", "3600"))
+        self.recrawl_max = float(config["CRAWLER"].get("RECRAWLMAX", "604800"))
 
-        self.cache_server = None
\ No newline at end of file
+        self.cache_server = None
+        # Set by launch.py --replay: pages are read from the archive.
+        self.replay = False
+        # Set by launch.py --recrawl: pages due for a revisit are queued, and
+        # fetch_history with it.
+        self.recrawl = False
\ No newline at end of file
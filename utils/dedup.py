@@ -0,0 +1,149 @@
+import os
+import mmap
+import struct
+
+from threading import Lock
+
+MAGIC = b"DIGESTS1"
+# Magic, number of slots and number of digests.
+HEADER = struct.Struct("<8sQQ")
+INITIAL_SLOTS = 1 << 16
+# Fibonacci hashing spreads digests that are not uniform over the slots.
+GOLDEN = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+
+
+def digest64(data):
+    ''' First 8 bytes of a binary digest (e.g. hashlib's digest()) as an int.
+    Among 10 million pages the chance of two different ones sharing the
+    same 64 bits is below 1 in 300 000. '''
+    return int.from_bytes(data[:8], "little")
+
+
+class DigestSet(object):
+    ''' Set of 64 bit digests, in an open addressing hash table (linear
+    probing, 8 bytes per slot, at most half full) held in a memory-mapped
+    file, or in anonymous memory when path is None.
+
+    Every add is written to the mapping at once, so the file is always up to
+    date as far as the operating system is concerned and survives the
+    crawler being killed; flush() also writes it to disk. A file that does
+    not exist yet is only created by the first add. The pages of the
+    mapping are cached by the OS, not held by Python, so the table can be
+    larger than RAM. The table doubles in a new file that replaces the old
+    one once it is complete. Safe to use from several threads. '''
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = Lock()
+        self.file = None
+        if path is not None and os.path.exists(path):
+            # Unbuffered, a buffered file seeks on close, which would move
+            # the offset a forked process shares with its parent.
+            self.file = open(path, "r+b", buffering=0)
+            magic, slot_count, self.count = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a digest set.")
+            self._map(slot_count)
+        else:
+            self.count = 0
+            self._map(INITIAL_SLOTS, create=True, anonymous=True)
+
+    def _map(self, slot_count, create=False, path=None, anonymous=False):
+        # Maps a table of slot_count slots, from path or self.path, creating
+        # it if asked to, or in anonymous memory.
+        size = HEADER.size + 8 * slot_count
+        path = path or self.path
+        if path is None or anonymous:
+            self.mapping = mmap.mmap(-1, size)
+        else:
+            if create:
+                self.file = open(path, "w+b", buffering=0)
+                self.file.truncate(size)
+            self.mapping = mmap.mmap(self.file.fileno(), size)
+        if create:
+            self.mapping[:HEADER.size] = HEADER.pack(MAGIC, slot_count, 0)
+        self.view = memoryview(self.mapping)
+        self.slots = self.view[HEADER.size:].cast("Q")
+        self.mask = slot_count - 1
+        self.shift = 64 - slot_count.bit_length() + 1
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, digest):
+        digest = digest or 1
+        with self.lock:
+            slots, mask = self.slots, self.mask
+            i = ((digest * GOLDEN) & MASK64) >> self.shift
+            while True:
+                value = slots[i]
+                if value == digest:
+                    return True
+                if not value:
+                    return False
+                i = (i + 1) & mask
+
+    def add(self, digest):
+        ''' Adds digest, an int of at most 64 bits. Returns whether it was
+        new. '''
+        # 0 marks empty slots.
+        digest = digest or 1
+        with self.lock:
+            if self.file is None and self.path is not None:
+                # First add to a new table.
+                self.slots.release()
+                self.view.release()
+                self.mapping.close()
+                self._map(INITIAL_SLOTS, create=True)
+            slots, mask = self.slots, self.mask
+            i = ((digest * GOLDEN) & MASK64) >> self.shift
+            while True:
+                value = slots[i]
+                if value == digest:
+                    return False
+                if not value:
+                    break
+                i = (i + 1) & mask
+            slots[i] = digest
+            self.count += 1
+            HEADER.pack_into(self.mapping, 0, MAGIC, len(slots), self.count)
+            if 2 * self.count > len(slots):
+                self._grow()
+            return True
+
+    def _grow(self):
+        # Must be called with self.lock held.
+        old_slots, old_view, old_mapping, old_file = (
+            self.slots, self.view, self.mapping, self.file)
+        tmp_path = None if self.path is None else f"{self.path}.tmp"
+        self._map(2 * len(old_slots), create=True, path=tmp_path)
+        slots, mask, shift = self.slots, self.mask, self.shift
+        for digest in old_slots:
+            if digest:
+                i = ((digest * GOLDEN) & MASK64) >> shift
+                while slots[i]:
+                    i = (i + 1) & mask
+                slots[i] = digest
+        HEADER.pack_into(self.mapping, 0, MAGIC, len(slots), self.count)
+        old_slots.release()
+        old_view.release()
+        old_mapping.close()
+        if self.path is not None:
+            self.mapping.flush()
+            old_file.close()
+            os.replace(tmp_path, self.path)
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.mapping.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.mapping.flush()
+            self.slots.release()
+            self.view.release()
+            self.mapping.close()
+            if self.file is not None:
+                self.file.close()
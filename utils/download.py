@@ -1,21 +1,200 @@
 import requests
 import cbor
 import time
+import asyncio
+
+from threading import local, Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from utils.response import Response
+from utils.metrics import metrics
+from utils.archive import ArchiveReader, ArchiveWriter, archive_paths
+
+# Status of the Response returned when the cache server could not be reached
+# at all, even after retrying.
+CONNECTION_ERROR_STATUS = 0
+# Status of the Response returned, without reading it, for a page whose
+# answer from the cache server is larger than config.max_page_size.
+TOO_LARGE_STATUS = 413
+
+# One requests.Session per thread, all sharing one thread-safe adapter and
+# therefore one pool of keep-alive connections to the cache server.
+_sessions = local()
+_adapter = None
+_adapter_lock = Lock()
+_request_count = 0
+# Archive of config.archive that fetched pages are written to, or that they
+# are replayed from when config.replay is set; opened on first use.
+_archive = None
+
+
+def get_session(config):
+    global _adapter
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        with _adapter_lock:
+            if _adapter is None:
+                retries = Retry(
+                    total=config.retries, backoff_factor=config.retry_backoff,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]), raise_on_status=False)
+                _adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=config.pool_size,
+                    max_retries=retries)
+        session = _sessions.session = requests.Session()
+        session.mount("http://", _adapter)
+    return session
+
+
+def connection_stats():
+    ''' Requests sent to the cache server, connections opened for them and
+    how many requests reused an already open connection. '''
+    if _adapter is None:
+        return {"requests": 0, "connections": 0, "reused": 0}
+    pools = _adapter.poolmanager.pools
+    connections = sum(pools[key].num_connections for key in pools.keys())
+    return {
+        "requests": _request_count,
+        "connections": connections,
+        "reused": max(_request_count - connections, 0)}
+
+
+def too_large(url, size, config, logger):
+    ''' Returns the Response of a page whose answer from the cache server has
+    size bytes, if that is more than config.max_page_size, else None. '''
+    if not config.max_page_size or size is None or size <= config.max_page_size:
+        return None
+    logger.warning(
+        f"Skipping {url}, its answer from the cache server is {size} bytes, "
+        f"more than the {config.max_page_size} allowed.")
+    return Response({
+        "error": f"Page larger than {config.max_page_size} bytes.",
+        "status": TOO_LARGE_STATUS,
+        "url": url})
+
+
+def decode(content):
+    # The body of the page stays pickled in the Response until it is used.
+    with metrics.timer("decode"):
+        return Response(cbor.loads(content))
+
+
+def get_archive(config):
+    global _archive
+    if _archive is None:
+        with _adapter_lock:
+            if _archive is None:
+                if config.replay:
+                    _archive = ArchiveReader(archive_paths(config.archive))
+                else:
+                    _archive = ArchiveWriter(config.archive, config.archive_segment_size)
+    return _archive
+
+
+def close_archive():
+    global _archive
+    with _adapter_lock:
+        if _archive is not None:
+            _archive.close()
+            _archive = None
+
+
+def replay(url, config):
+    ''' The page of url as archived in config.archive. '''
+    with metrics.timer("replay"):
+        page = get_archive(config).read(url)
+    if page is None:
+        return Response({
+            "error": f"{url} is not in the archive.",
+            "status": CONNECTION_ERROR_STATUS,
+            "url": url})
+    return Response({"url": url, "status": page.status_code}, raw_response=page)
+
+
+def archive(url, resp, config):
+    ''' Writes a page answered by the cache server to config.archive. Only the
+    status of non-200 pages is kept, the scraper does not look at the rest. '''
+    if resp.status == 200 and resp.raw_response is not None:
+        get_archive(config).write(
+            url, resp.status, resp.raw_response.headers, resp.raw_response.content)
+    else:
+        get_archive(config).write(url, resp.status)
+
+
+def unreachable(url, error, logger):
+    ''' The Response of a page the cache server could not be asked for. '''
+    logger.error(f"Could not reach cache server for url {url}: {error}")
+    return Response({
+        "error": f"Could not reach cache server for url {url}: {error}",
+        "status": CONNECTION_ERROR_STATUS,
+        "url": url})
+
+
+def answer(url, status, content, config, logger):
+    ''' The Response of a page the cache server answered with status and
+    content, archived if config.archive is set. '''
+    rejected = too_large(url, len(content), config, logger)
+    if rejected is not None:
+        return rejected
+    if status < 400 and content:
+        try:
+            page = decode(content)
+        except (EOFError, ValueError):
+            pass
+        else:
+            if config.archive:
+                archive(url, page, config)
+            return page
+    logger.error(f"Spacetime Response error <Response [{status}]> with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error <Response [{status}]> with url {url}.",
+        "status": status,
+        "url": url})
+
 
 def download(url, config, logger=None):
+    global _request_count
+    if config.replay:
+        return replay(url, config)
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    with _adapter_lock:
+        _request_count += 1
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
-    except (EOFError, ValueError) as e:
-        pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
-    return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+        # Streamed so that oversized pages are rejected on their headers.
+        resp = get_session(config).get(
+            f"http://{host}:{port}/",
+            params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+            timeout=(config.connect_timeout, config.read_timeout), stream=True)
+        length = resp.headers.get("Content-Length")
+        rejected = too_large(
+            url, int(length) if length and length.isdigit() else None, config, logger)
+        if rejected is not None:
+            resp.close()
+            return rejected
+        content = resp.content
+    except requests.RequestException as e:
+        return unreachable(url, e, logger)
+    return answer(url, resp.status_code, content, config, logger)
+
+
+async def download_async(url, config, session, logger=None):
+    ''' download() for asyncio workers; session is an aiohttp.ClientSession. '''
+    # Imported here so that aiohttp is only needed by the async engine.
+    import aiohttp
+
+    if config.replay:
+        return replay(url, config)
+    host, port = config.cache_server
+    try:
+        async with session.get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{config.user_agent}")]) as resp:
+            rejected = too_large(url, resp.content_length, config, logger)
+            if rejected is not None:
+                return rejected
+            content = await resp.read()
+            status = resp.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return unreachable(url, e, logger)
+    return answer(url, status, content, config, logger)
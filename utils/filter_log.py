@@ -0,0 +1,82 @@
+import json
+import atexit
+import random
+import logging
+
+from collections import Counter, deque
+from logging.handlers import RotatingFileHandler
+from threading import Thread, Lock, Event
+
+
+class FilterLog(object):
+    ''' Sink for rejected and duplicate urls.
+
+    record() only bumps a per-rule counter and appends to an in-memory ring
+    buffer; a background thread drains the buffer into a rotating log file in
+    batches. When the buffer is full the oldest lines are dropped (and
+    counted in dropped). sample_rate is the fraction of records written as
+    lines, 0 keeps only the counters. With jsonl=True lines are JSON objects
+    with rule, reason, domain and url. '''
+    def __init__(self, path, sample_rate=1.0, jsonl=False, buffer_size=10000,
+                 max_bytes=50 * 1024 * 1024, backup_count=5, flush_interval=1.0):
+        self.sample_rate = sample_rate
+        self.jsonl = jsonl
+        self.flush_interval = flush_interval
+        self.counts = Counter()
+        self.dropped = 0
+        self.lock = Lock()
+        self.buffer = deque(maxlen=buffer_size)
+        self.handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count,
+            encoding="utf-8", delay=True)
+        self.wakeup = Event()
+        self.closed = False
+        self.writer = Thread(target=self._drain_periodically, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def record(self, rule_id, reason, domain, url):
+        with self.lock:
+            self.counts[rule_id] += 1
+            if self.sample_rate < 1 and random.random() >= self.sample_rate:
+                return
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append((rule_id, reason, domain, url))
+            if len(self.buffer) * 2 >= self.buffer.maxlen:
+                self.wakeup.set()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def _format(self, rule_id, reason, domain, url):
+        if self.jsonl:
+            return json.dumps(
+                {"rule": rule_id, "reason": reason, "domain": domain, "url": url},
+                ensure_ascii=False)
+        return f"[{domain}] Motivo: {reason} → {url}"
+
+    def flush(self):
+        with self.lock:
+            records = list(self.buffer)
+            self.buffer.clear()
+        if records:
+            lines = "\n".join(self._format(*record) for record in records)
+            self.handler.emit(logging.makeLogRecord({"msg": lines}))
+            self.handler.flush()
+
+    def _drain_periodically(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join()
+        self.flush()
+        self.handler.close()
@@ -0,0 +1,84 @@
+import os
+import json
+
+
+def replay(path, decode):
+    ''' Passes every line of the append-only log at path (bytes, with its
+    newline) to decode, in order, and cuts the file before a torn last line,
+    left by a crash, so that it can be appended to again. decode raising
+    ValueError counts as a torn line too. Returns the number of lines read
+    and of bytes discarded. '''
+    if not os.path.exists(path):
+        return 0, 0
+    line_count = 0
+    good_offset = 0
+    with open(path, "rb") as log:
+        for line in log:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("Incomplete record.")
+                decode(line)
+            except ValueError:
+                break
+            good_offset += len(line)
+            line_count += 1
+        size = log.seek(0, os.SEEK_END)
+    if size > good_offset:
+        with open(path, "r+b") as log:
+            log.truncate(good_offset)
+    return line_count, size - good_offset
+
+
+def is_stale(line_count, record_count, slack):
+    ''' Whether a log of line_count lines is mostly older records of the
+    record_count it holds, and worth rewriting. '''
+    return line_count > 2 * record_count + slack
+
+
+def rewrite(path, lines, sync=False):
+    ''' Replaces the log at path with lines (str, each ending with a
+    newline) at once, written to disk first if sync. '''
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as log:
+        for line in lines:
+            log.write(line.encode("utf-8"))
+        if sync:
+            log.flush()
+            os.fsync(log.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_records(path):
+    ''' Yields the JSON records of a line-delimited log, stopping at a torn
+    last line. '''
+    with open(path, "rb") as log:
+        for line in log:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("Incomplete record.")
+                record = json.loads(line)
+            except ValueError:
+                return
+            yield record
+
+
+def truncate_torn_tail(path, block_size=65536):
+    ''' Cuts a last line that was not completely written, so that appending
+    to path starts a new line. Only the end of the file is read, for logs
+    too large to replay. '''
+    if not os.path.exists(path):
+        return
+    with open(path, "r+b") as log:
+        end = log.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - block_size, 0)
+            log.seek(start)
+            block = log.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            log.truncate(position)
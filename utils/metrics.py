@@ -0,0 +1,243 @@
+import time
+import threading
+
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Upper bounds in seconds of the histogram buckets: 10µs to about 84s.
+BUCKETS = tuple(1e-5 * 2 ** i for i in range(24))
+
+
+class Histogram(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect_left(BUCKETS, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        ''' Upper bound of the bucket holding the q quantile. '''
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class TimedLock(object):
+    ''' Wraps a Lock or RLock, counting acquisitions and timing the ones that
+    had to wait for another thread. Works as the lock of a Condition. '''
+    def __init__(self, lock, metrics, name):
+        self.lock = lock
+        self.name = name
+        self.wait = metrics.histogram(f"lock_wait:{name}")
+        self.acquisitions = 0
+        self.contended = 0
+        self.release = lock.release
+        # Condition.wait has to fully release an RLock held recursively.
+        for attribute in ("_release_save", "_acquire_restore", "_is_owned"):
+            if hasattr(lock, attribute):
+                setattr(self, attribute, getattr(lock, attribute))
+        metrics.locks.append(self)
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            # Only the lock holder updates the counters.
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        if acquired:
+            self.acquisitions += 1
+            self.contended += 1
+            self.wait.observe(time.perf_counter() - start)
+        return acquired
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+
+class Metrics(object):
+    ''' Stage timers, counters and lock contention of the crawl.
+
+    Everything is a no-op until enable() is called: timer() returns a shared
+    do-nothing context manager and instrument_lock() the lock itself, so the
+    instrumentation can stay in the hot path. Stage names may carry a kind
+    after a colon, e.g. "lock_wait:frontier". '''
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = dict()
+        self.counters = dict()
+        self.locks = list()
+        self.server = None
+
+    def enable(self, port=0, log_interval=0, logger=None):
+        ''' Starts recording, serves /metrics on localhost:port unless port is
+        0 and logs a summary every log_interval seconds if not 0. '''
+        self.enabled = True
+        if port and self.server is None:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            if logger:
+                logger.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+        if log_interval and logger:
+            threading.Thread(
+                target=self._log_periodically, args=(log_interval, logger),
+                daemon=True).start()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def timer(self, stage):
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self.histogram(stage))
+
+    def observe(self, stage, seconds):
+        ''' Records a duration measured by the caller. '''
+        if self.enabled:
+            self.histogram(stage).observe(seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def instrument_lock(self, lock, name):
+        if not self.enabled:
+            return lock
+        return TimedLock(lock, self, name)
+
+    def _histograms(self):
+        # Copied under the lock, histogram() adds stages as they first run.
+        with self.lock:
+            return sorted(self.histograms.items())
+
+    def render(self):
+        ''' The metrics in the Prometheus text format. '''
+        lines = ["# TYPE crawler_stage_seconds histogram"]
+        for name, histogram in self._histograms():
+            stage, _, kind = name.partition(":")
+            labels = f'stage="{stage}"' + (f',name="{kind}"' if kind else "")
+            with histogram.lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                lines.append(f'crawler_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"crawler_stage_seconds_sum{{{labels}}} {total}")
+            lines.append(f"crawler_stage_seconds_count{{{labels}}} {count}")
+        lines.append("# TYPE crawler_events_total counter")
+        with self.lock:
+            counters = sorted(self.counters.items())
+        for name, value in counters:
+            lines.append(f'crawler_events_total{{event="{name}"}} {value}')
+        lines.append("# TYPE crawler_lock_acquisitions_total counter")
+        for lock in self.locks:
+            lines.append(
+                f'crawler_lock_acquisitions_total{{lock="{lock.name}",contended="false"}} '
+                f"{lock.acquisitions - lock.contended}")
+            lines.append(
+                f'crawler_lock_acquisitions_total{{lock="{lock.name}",contended="true"}} '
+                f"{lock.contended}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        parts = list()
+        for name, histogram in self._histograms():
+            if histogram.count:
+                parts.append(
+                    f"{name} n={histogram.count} "
+                    f"mean={histogram.sum / histogram.count * 1000:.2f}ms "
+                    f"p50<={histogram.quantile(0.5) * 1000:.2f}ms "
+                    f"p99<={histogram.quantile(0.99) * 1000:.2f}ms")
+        for lock in self.locks:
+            if lock.acquisitions:
+                parts.append(
+                    f"lock {lock.name} contended "
+                    f"{lock.contended / lock.acquisitions:.1%} of {lock.acquisitions}")
+        with self.lock:
+            parts.extend(f"{name}={value}" for name, value in sorted(self.counters.items()))
+        return "; ".join(parts)
+
+    def _log_periodically(self, interval, logger):
+        while True:
+            time.sleep(interval)
+            logger.info(f"Metrics: {self.summary()}")
+
+
+def _handler(metrics):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+# Shared by the whole process.
+metrics = Metrics()
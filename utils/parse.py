@@ -0,0 +1,121 @@
+from lxml import etree
+
+# Tags whose contents are not visible text.
+SKIPPED_TAGS = {"script", "style", "template"}
+
+
+class PageTarget(object):
+    ''' lxml parser target that collects visible text and <a href> values as
+    the parser streams events, so no document tree is ever built. '''
+    def __init__(self):
+        self.strings = list()
+        self.links = list()
+        self.pending = list()
+        self.skip_depth = 0
+
+    def _flush_text(self):
+        if self.pending:
+            text = "".join(self.pending).strip()
+            if text:
+                self.strings.append(text)
+            self.pending = list()
+
+    def start(self, tag, attrib):
+        self._flush_text()
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag == "a":
+            href = attrib.get("href")
+            if href:
+                self.links.append(href)
+
+    def end(self, tag):
+        self._flush_text()
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.pending.append(data)
+
+    def comment(self, text):
+        # Ends a text node like a tag does, b<!-- x -->c is "b c".
+        self._flush_text()
+
+    def pi(self, target, data=None):
+        self._flush_text()
+
+    def close(self):
+        self._flush_text()
+        return " ".join(self.strings), self.links
+
+
+def parse_page(content):
+    ''' Single pass over an HTML document (bytes or str). Returns its visible
+    text, with text nodes stripped and joined by single spaces, and the raw
+    href of every <a> tag in document order. '''
+    target = PageTarget()
+    if not content:
+        return target.close()
+    if isinstance(content, bytes):
+        # libxml2 assumes latin-1 for undeclared encodings; most pages are utf-8.
+        try:
+            content = content.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    parser = etree.HTMLParser(target=target)
+    try:
+        parser.feed(content)
+        return parser.close()
+    except etree.LxmlError:
+        # Whatever was streamed before the parser gave up is still usable.
+        return target.close()
+
+
+class SitemapTarget(object):
+    ''' lxml parser target that collects the <loc> and <lastmod> of every
+    <url> and the <loc> of every <sitemap> of a sitemap or sitemap index. '''
+    def __init__(self):
+        self.urls = list()
+        self.sitemaps = list()
+        self.fields = dict()
+        self.pending = list()
+
+    def start(self, tag, attrib):
+        self.pending = list()
+
+    def end(self, tag):
+        # Tags are namespaced, e.g. {http://www.sitemaps.org/...}loc.
+        name = tag.rpartition("}")[2]
+        if name in ("loc", "lastmod"):
+            self.fields[name] = "".join(self.pending).strip()
+        elif name in ("url", "sitemap"):
+            loc = self.fields.get("loc")
+            if loc and name == "url":
+                self.urls.append((loc, self.fields.get("lastmod", "")))
+            elif loc:
+                self.sitemaps.append(loc)
+            self.fields = dict()
+        self.pending = list()
+
+    def data(self, data):
+        self.pending.append(data)
+
+    def close(self):
+        return self.urls, self.sitemaps
+
+
+def parse_sitemap(content):
+    ''' Single pass over a sitemap (bytes). Returns the (url, lastmod) pairs
+    it lists, lastmod being "" when missing, and the urls of the sitemaps a
+    sitemap index lists. Entities are not resolved and nothing is fetched. '''
+    target = SitemapTarget()
+    if not content:
+        return target.close()
+    parser = etree.XMLParser(
+        target=target, resolve_entities=False, no_network=True, recover=True)
+    try:
+        parser.feed(content)
+        return parser.close()
+    except etree.LxmlError:
+        return target.close()
@@ -0,0 +1,186 @@
+import os
+import json
+import heapq
+import shutil
+import zlib
+import tempfile
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.stats import subdomain_of, record_url
+
+# Words counted by one reduce task before they are written out to disk.
+SPILL_WORDS = 1000000
+
+
+def split_chunks(paths, chunk_size):
+    ''' Yields (path, start, end) byte ranges covering every file in paths.
+    A chunk owns the lines that start inside it. '''
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_size):
+            yield path, start, min(start + chunk_size, size)
+
+
+def _chunk_lines(path, start, end):
+    with open(path, "rb") as f:
+        if start:
+            # Skip the rest of a line that started in the previous chunk.
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                # End of file, or a line torn by a crash.
+                break
+            yield line
+
+
+def _partition(key, partitions):
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+def _split_pages(task):
+    ''' Map: routes the page records of one chunk to their url partition. '''
+    chunk_id, (path, start, end), work_dir, partitions = task
+    outputs = dict()
+    invalid = 0
+    try:
+        for line in _chunk_lines(path, start, end):
+            try:
+                url = json.loads(line)["url"]
+            except (ValueError, KeyError, TypeError):
+                invalid += 1
+                continue
+            p = _partition(url, partitions)
+            if p not in outputs:
+                outputs[p] = open(
+                    os.path.join(work_dir, f"pages.{p}.{chunk_id:08d}"), "wb")
+            outputs[p].write(line)
+    finally:
+        for output in outputs.values():
+            output.close()
+    return invalid
+
+
+def _spill_words(words, work_dir, partition, partitions):
+    by_partition = dict()
+    for word, count in words.items():
+        by_partition.setdefault(_partition(word, partitions), list()).append(
+            f"{word}\t{count}\n")
+    for q, lines in by_partition.items():
+        with open(os.path.join(work_dir, f"words.{q}.{partition}"), "a",
+                  encoding="utf-8") as output:
+            output.write("".join(lines))
+    words.clear()
+
+
+def _count_pages(task):
+    ''' Reduce the pages of one url partition, keeping the last record of
+    every url (a recrawl appends the pages it downloads again), and route
+    their word counts to the word partitions. '''
+    partition, work_dir, partitions = task
+    prefix = f"pages.{partition}."
+    names = sorted(name for name in os.listdir(work_dir) if name.startswith(prefix))
+    # First pass: where the last record of every url is.
+    last = dict()
+    position = 0
+    for name in names:
+        with open(os.path.join(work_dir, name), "rb") as f:
+            for line in f:
+                last[record_url(line)] = position
+                position += 1
+    words = Counter()
+    subdomains = Counter()
+    longest = ("", 0)
+    duplicates = position - len(last)
+    position = 0
+    for name in names:
+        with open(os.path.join(work_dir, name), "rb") as f:
+            for line in f:
+                url = record_url(line)
+                position += 1
+                if last[url] != position - 1:
+                    continue
+                page = json.loads(line)
+                words.update(page["frequencies"])
+                subdomain = subdomain_of(url)
+                if subdomain:
+                    subdomains[subdomain] += 1
+                if page["words"] > longest[1]:
+                    longest = (url, page["words"])
+                if len(words) >= SPILL_WORDS:
+                    _spill_words(words, work_dir, partition, partitions)
+    _spill_words(words, work_dir, partition, partitions)
+    return len(last), duplicates, subdomains, longest
+
+
+def _top_words(task):
+    ''' Reduce the counts of one word partition to its top k words. '''
+    partition, work_dir, top = task
+    prefix = f"words.{partition}."
+    words = Counter()
+    for name in os.listdir(work_dir):
+        if not name.startswith(prefix):
+            continue
+        with open(os.path.join(work_dir, name), encoding="utf-8") as f:
+            for line in f:
+                word, count = line.rstrip("\n").split("\t")
+                words[word] += int(count)
+    return _most_common(words.items(), top)
+
+
+def _most_common(items, top):
+    # Same order as utils.stats.TopK.most_common.
+    return heapq.nsmallest(top, items, key=lambda item: (-item[1], item[0]))
+
+
+def build_report(paths, processes=1, memory=256 * 1024 * 1024,
+                 chunk_size=64 * 1024 * 1024, top=50, work_dir=None):
+    ''' Computes the crawl report from page logs (see utils.stats.CrawlStats)
+    of any number of runs or shards, counting the last record of every url.
+
+    The logs are streamed in chunks and shuffled through temporary files
+    partitioned by url and then by word, so each process only holds about
+    `memory` bytes of pages at a time. Chunks and partitions are processed by
+    `processes` processes. '''
+    total_size = sum(os.path.getsize(path) for path in paths)
+    partitions = max(processes, -(-total_size // memory), 1)
+    work_dir = tempfile.mkdtemp(prefix="report.", dir=work_dir)
+    pool = ProcessPoolExecutor(processes) if processes > 1 else None
+    run = pool.map if pool else map
+    try:
+        invalid = sum(run(_split_pages, [
+            (chunk_id, chunk, work_dir, partitions)
+            for chunk_id, chunk in enumerate(split_chunks(paths, chunk_size))]))
+
+        unique_pages = duplicates = 0
+        subdomains = Counter()
+        longest = ("", 0)
+        for count, dups, sub, long in run(_count_pages, [
+                (p, work_dir, partitions) for p in range(partitions)]):
+            unique_pages += count
+            duplicates += dups
+            subdomains.update(sub)
+            if long[1] > longest[1] or (long[1] == longest[1] and long[0] < longest[0]):
+                longest = long
+
+        top_words = _most_common(
+            (item for partition_top in run(_top_words, [
+                (p, work_dir, top) for p in range(partitions)])
+             for item in partition_top),
+            top)
+    finally:
+        if pool:
+            pool.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "unique_pages": unique_pages,
+        "most_word_in_page": {"url": longest[0], "word_count": longest[1]},
+        f"top_{top}_words": top_words,
+        "subdomains": dict(sorted(subdomains.items())),
+        "duplicate_records": duplicates,
+        "invalid_records": invalid,
+    }
@@ -1,14 +1,27 @@
 import pickle
 
+from utils.metrics import metrics
+
 class Response(object):
-    def __init__(self, resp_dict):
+    ''' A page as returned by the cache server. raw_response, the
+    requests.Response of the page, is only unpickled when it is first used,
+    so pages rejected on their status never are, and the pickled copy is
+    released as soon as it is. Pages that were never pickled, e.g. replayed
+    from an archive, are passed as raw_response. '''
+    def __init__(self, resp_dict, raw_response=None):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict.get("response")
+        self._raw_response = raw_response
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            pickled, self._pickled = self._pickled, None
+            try:
+                with metrics.timer("unpickle"):
+                    self._raw_response = pickle.loads(pickled)
+            except (TypeError, EOFError, pickle.UnpicklingError):
+                self._raw_response = None
+        return self._raw_response
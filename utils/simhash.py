@@ -0,0 +1,157 @@
+import os
+import hashlib
+
+from array import array
+from threading import Lock
+from collections import Counter
+from collections.abc import Mapping
+
+try:
+    import numpy as np
+except ImportError:
+    # Fingerprints are identical without numpy, only slower to compute.
+    np = None
+
+
+def simhash(tokens):
+    ''' Returns the 64 bit SimHash fingerprint of tokens, either an iterable
+    of tokens or a mapping of token -> count.
+
+    Every token votes once per occurrence on each bit i of the fingerprint:
+    +1 if bit i of h(token) is set and -1 otherwise, where h(token) is the
+    last 8 bytes of md5(token.encode("utf-8")) read as a big-endian integer.
+    Bit i of the fingerprint is set when the sum of its votes is positive.
+    Each distinct token is hashed once and its votes weighted by its count. '''
+    counts = tokens if isinstance(tokens, Mapping) else Counter(tokens)
+    if not counts:
+        return 0
+    hashes = [
+        int.from_bytes(hashlib.md5(token.encode('utf-8')).digest()[8:], 'big')
+        for token in counts]
+    if np is not None:
+        weights = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        bits = np.unpackbits(
+            np.array(hashes, dtype='<u8').view(np.uint8).reshape(-1, 8),
+            axis=1, bitorder='little')
+        # Per bit, (votes for) - (votes against) > 0 <=> 2 * (votes for) > total.
+        set_bits = 2 * (weights @ bits) > weights.sum()
+        return int(np.packbits(set_bits, bitorder='little').view('<u8')[0])
+    total = sum(counts.values())
+    votes = [0] * 64
+    for h, weight in zip(hashes, counts.values()):
+        for i in range(64):
+            if h >> i & 1:
+                votes[i] += weight
+    fingerprint = 0
+    for i in range(64):
+        if 2 * votes[i] > total:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+def hamming_distance(x, y):
+    return bin(x ^ y).count('1')
+
+
+class SimhashIndex(object):
+    ''' Near-duplicate lookup for 64 bit fingerprints.
+
+    The fingerprint is cut into `blocks` bit blocks and every block gets its
+    own table keyed by the exact value of that block. Two fingerprints that
+    differ in at most k < blocks bits agree on at least one whole block, so a
+    query only has to compare against the fingerprints sharing one of its
+    block values instead of against every fingerprint seen.
+
+    Fingerprints are kept unboxed in one array. A table maps a block value to
+    the position of the last fingerprint with that value, and the chain of
+    earlier ones goes through a per-block array of previous positions, so
+    the index takes 8 bytes per fingerprint plus 4 per block, and the tables
+    at most one entry per block value.
+
+    Every method takes the index's lock, so it can be shared by worker
+    threads; add_if_new checks and adds at once, so that two threads with
+    near duplicate pages cannot both see theirs as new. '''
+    def __init__(self, blocks=4, hashbits=64):
+        self.blocks = blocks
+        widths = [hashbits // blocks + (i < hashbits % blocks) for i in range(blocks)]
+        self.ranges = list()
+        shift = 0
+        for width in widths:
+            self.ranges.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [dict() for _ in range(blocks)]
+        self.chains = [array('i') for _ in range(blocks)]
+        self.fingerprints = array('Q')
+        self.saved_count = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def add(self, fingerprint):
+        with self.lock:
+            self._add(fingerprint)
+
+    def _add(self, fingerprint):
+        # Must be called with self.lock held.
+        position = len(self.fingerprints)
+        for table, chain, (shift, mask) in zip(self.tables, self.chains, self.ranges):
+            key = (fingerprint >> shift) & mask
+            chain.append(table.get(key, -1))
+            table[key] = position
+        self.fingerprints.append(fingerprint)
+
+    def query_within(self, fingerprint, k):
+        ''' Returns an indexed fingerprint at most k bits away from
+        fingerprint, or None if there is no such fingerprint. '''
+        with self.lock:
+            return self._query_within(fingerprint, k)
+
+    def add_if_new(self, fingerprint, k):
+        ''' Adds fingerprint unless an indexed fingerprint is at most k bits
+        away from it. Returns that fingerprint, or None if it was added. '''
+        with self.lock:
+            near = self._query_within(fingerprint, k)
+            if near is None:
+                self._add(fingerprint)
+            return near
+
+    def _query_within(self, fingerprint, k):
+        # Must be called with self.lock held.
+        if k >= self.blocks:
+            raise ValueError(
+                f"An index with {self.blocks} blocks can only answer "
+                f"queries for k < {self.blocks}.")
+        fingerprints = self.fingerprints
+        for table, chain, (shift, mask) in zip(self.tables, self.chains, self.ranges):
+            position = table.get((fingerprint >> shift) & mask, -1)
+            while position >= 0:
+                candidate = fingerprints[position]
+                if hamming_distance(fingerprint, candidate) <= k:
+                    return candidate
+                position = chain[position]
+        return None
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        fingerprints = array('Q')
+        with open(path, "r+b") as f:
+            data = f.read()
+            # Drop a partially written fingerprint left by a crash.
+            size = len(data) - len(data) % fingerprints.itemsize
+            f.truncate(size)
+        fingerprints.frombytes(data[:size])
+        with self.lock:
+            for fingerprint in fingerprints:
+                self._add(fingerprint)
+            self.saved_count = len(self.fingerprints)
+
+    def save(self, path):
+        ''' Appends the fingerprints added since the last save or load. '''
+        with self.lock:
+            if self.saved_count == len(self.fingerprints):
+                return
+            with open(path, "ab") as f:
+                self.fingerprints[self.saved_count:].tofile(f)
+            self.saved_count = len(self.fingerprints)
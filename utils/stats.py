@@ -0,0 +1,417 @@
+import os
+import json
+import time
+
+from collections import Counter
+from json.decoder import scanstring
+from threading import Lock, local
+from urllib.parse import urlparse
+
+from utils import line_log
+from utils.line_log import read_records, truncate_torn_tail
+
+
+def subdomain_of(url):
+    ''' The ics.uci.edu subdomain a page is counted under, or None. '''
+    domain = urlparse(url).netloc
+    return domain if domain.endswith(".ics.uci.edu") else None
+
+
+def page_record(url, word_count, frequencies):
+    ''' One line of the page log, see CrawlStats. '''
+    return json.dumps(
+        {"url": url, "words": word_count, "frequencies": frequencies},
+        ensure_ascii=False) + "\n"
+
+
+def record_url(line):
+    ''' The url of a page log line, without decoding the rest of it. '''
+    # Lines start with {"url": " (see page_record).
+    return scanstring(line.decode("utf-8"), 9)[0]
+
+
+class TopK(object):
+    ''' Exact k largest counts of a counter whose counts only grow, ties
+    broken alphabetically as in most_common.
+
+    A word outside the top k can only enter it by overtaking the current
+    minimum, so every update is O(1) except when the minimum changes, which
+    costs O(k). No sort over all words is ever needed. '''
+    def __init__(self, k):
+        self.k = k
+        self.top = dict()
+        self.min_word = None
+
+    def _minimum(self):
+        # The last word of most_common.
+        if self.min_word is None:
+            self.min_word = max(self.top, key=lambda word: (-self.top[word], word))
+        return self.min_word
+
+    def update(self, word, count):
+        top = self.top
+        if word in top:
+            top[word] = count
+            if word == self.min_word:
+                self.min_word = None
+        elif len(top) < self.k:
+            top[word] = count
+            self.min_word = None
+        else:
+            minimum = self._minimum()
+            if (-count, word) < (-top[minimum], minimum):
+                del top[minimum]
+                top[word] = count
+                self.min_word = None
+
+    def most_common(self):
+        return sorted(self.top.items(), key=lambda item: (-item[1], item[0]))
+
+
+class _Delta(object):
+    ''' Stats of the pages recorded since the last merge. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        self.words = Counter()
+        self.subdomains = Counter()
+        self.pages = dict()
+        self.longest = ("", 0)
+        self.page_lines = list()
+        # When the first page of the delta was recorded.
+        self.since = None
+
+    def add_page(self, url, frequencies, word_count, subdomain, log_page,
+                 previous=None):
+        # previous: the frequencies of an earlier download of url, replaced
+        # by this one.
+        if log_page:
+            self.page_lines.append(
+                (url, page_record(url, word_count, frequencies)))
+        self.words.update(frequencies)
+        if previous is not None:
+            self.words.subtract(previous)
+        if subdomain:
+            self.subdomains[subdomain] += 1
+        self.pages[url] = word_count
+        if word_count > self.longest[1]:
+            self.longest = (url, word_count)
+        if self.since is None:
+            self.since = time.monotonic()
+
+    def to_record(self):
+        return {
+            "words": self.words,
+            "subdomains": self.subdomains,
+            "pages": self.pages,
+            "longest": list(self.longest),
+        }
+
+
+class CrawlStats(object):
+    ''' Word, subdomain and page stats shared by all workers.
+
+    Each thread records pages into its own delta and merges it into the
+    shared stats every merge_every pages, so workers only contend for the
+    shared lock once per batch. With a merge_interval, deltas (of any
+    thread, a thread may stop recording pages) are also merged once their
+    first page is that many seconds old, so a killed crawl only loses the
+    pages recorded in its last merge_interval seconds. Every merge appends
+    the delta as one JSON line to log_path. After compact_every deltas the
+    log is rewritten as a single snapshot, so saving costs what changed and
+    loading replays a bounded number of lines.
+
+    With a page_log_path every page is also appended to that file as a
+    {"url", "words", "frequencies"} line, which is never compacted and is
+    the input of utils.report. A page downloaded again (update_page) is
+    appended again and its last line is the one that counts; its previous
+    frequencies are read back from the log, whose offsets are indexed by
+    url the first time a page is updated. '''
+    def __init__(self, log_path, merge_every=100, compact_every=1000, top_k=50,
+                 page_log_path=None, merge_interval=None):
+        self.log_path = log_path
+        self.page_log_path = page_log_path
+        self.merge_every = merge_every
+        self.merge_interval = merge_interval
+        # When the oldest delta is due for a merge, as of the last check.
+        self.next_stale_merge = 0
+        self.compact_every = compact_every
+        self.lock = Lock()
+        self.local = local()
+        self.deltas = list()
+        self.top_k = top_k
+        self._reset()
+
+    def _reset(self):
+        self.words = Counter()
+        self.top_words = TopK(self.top_k)
+        self.subdomains = Counter()
+        self.pages = dict()
+        self.longest = ("", 0)
+        self.logged_deltas = 0
+        # Set when a top word's count went down: TopK only handles growing
+        # counts, so the top words are then recounted by summary.
+        self.top_stale = False
+        # url -> offset of its last line in the page log, built on demand.
+        self.page_offsets = None
+
+    def _delta(self):
+        delta = getattr(self.local, "delta", None)
+        if delta is None:
+            delta = self.local.delta = _Delta()
+            with self.lock:
+                self.deltas.append(delta)
+        return delta
+
+    def add_page(self, url, frequencies, word_count, subdomain=None):
+        ''' Records a page. Returns True when this call merged and logged the
+        thread's delta. '''
+        delta = self._delta()
+        with delta.lock:
+            delta.add_page(url, frequencies, word_count, subdomain,
+                           self.page_log_path is not None)
+            full = len(delta.pages) >= self.merge_every
+        if full:
+            self._merge_delta(delta)
+        return self._merge_stale() or full
+
+    def has_page(self, url):
+        ''' Whether url was recorded and merged, by this run or an earlier
+        one. '''
+        with self.lock:
+            return url in self.pages
+
+    def update_page(self, url, frequencies, word_count):
+        ''' Records a new download of a page that has_page, replacing its
+        words and word count. Returns True when this call merged and logged
+        the thread's delta. '''
+        previous = self._logged_frequencies(url)
+        delta = self._delta()
+        with delta.lock:
+            delta.add_page(url, frequencies, word_count, None,
+                           self.page_log_path is not None, previous)
+            full = len(delta.pages) >= self.merge_every
+        if full:
+            self._merge_delta(delta)
+        return self._merge_stale() or full
+
+    def _merge_stale(self):
+        # Merges the deltas whose first page is merge_interval seconds old.
+        # The deltas are only looked at once the oldest one is due. Returns
+        # whether one was merged.
+        if self.merge_interval is None:
+            return False
+        now = time.monotonic()
+        if now < self.next_stale_merge:
+            return False
+        with self.lock:
+            deltas = list(self.deltas)
+        merged = False
+        next_stale_merge = now + self.merge_interval
+        for delta in deltas:
+            since = delta.since
+            if since is None:
+                continue
+            if now - since >= self.merge_interval:
+                self._merge_delta(delta)
+                merged = True
+            else:
+                next_stale_merge = min(next_stale_merge, since + self.merge_interval)
+        self.next_stale_merge = next_stale_merge
+        return merged
+
+    def _logged_frequencies(self, url):
+        # The frequencies of url's last line in the page log, or None.
+        with self.lock:
+            if self.page_log_path is None or not os.path.exists(self.page_log_path):
+                return None
+            if self.page_offsets is None:
+                self.page_offsets = dict()
+                offset = 0
+                with open(self.page_log_path, "rb") as log:
+                    for line in log:
+                        self.page_offsets[record_url(line)] = offset
+                        offset += len(line)
+            offset = self.page_offsets.get(url)
+            if offset is None:
+                return None
+            with open(self.page_log_path, "rb") as log:
+                log.seek(offset)
+                return json.loads(log.readline())["frequencies"]
+
+    def _apply(self, record):
+        # Must be called with self.lock held.
+        words = self.words
+        top_words = self.top_words
+        for word, count in record["words"].items():
+            if count > 0:
+                words[word] += count
+                top_words.update(word, words[word])
+            elif count < 0:
+                # A page downloaded again lost some words.
+                if words[word] + count > 0:
+                    words[word] += count
+                else:
+                    words.pop(word, None)
+                if word in top_words.top:
+                    self.top_stale = True
+        self.subdomains.update(record["subdomains"])
+        pages = record["pages"]
+        longest_url, longest_count = self.longest
+        shrunk = pages.get(longest_url, longest_count) < longest_count
+        self.pages.update(pages)
+        if shrunk:
+            self.longest = max(
+                self.pages.items(), key=lambda item: item[1], default=("", 0))
+        url, word_count = record["longest"]
+        if word_count > self.longest[1]:
+            self.longest = (url, word_count)
+
+    def _top_words(self):
+        # Must be called with self.lock held.
+        if self.top_stale:
+            self.top_words = TopK(self.top_k)
+            for word, count in self.words.items():
+                self.top_words.update(word, count)
+            self.top_stale = False
+        return self.top_words.most_common()
+
+    def _merge_delta(self, delta):
+        # Holding self.lock throughout, so that a concurrent flush never sees
+        # a delta that left its thread but is not applied yet.
+        with self.lock:
+            with delta.lock:
+                if not delta.pages:
+                    return
+                record = delta.to_record()
+                page_lines = delta.page_lines
+                delta.clear()
+            self._apply(record)
+            self._append(record)
+            if page_lines:
+                with open(self.page_log_path, "ab") as log:
+                    offset = log.tell()
+                    lines = list()
+                    for url, line in page_lines:
+                        line = line.encode("utf-8")
+                        if self.page_offsets is not None:
+                            self.page_offsets[url] = offset
+                        offset += len(line)
+                        lines.append(line)
+                    log.write(b"".join(lines))
+
+    def _append(self, record):
+        # Must be called with self.lock held.
+        with open(self.log_path, "a", encoding="utf-8") as log:
+            log.write(json.dumps(record) + "\n")
+        self.logged_deltas += 1
+        if self.logged_deltas >= self.compact_every:
+            self._compact()
+
+    def flush(self):
+        ''' Merges (and logs) the pending deltas of every thread. '''
+        with self.lock:
+            deltas = list(self.deltas)
+        for delta in deltas:
+            self._merge_delta(delta)
+
+    def _compact(self):
+        # Must be called with self.lock held.
+        snapshot = {
+            "words": self.words,
+            "subdomains": self.subdomains,
+            "pages": self.pages,
+            "longest": list(self.longest),
+        }
+        tmp_path = f"{self.log_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as log:
+            log.write(json.dumps(snapshot) + "\n")
+        os.replace(tmp_path, self.log_path)
+        self.logged_deltas = 1
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def load(self):
+        ''' Replays log_path (see utils.line_log.replay). Returns whether a
+        log was found. '''
+        if not os.path.exists(self.log_path):
+            return False
+        with self.lock:
+            line_log.replay(self.log_path, self._load_line)
+            if self.page_log_path:
+                truncate_torn_tail(self.page_log_path)
+        return True
+
+    def _load_line(self, line):
+        # Must be called with self.lock held.
+        self._apply(json.loads(line))
+        self.logged_deltas += 1
+
+    def load_pages(self, path):
+        ''' Rebuilds the stats from a page log, counting the last line of
+        every url. Returns whether a page log was found. '''
+        if not os.path.exists(path):
+            return False
+        truncate_torn_tail(path)
+        last = dict()
+        with open(path, "rb") as log:
+            for position, line in enumerate(log):
+                last[record_url(line)] = position
+        with self.lock:
+            for position, page in enumerate(read_records(path)):
+                url, word_count = page["url"], page["words"]
+                if last[url] != position:
+                    continue
+                subdomain = subdomain_of(url)
+                self._apply({
+                    "words": page["frequencies"],
+                    "subdomains": {subdomain: 1} if subdomain else {},
+                    "pages": {url: word_count},
+                    "longest": [url, word_count],
+                })
+        return True
+
+    def clear(self):
+        self.flush()
+        with self.lock:
+            self._reset()
+
+    def discard(self):
+        ''' Clears the stats and deletes their log files. '''
+        self.clear()
+        with self.lock:
+            for path in (self.log_path, self.page_log_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    def merge(self, snapshot):
+        ''' Adds a snapshot() of another CrawlStats, without logging it. '''
+        with self.lock:
+            self._apply(snapshot)
+
+    def snapshot(self):
+        self.flush()
+        with self.lock:
+            return {
+                "words": Counter(self.words),
+                "subdomains": Counter(self.subdomains),
+                "pages": dict(self.pages),
+                "longest": list(self.longest),
+            }
+
+    def summary(self):
+        self.flush()
+        with self.lock:
+            return {
+                "unique_pages": len(self.pages),
+                "most_word_in_page": {
+                    "url": self.longest[0],
+                    "word_count": self.longest[1]
+                },
+                "top_50_words": self._top_words(),
+                "subdomains": dict(sorted(self.subdomains.items())),
+            }
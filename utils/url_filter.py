@@ -0,0 +1,125 @@
+import re
+import hashlib
+
+from functools import lru_cache
+from urllib.parse import urlparse
+
+# Parts of a url a rule pattern can be matched against.
+FIELDS = ("query", "url", "path")
+
+BUILTIN_REASONS = {
+    "malformed-url": "Malformed URL",
+    "scheme": "Invalid Scheme",
+    "domain": "Out of permitted domain",
+}
+
+
+class UrlFilter(object):
+    ''' Compiled form of a declarative set of url rules.
+
+    allowed_domains: a url must be on one of these domains or a subdomain of
+        them, or on a domain of allowed_paths under the given path prefix.
+    rules: (rule id, field, pattern, reason) tuples. pattern is a regex
+        searched in the given field of the url, or a predicate taking that
+        field. All regexes of a field are combined into one, so each field is
+        scanned once no matter how many rules there are.
+    blocked_extensions: file extensions (case insensitive) of the path that
+        are rejected as rule "blocked-extension".
+
+    check(url) returns the id of a rule rejecting url, or None when the url
+    is allowed. Recent verdicts are kept in an LRU cache. reasons maps every
+    rule id to its human readable reason. version is a digest of the rules,
+    different whenever they change. '''
+    def __init__(self, allowed_schemes, allowed_domains, allowed_paths,
+                 rules, blocked_extensions, cache_size=1 << 16):
+        self.allowed_schemes = frozenset(allowed_schemes)
+        self.allowed_paths = dict(allowed_paths)
+        self.domain_pattern = re.compile(
+            r"(?:.*\.)?(?:" + "|".join(map(re.escape, allowed_domains)) + ")")
+
+        rules = list(rules) + [(
+            "blocked-extension", "path",
+            r"(?i:\.(?:" + "|".join(map(re.escape, blocked_extensions)) + r"))$",
+            "Blocked file extension")]
+        self.reasons = dict(BUILTIN_REASONS)
+        self.rule_ids = list()
+        self.patterns = dict()
+        self.predicates = list()
+        alternatives = {field: list() for field in FIELDS}
+        for rule_id, field, pattern, reason in rules:
+            self.reasons[rule_id] = reason
+            if field not in alternatives:
+                raise ValueError(f"Rule {rule_id} uses unknown field {field!r}.")
+            if callable(pattern):
+                self.predicates.append((rule_id, field, pattern))
+            else:
+                group = f"r{len(self.rule_ids)}"
+                alternatives[field].append(f"(?P<{group}>{pattern})")
+            self.rule_ids.append(rule_id)
+        for field, patterns in alternatives.items():
+            if patterns:
+                self.patterns[field] = re.compile("|".join(patterns))
+
+        self.version = _digest(
+            sorted(allowed_schemes), sorted(allowed_domains),
+            sorted(self.allowed_paths.items()), sorted(blocked_extensions),
+            [(rule_id, field, _describe(pattern)) for rule_id, field, pattern, _ in rules])
+        self.check = lru_cache(maxsize=cache_size)(self._check)
+
+    def _check(self, url):
+        try:
+            parsed = urlparse(url)
+        except ValueError:
+            return "malformed-url"
+        if parsed.scheme not in self.allowed_schemes:
+            return "scheme"
+        domain = parsed.netloc
+        path = parsed.path
+        if not self.domain_pattern.fullmatch(domain):
+            prefix = self.allowed_paths.get(domain)
+            if prefix is None or not path.startswith(prefix):
+                return "domain"
+
+        fields = {"query": parsed.query, "url": url, "path": path}
+        for field, pattern in self.patterns.items():
+            match = pattern.search(fields[field])
+            if match:
+                return self.rule_ids[int(match.lastgroup[1:])]
+        for rule_id, field, predicate in self.predicates:
+            if predicate(fields[field]):
+                return rule_id
+        return None
+
+
+def _describe(pattern):
+    # Predicates are described by their code, their repr has an address.
+    if callable(pattern):
+        code = getattr(pattern, "__code__", None)
+        return (getattr(pattern, "__qualname__", type(pattern).__name__),
+                _describe_code(code) if code else "")
+    return pattern
+
+
+def _describe_code(code):
+    # The bytecode alone leaves out the constants and names it refers to,
+    # so len(path.split("/")) > 10 would not differ from > 99.
+    return (code.co_code.hex(), tuple(map(_describe_const, code.co_consts)),
+            code.co_names)
+
+
+def _describe_const(const):
+    if hasattr(const, "co_code"):
+        return _describe_code(const)
+    if isinstance(const, frozenset):
+        # Set literals, whose order changes with the string hash seed.
+        return sorted(map(repr, const))
+    return const
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def repeated_segments(path):
+    segments = path.strip("/").split("/")
+    return len(segments) != len(set(segments))